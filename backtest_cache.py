@@ -0,0 +1,128 @@
+# backtest_cache.py
+# 回測結果快取：以「股價內容指紋 + 策略名稱 + 參數 + 摩擦成本設定」的雜湊為 key，
+# 相同輸入直接取回 apply_strategy + apply_friction_and_risk 的結果，不必重算。
+#
+# 兩層快取：
+#   1. 行程內 LRU（OrderedDict），同一個 Streamlit 行程內重跑直接命中
+#   2. SQLite backtest_cache 表（database.py），跨行程 / 重開 app 後仍可命中，
+#      依 last_used 做 LRU 淘汰，總大小不超過 MAX_DISK_BYTES
+# 股價內容改變（新增交易日、資料修正）指紋就不同，舊結果自然不會被取用。
+
+import hashlib
+import json
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+
+import pandas as pd
+
+from database import load_cached_backtest, save_cached_backtest, clear_backtest_cache
+from risk import apply_friction_and_risk
+from strategy import apply_strategy
+
+# 策略或成本計算邏輯變更時調高版本，讓舊快取全部失效
+CACHE_VERSION = 2    # 2：Supertrend ATR 暖身期不再讓軌道一路沿用 NaN
+
+MAX_MEMORY_ENTRIES = 128
+MAX_MEMORY_BYTES   = 128 * 1024 * 1024    # 128 MB
+MAX_DISK_BYTES     = 256 * 1024 * 1024    # 256 MB
+
+_memory       = OrderedDict()   # key -> (DataFrame, nbytes)
+_memory_bytes = 0
+_memory_lock  = threading.Lock()  # Streamlit 各 session 是同一行程的執行緒，共用這份快取
+stats         = {"hits": 0, "disk_hits": 0, "misses": 0}   # 同樣在 _memory_lock 內累加
+
+
+def price_fingerprint(df: pd.DataFrame) -> str:
+    """股價內容指紋：index + 所有欄位逐列雜湊後再取 sha256"""
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    h = hashlib.sha256(row_hashes.tobytes())
+    h.update(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def cache_key(df: pd.DataFrame, strategy_name: str, params: dict, risk_cfg: dict = None) -> str:
+    payload = json.dumps({
+        "version":  CACHE_VERSION,
+        "prices":   price_fingerprint(df),
+        "strategy": strategy_name,
+        "params":   params,
+        "risk":     risk_cfg or {},
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, df: pd.DataFrame):
+    global _memory_bytes
+    nbytes = int(df.memory_usage(index=True).sum())
+    with _memory_lock:
+        if key in _memory:
+            _memory_bytes -= _memory.pop(key)[1]
+        _memory[key] = (df, nbytes)
+        _memory_bytes += nbytes
+        while _memory and (len(_memory) > MAX_MEMORY_ENTRIES or _memory_bytes > MAX_MEMORY_BYTES):
+            _, (_, old_bytes) = _memory.popitem(last=False)
+            _memory_bytes -= old_bytes
+
+
+def get(key: str):
+    """回傳快取中的結果（副本），未命中回傳 None"""
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+            stats["hits"] += 1
+    if entry is not None:
+        return entry[0].copy()      # 快取中的 DataFrame 不會被修改，複製可在鎖外進行
+    try:
+        payload = load_cached_backtest(key)
+    except Exception:
+        payload = None
+    if payload is None:
+        return None
+    df = pickle.loads(zlib.decompress(payload))
+    _remember(key, df)
+    with _memory_lock:
+        stats["disk_hits"] += 1
+    return df.copy()
+
+
+def put(key: str, df: pd.DataFrame, persist: bool = True):
+    _remember(key, df.copy())
+    if not persist:
+        return
+    payload = zlib.compress(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), 6)
+    try:
+        save_cached_backtest(key, payload, MAX_DISK_BYTES)
+    except Exception:
+        pass   # 快取寫入失敗不影響回測本身
+
+
+def clear(disk: bool = True):
+    global _memory_bytes
+    with _memory_lock:
+        _memory.clear()
+        _memory_bytes = 0
+    if disk:
+        clear_backtest_cache()
+
+
+def run_backtest_cached(df: pd.DataFrame, strategy_name: str, params: dict,
+                        risk_cfg: dict = None, persist: bool = True) -> pd.DataFrame:
+    """
+    回傳 apply_strategy（再套用 apply_friction_and_risk，若有 risk_cfg）後的 df，
+    與直接呼叫結果相同；策略失敗時照樣拋出例外，不會寫入快取。
+    """
+    key = cache_key(df, strategy_name, params, risk_cfg)
+    cached = get(key)
+    if cached is not None:
+        return cached
+
+    with _memory_lock:
+        stats["misses"] += 1
+    df_s = apply_strategy(df.copy(), strategy_name, params)
+    if risk_cfg:
+        df_s = apply_friction_and_risk(df_s, **risk_cfg)
+    put(key, df_s, persist=persist)
+    return df_s
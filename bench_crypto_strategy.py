@@ -0,0 +1,74 @@
+# bench_crypto_strategy.py
+# 虛擬幣專屬策略效能量測（獨立執行：python bench_crypto_strategy.py）
+# 以小時線比較 rolling.apply 版與累加和版的 WMA / Hull 移動平均、整個 SMA/Hull 策略，
+# 以及 .iloc 迴圈版與單趟 kernel 版的 Supertrend
+import time
+
+import numpy as np
+import pandas as pd
+
+import crypto_strategy
+from crypto_strategy import hull_moving_average, supertrend, supertrend_kernel, wma
+from reference_impl import lambda_hull, lambda_wma, supertrend_basic_bands, supertrend_loop
+from strategy import strategy_positions
+
+
+def make_hourly_prices(years: int = 2, seed: int = 0) -> pd.DataFrame:
+    n     = years * 365 * 24
+    rng   = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-01", periods=n, freq="h", name="Date")
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.006, n)))
+    return pd.DataFrame({"Open": close, "High": close * 1.004, "Low": close * 0.996,
+                         "Close": close, "Volume": rng.integers(1, 100, n)}, index=dates)
+
+
+def _timed(fn, *args):
+    t0  = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, out
+
+
+def bench_wma(years: int = 2):
+    close = make_hourly_prices(years)["Close"]
+    print(f"=== WMA / Hull：{len(close):,} 根小時線 ===")
+    for label, fast, slow, n in [("WMA(140)", wma, lambda_wma, 140),
+                                 ("Hull(20)", hull_moving_average, lambda_hull, 20),
+                                 ("Hull(140)", hull_moving_average, lambda_hull, 140)]:
+        slow_sec, ref = _timed(slow, close, n)
+        fast_sec, out = _timed(fast, close, n)
+        err = np.nanmax(np.abs(out - ref) / ref.abs())
+        print(f"{label:<10} rolling.apply {slow_sec:7.3f} s   累加和 {fast_sec:7.4f} s   "
+              f"({slow_sec / fast_sec:,.0f}x，最大相對誤差 {err:.1e})")
+
+
+def bench_sma_hull_strategy(years: int = 2, n_combos: int = 20):
+    df     = make_hourly_prices(years)
+    combos = [{"type": "hull", "n1": n1, "n2": n2}
+              for n1, n2 in zip(range(10, 10 + 2 * n_combos, 2), range(100, 100 + 5 * n_combos, 5))]
+    t0 = time.perf_counter()
+    for params in combos:
+        strategy_positions(df, "SMA/Hull 趨勢策略", params)
+    sec = time.perf_counter() - t0
+    print(f"=== SMA/Hull 趨勢策略（hull）：{len(combos)} 組 × {len(df):,} 根 ===")
+    print(f"每組 {sec / len(combos) * 1000:.1f} ms")
+
+
+def bench_supertrend(years: int = 2):
+    df = make_hourly_prices(years)
+    high, low, close = df["High"], df["Low"], df["Close"]
+    print(f"=== Supertrend(10, 3.0)：{len(df):,} 根小時線 ===")
+    loop_sec, _ = _timed(lambda: supertrend_loop(close, *supertrend_basic_bands(df, 10, 3.0)))
+    print(f"{'.iloc 迴圈':<14} {loop_sec:8.3f} s")
+    kernels = [("kernel（Python）", supertrend_kernel)]
+    if crypto_strategy.NUMBA_AVAILABLE:
+        supertrend(high, low, close, 10, 3.0, kernel=crypto_strategy._supertrend_kernel_jit)   # 編譯
+        kernels.append(("kernel（numba）", crypto_strategy._supertrend_kernel_jit))
+    for label, kernel in kernels:
+        sec, _ = _timed(supertrend, high, low, close, 10, 3.0, kernel)
+        print(f"{label:<14} {sec:8.4f} s   ({loop_sec / sec:,.0f}x)")
+
+
+if __name__ == "__main__":
+    bench_wma()
+    bench_sma_hull_strategy()
+    bench_supertrend()
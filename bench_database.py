@@ -0,0 +1,202 @@
+# bench_database.py
+# 資料庫寫入 / 讀取效能量測（獨立執行：python bench_database.py）
+# 全部在暫存 SQLite 檔上進行，不會動到 stock_data.db
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import database
+import parquet_store
+
+
+def _use_temp_db(path: str, profile: str = "default"):
+    """把 database 模組的 lazy engine 指到暫存檔（預設用未調校的連線設定）"""
+    database._engine = database.make_engine(f"sqlite:///{path}", profile)
+
+
+def make_price_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """產生與 yfinance 欄位相同的假日線資料"""
+    rng   = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=n_rows, name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_rows)))
+    return pd.DataFrame({
+        "Open":      close * (1 + rng.normal(0, 0.002, n_rows)),
+        "High":      close * 1.01,
+        "Low":       close * 0.99,
+        "Close":     close,
+        "Adj Close": close,
+        "Volume":    rng.integers(1_000, 1_000_000, n_rows),
+    }, index=dates)
+
+
+def bench_save_stock_prices(n_rows: int = 5000, n_codes: int = 4):
+    df = make_price_frame(n_rows)
+    print(f"=== save_stock_prices：{n_codes} 檔 × {n_rows} 列 ===")
+    for label, bulk in [("逐列 iterrows", False), ("批次 executemany", True)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            _use_temp_db(os.path.join(tmp, "bench.db"))
+            database.init_db()
+            t0 = time.perf_counter()
+            for i in range(n_codes):
+                database.save_stock_prices(df, f"BENCH{i}.TW", bulk=bulk)
+            elapsed = time.perf_counter() - t0
+            database._engine.dispose()
+        rows = n_rows * n_codes
+        print(f"{label:<18} {elapsed:8.3f} s   {rows / elapsed:12,.0f} rows/s")
+
+
+def bench_load_backends(n_codes: int = 100, years: int = 10):
+    """SQLite（Date TEXT、逐列 parse）vs Parquet（memory map + 日期 filter）讀取"""
+    if not parquet_store.PYARROW_AVAILABLE:
+        print("未安裝 pyarrow，略過 Parquet 讀取比較")
+        return
+    df    = make_price_frame(years * 252)
+    codes = [f"BENCH{i}.TW" for i in range(n_codes)]
+    start = df.index[len(df) // 2].date()
+    print(f"=== load_stock_prices：{n_codes} 檔 × {years} 年 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        _use_temp_db(os.path.join(tmp, "bench.db"))
+        parquet_store._STORE_DIR = os.path.join(tmp, "price_store")
+        for backend in ["sqlite", "parquet"]:
+            os.environ["PRICE_STORE_BACKEND"] = backend
+            for code in codes:
+                database.save_stock_prices(df, code)
+            for label, s in [("全期間", None), ("後半段", start)]:
+                t0 = time.perf_counter()
+                rows = sum(len(database.load_stock_prices(code, s)) for code in codes)
+                elapsed = time.perf_counter() - t0
+                print(f"{backend:<8} {label:<6} {elapsed:8.3f} s   {rows / elapsed:12,.0f} rows/s")
+        os.environ.pop("PRICE_STORE_BACKEND", None)
+        database._engine.dispose()
+
+
+def bench_concurrent_access(n_readers: int = 4, seconds: float = 3.0, n_rows: int = 2500):
+    """
+    N 個執行緒反覆讀取、1 個執行緒反覆寫入，比較 default 與 tuned（WAL）連線設定。
+    rollback journal 下寫入期間讀取會被擋住，甚至直接拋出 database is locked。
+    """
+    df    = make_price_frame(n_rows)
+    codes = [f"BENCH{i}.TW" for i in range(n_readers)]
+    print(f"=== 並行存取：{n_readers} 讀 + 1 寫，{seconds:.0f} 秒 ===")
+    for profile in ["default", "tuned"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            _use_temp_db(os.path.join(tmp, "bench.db"), profile)
+            for code in codes + ["WRITER.TW"]:
+                database.save_stock_prices(df, code)
+
+            stop   = threading.Event()
+            counts = {"read": 0, "write": 0, "error": 0}
+            lock   = threading.Lock()
+
+            def _count(key):
+                with lock:
+                    counts[key] += 1
+
+            def reader(code):
+                while not stop.is_set():
+                    try:
+                        database.load_stock_prices(code)
+                        _count("read")
+                    except Exception:
+                        _count("error")
+
+            def writer():
+                i = 0
+                while not stop.is_set():
+                    chunk = df.iloc[i % n_rows:i % n_rows + 250]
+                    try:
+                        database.save_stock_prices(chunk, "WRITER.TW")
+                        _count("write")
+                    except Exception:
+                        _count("error")
+                    i += 250
+
+            threads = [threading.Thread(target=reader, args=(c,)) for c in codes]
+            threads.append(threading.Thread(target=writer))
+            for t in threads:
+                t.start()
+            time.sleep(seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+            database._engine.dispose()
+        print(f"{profile:<8} 讀 {counts['read'] / seconds:8,.1f} 次/s   "
+              f"寫 {counts['write'] / seconds:8,.1f} 次/s   錯誤 {counts['error']}")
+
+
+def _legacy_load(engine, stock_code, start_date=None, end_date=None):
+    """舊版 Date TEXT 資料表的讀取方式（與改版前的 load_stock_prices 相同）"""
+    query  = "SELECT * FROM stock_price WHERE stock_code = :code"
+    params = {"code": stock_code}
+    if start_date:
+        query += " AND Date >= :start_date"
+        params["start_date"] = str(start_date)
+    if end_date:
+        query += " AND Date <= :end_date"
+        params["end_date"] = str(end_date)
+    query += " ORDER BY Date ASC"
+    with engine.connect() as conn:
+        df = pd.read_sql(text(query), conn, params=params, parse_dates=["Date"])
+    return df.set_index("Date")
+
+
+def bench_bundled_db_range_loads(repeat: int = 20, db_path: str = "stock_data.db"):
+    """
+    在 stock_data.db 的複本上比較區間讀取：
+    改版前（Date TEXT、主鍵 (Date, stock_code)）vs 改版後（epoch day、(stock_code, Date) WITHOUT ROWID）
+    """
+    if not os.path.exists(db_path):
+        print(f"找不到 {db_path}，略過")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "stock_data.db")
+        shutil.copy(db_path, copy)
+        _use_temp_db(copy)
+        with database._engine.connect() as conn:
+            cols  = {r[1]: r[2] for r in conn.exec_driver_sql("PRAGMA table_info(stock_price)")}
+            codes = [r[0] for r in conn.exec_driver_sql("SELECT DISTINCT stock_code FROM stock_price")]
+            last  = conn.exec_driver_sql("SELECT MAX(Date) FROM stock_price").scalar()
+        if cols.get("Date", "").upper() == "INTEGER":
+            print(f"{db_path} 已是新格式，無改版前資料可比較")
+            database._engine.dispose()
+            return
+        end   = pd.Timestamp(str(last)[:10])
+        cases = [("全期間", None, None),
+                 ("近一年", (end - pd.DateOffset(years=1)).date(), end.date()),
+                 ("近一季", (end - pd.DateOffset(months=3)).date(), end.date())]
+        print(f"=== stock_data.db 區間讀取：{len(codes)} 檔 × {repeat} 次 ===")
+
+        before = {}
+        for label, s, e in cases:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                rows = sum(len(_legacy_load(database._engine, c, s, e)) for c in codes)
+            before[label] = (time.perf_counter() - t0, rows)
+
+        t0 = time.perf_counter()
+        database.init_db(force=True)            # 觸發 schema 轉換
+        print(f"轉換耗時 {time.perf_counter() - t0:.3f} s")
+
+        for label, s, e in cases:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                rows = sum(len(database.load_stock_prices(c, s, e)) for c in codes)
+            after = time.perf_counter() - t0
+            old, old_rows = before[label]
+            assert rows == old_rows
+            print(f"{label:<4} 改版前 {old:7.3f} s   改版後 {after:7.3f} s   "
+                  f"({old / after:4.1f}x，每次 {rows:,} 列)")
+        database._engine.dispose()
+
+
+if __name__ == "__main__":
+    bench_save_stock_prices()
+    bench_load_backends()
+    bench_concurrent_access()
+    bench_bundled_db_range_loads()
@@ -0,0 +1,117 @@
+# bench_optimizer.py
+# 平行參數最佳化效能量測（獨立執行：python bench_optimizer.py）
+# 同一個網格分別以 1、2、4 … 個 worker 執行，比較耗時與加速倍數；
+# 另比較各搜尋模式在約 1/15 預算下找到的夏普比率與網格最佳值，
+# 以及 10 折 walk-forward 與一次全期間網格掃描的耗時、13 個交易對 × 300 組的跨交易對最佳化耗時，
+# 與提前淘汰（分段回測）省下的 K 棒回測數
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from optimizer import (SEARCH_MODES, grid_values, parallel_grid_search, run_backtest_batch,
+                       search_parameters, walk_forward, cross_symbol_search, pruned_grid_search)
+
+
+def make_price_frame(n_rows: int = 2500, seed: int = 0) -> pd.DataFrame:
+    rng   = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-04", periods=n_rows, name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, n_rows)))
+    return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99,
+                         "Close": close, "Volume": rng.integers(1_000, 1_000_000, n_rows)},
+                        index=dates)
+
+
+def bench_parallel_grid_search(max_workers: int = None):
+    df     = make_price_frame()
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 40) for l in range(20, 120, 4)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003,
+              "stop_loss": 0.08, "trailing_stop": 0.1}
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({1, *[w for w in (2, 4, 8, 16) if w <= max_workers], max_workers})
+    print(f"=== parallel_grid_search：{len(combos)} 組 × {len(df)} 根（含停損，CPU {os.cpu_count()} 核）===")
+    base = None
+    for workers in counts:
+        t0 = time.perf_counter()
+        for _ in parallel_grid_search(df, "簡單均線交叉", combos, cost, workers=workers):
+            pass
+        sec  = time.perf_counter() - t0
+        base = base or sec
+        print(f"workers={workers:<3} {sec:7.2f} s   ({base / sec:.1f}x)")
+
+
+def bench_search_modes(budget_ratio: int = 15, seeds=(0, 1, 2)):
+    space = grid_values({"短期均線": ("int", 3, 60, 1), "長期均線": ("int", 20, 200, 2)})
+    total = len(space["短期均線"]) * len(space["長期均線"])
+    print(f"=== 搜尋模式：{total} 組，預算 {total // budget_ratio} 次 ===")
+    for seed in seeds:
+        df = make_price_frame(seed=seed)
+        evaluate = lambda combos, data: list(run_backtest_batch(data, "簡單均線交叉", combos))
+        for mode, label in SEARCH_MODES.items():
+            t0    = time.perf_counter()
+            found = search_parameters(mode, space, evaluate, df, "夏普比率",
+                                      budget=total // budget_ratio, seed=seed)
+            sec   = time.perf_counter() - t0
+            best  = max(m["夏普比率"] for _, m in found["results"])
+            print(f"seed={seed} {label:<14} 回測 {found['evaluations']:>5} 次  "
+                  f"最佳夏普 {best:6.2f}  {sec:6.2f} s")
+
+
+def bench_walk_forward(n_folds: int = 10, workers: int = 1):
+    df     = make_price_frame()
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 40) for l in range(20, 120, 4)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003, "stop_loss": 0.08}
+    print(f"=== walk_forward：{len(combos)} 組 × {n_folds} 折（workers={workers}）===")
+    for label, cfg in [("無成本", None), ("含成本 + 停損", cost)]:
+        t0   = time.perf_counter()
+        for _ in parallel_grid_search(df, "簡單均線交叉", combos, cfg, workers=workers):
+            pass
+        grid = time.perf_counter() - t0
+        t0   = time.perf_counter()
+        walk_forward(df, "簡單均線交叉", combos, risk_cfg=cfg, n_folds=n_folds, workers=workers)
+        wf   = time.perf_counter() - t0
+        print(f"{label:<12} 全期間網格 {grid:6.2f} s   walk-forward {wf:6.2f} s   ({wf / grid:.1f}x)")
+
+
+def bench_cross_symbol_search(n_symbols: int = 13, workers: int = None):
+    frames = {f"SYM{i}/USDT": make_price_frame(n_rows=1400, seed=i) for i in range(n_symbols)}
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 33) for l in range(20, 120, 10)]
+    cost   = {"buy_fee": 0.001, "sell_fee": 0.001, "sell_tax": 0.0, "stop_loss": 0.05}
+    workers = workers or os.cpu_count() or 1
+    print(f"=== cross_symbol_search：{n_symbols} 個交易對 × {len(combos)} 組（workers={workers}）===")
+    for label, cfg in [("無成本", None), ("含成本 + 停損", cost)]:
+        t0 = time.perf_counter()
+        cross_symbol_search(frames, "簡單均線交叉", combos, risk_cfg=cfg, workers=workers,
+                            trading_days=365)
+        print(f"{label:<12} {time.perf_counter() - t0:6.2f} s")
+
+
+def bench_pruned_grid_search(time_chunks: int = 8):
+    df     = make_price_frame()
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 40) for l in range(20, 120, 4)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003, "stop_loss": 0.08,
+              "trailing_stop": 0.1}
+    print(f"=== pruned_grid_search：{len(combos)} 組 × {len(df)} 根（含停損，{time_chunks} 段）===")
+    t0 = time.perf_counter()
+    for _ in run_backtest_batch(df, "簡單均線交叉", combos, cost):
+        pass
+    print(f"{'run_backtest_batch':<22} {time.perf_counter() - t0:6.2f} s")
+    for label, kwargs in [("不淘汰", dict(time_chunks=1)),
+                          ("最大回撤前 20 名", dict(opt_target="最大回撤(%)（最小化）")),
+                          ("回撤上限 30%", dict(max_drawdown=0.3))]:
+        t0    = time.perf_counter()
+        found = pruned_grid_search(df, "簡單均線交叉", combos, cost,
+                                   **{"time_chunks": time_chunks, **kwargs})
+        sec   = time.perf_counter() - t0
+        saved = 1 - found["bar_evaluations"] / found["full_bar_evaluations"]
+        print(f"{label:<22} {sec:6.2f} s   淘汰 {len(found['pruned']):>4} 組   "
+              f"K 棒 {found['bar_evaluations']:,}（省下 {saved:.0%}）")
+
+
+if __name__ == "__main__":
+    bench_parallel_grid_search()
+    bench_search_modes()
+    bench_walk_forward()
+    bench_cross_symbol_search()
+    bench_pruned_grid_search()
@@ -0,0 +1,40 @@
+# conftest.py
+# pytest 共用 fixture：暫存 SQLite engine 與模擬股價
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import database
+
+
+def sample_prices(n: int = 500, seed: int = 0, vol: float = 0.02, base: float = 100.0,
+                  spread: float = 0.01, start: str = "2020-01-01", freq: str = "B",
+                  **columns) -> pd.DataFrame:
+    """
+    幾何隨機漫步的模擬股價（OHLCV）：每根報酬 ~ N(0, vol)，High / Low = 收盤價 × (1 ± spread)。
+    columns 為額外的常數欄，例如 stock_code="TEST"。
+    """
+    rng   = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n, freq=freq, name="Date")
+    close = base * np.exp(np.cumsum(rng.normal(0, vol, n)))
+    df = pd.DataFrame({"Open": close, "High": close * (1 + spread), "Low": close * (1 - spread),
+                       "Close": close, "Volume": rng.integers(1000, 5000, n)}, index=dates)
+    return df.assign(**columns)
+
+
+@pytest.fixture
+def prices():
+    """sample_prices 工廠：prices(n=..., seed=..., ...)"""
+    return sample_prices
+
+
+@pytest.fixture
+def temp_engine(tmp_path, monkeypatch):
+    """database 改用 tmp_path 下的暫存 SQLite；測試結束後 dispose，並還原原本的 engine"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", echo=False, future=True)
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_schema_ready_for", None)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,406 @@
+# crypto_strategy.py
+# 虛擬幣專屬策略：import 時註冊進 strategy.strategies（與內建策略同一個註冊表）
+# 虛擬幣回測頁面與平行最佳化的 worker 行程都 import 這個模組取得這些策略
+# 虛擬幣回測的績效算法（crypto_backtest_batch）也放在這裡，單一交易對與跨交易對最佳化共用同一份
+
+import numpy as np
+import pandas as pd
+
+from risk import apply_friction_and_risk, price_columns_for
+from strategy import batch_positions, register_strategy, strategy_positions
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# =====================
+# SMA/Hull 趨勢策略（虛擬幣專屬）
+# =====================
+# wma / hull_moving_average 只依賴 numpy / pandas，匯出的交易機器人以 inspect.getsource 內嵌同一份程式
+def wma(series, n, block=1024):
+    """
+    線性加權移動平均（權重 1..n，最新一根最大），O(bars)：
+      Σ_{k<n} (n-k)·x[t-k] = n·C[t] − Σ_{j=t-n}^{t-1} C[j]，C 為累加和，第二項再以累加和相減取得
+    與 series.rolling(n).apply(lambda x: (x * w).sum() / w.sum(), raw=True) 在浮點誤差內相同：
+    前 n-1 根與視窗內含 NaN 時為 NaN。累加和每 block 根重新起算並先減去區段平均，長序列的誤差不會累積。
+    """
+    n      = max(int(n), 1)
+    values = np.asarray(series, dtype=np.float64)
+    out    = np.full(values.shape, np.nan)
+    nan    = np.isnan(values)
+    filled = np.where(nan, 0.0, values)
+    bad    = np.concatenate(([0], np.cumsum(nan)))
+    for start in range(n - 1, len(values), block):
+        stop = min(start + block, len(values))
+        seg  = filled[start - n + 1:stop]                     # 多取前 n-1 根作為第一個視窗
+        ref  = seg.mean()                                     # 權重和為 1，先減去再加回以縮小累加和
+        c    = np.concatenate(([0.0], np.cumsum(seg - ref)))  # c[i] = seg[:i] 的和
+        d    = np.concatenate(([0.0], np.cumsum(c)))          # d[i] = c[:i] 的和
+        end  = np.arange(n, len(seg) + 1)                     # 視窗 seg[end-n:end]
+        out[start:stop] = (n * c[end] - (d[end] - d[end - n])) / (n * (n + 1) / 2) + ref
+    idx = np.arange(n - 1, len(values))
+    out[idx[bad[idx + 1] - bad[idx + 1 - n] > 0]] = np.nan
+    if isinstance(series, pd.Series):
+        return pd.Series(out, index=series.index)
+    return out
+
+
+def hull_moving_average(series, n):
+    """Hull 移動平均：WMA(2·WMA(n/2) − WMA(n), √n)，n < 2 時半週期、√n 週期至少 1"""
+    half = max(int(n / 2), 1)
+    return wma(2 * wma(series, half) - wma(series, n), max(int(n ** 0.5), 1))
+
+
+def sma_hull_trend_signals(data, params):
+    type_ = params.get("type", "sma")
+    n1    = int(params.get("n1", 30))
+    n2    = int(params.get("n2", 130))
+    close = data['Close']
+    if type_ == "sma":
+        trend1 = close.rolling(n1).mean()
+        trend2 = close.rolling(n2).mean()
+    elif type_ == "hull":
+        trend1 = hull_moving_average(close, n1)
+        trend2 = hull_moving_average(close, n2)
+    else:
+        trend1 = close
+        trend2 = close
+
+    buy  = (trend1 > trend2) & (trend1.shift(1) <= trend2.shift(1))
+    sell = (trend1 < trend2) & (trend1.shift(1) >= trend2.shift(1))
+    return buy, sell, {'trend1': trend1, 'trend2': trend2}
+
+
+def _sma_hull_warmup(params):
+    n2 = int(params.get("n2", 130))
+    if params.get("type", "sma") == "hull":
+        return n2 + int(n2 ** 0.5)
+    return n2
+
+
+# =====================
+# 新增虛擬幣專屬策略
+# 根據 2025 年最熱門的量化策略研究整理
+# =====================
+# supertrend_kernel / supertrend 同樣只依賴 numpy / pandas，以原始碼內嵌進匯出的交易機器人
+def supertrend_kernel(close, upper, lower, direction, position):
+    """
+    Supertrend 單趟 kernel：同一個迴圈依序調整上下軌、決定方向與持倉。
+      close        : 收盤價
+      upper / lower: 基礎上下軌（hl2 ± 倍數 × ATR），原地覆寫成調整後的軌道
+      direction    : 輸出，1 = 多、-1 = 空（第 0 根為 1）
+      position     : 輸出，方向由空翻多時進場（1）、由多翻空時出場（0），初始空手
+    上軌：基礎上軌下降，或前一根收盤突破前一根上軌時採用新值，否則沿用前一根（下軌對稱）；
+    前一根軌道為 NaN（ATR 暖身期或缺價）時直接採用新值，不會像 .iloc 版一路沿用 NaN。
+    安裝 numba 時以 njit 編譯。
+    """
+    n = close.shape[0]
+    if n == 0:
+        return
+    direction[0] = 1
+    position[0]  = 0
+    for i in range(1, n):
+        prev_upper = upper[i - 1]
+        prev_lower = lower[i - 1]
+        # x == x 為 False 表示 NaN：前一根尚無軌道時不沿用
+        if prev_upper == prev_upper and not (upper[i] < prev_upper or close[i - 1] > prev_upper):
+            upper[i] = prev_upper
+        if prev_lower == prev_lower and not (lower[i] > prev_lower or close[i - 1] < prev_lower):
+            lower[i] = prev_lower
+
+        if close[i] > upper[i]:
+            direction[i] = 1
+        elif close[i] < lower[i]:
+            direction[i] = -1
+        else:
+            direction[i] = direction[i - 1]
+
+        if direction[i] == 1 and direction[i - 1] == -1:
+            position[i] = 1
+        elif direction[i] == -1 and direction[i - 1] == 1:
+            position[i] = 0
+        else:
+            position[i] = position[i - 1]
+
+
+def supertrend(high, low, close, period, mult, kernel=None):
+    """
+    high / low / close（pandas Series）→ (upper, lower, direction, position) NumPy 陣列。
+    ATR 為真實波幅的 period 根簡單平均；kernel 預設為純 Python 的 supertrend_kernel。
+    """
+    tr    = pd.concat([high - low, (high - close.shift(1)).abs(), (low - close.shift(1)).abs()],
+                      axis=1).max(axis=1)
+    atr   = tr.rolling(int(period)).mean()
+    hl2   = (high + low) / 2
+    upper = (hl2 + mult * atr).to_numpy(dtype=np.float64, copy=True)
+    lower = (hl2 - mult * atr).to_numpy(dtype=np.float64, copy=True)
+    direction = np.zeros(len(close), dtype=np.int64)
+    position  = np.zeros(len(close), dtype=np.int64)
+    (kernel or supertrend_kernel)(close.to_numpy(dtype=np.float64), upper, lower, direction, position)
+    return upper, lower, direction, position
+
+
+if NUMBA_AVAILABLE:
+    _supertrend_kernel_jit = numba.njit(cache=True, nogil=True)(supertrend_kernel)
+
+
+def supertrend_signals(data, params):
+    """
+    Supertrend 策略:結合 ATR 的趨勢追蹤指標。
+    當收盤價在 Supertrend 線上方時持有，跌破時出場。
+    2025 年虛擬幣最廣泛使用的趨勢策略之一。
+    """
+    period = int(params.get("ATR 週期", 10))
+    mult   = float(params.get("ATR 倍數", 3.0))
+    close  = data['Close']
+    _, _, direction, _ = supertrend(data['High'], data['Low'], close, period, mult,
+                                    kernel=_supertrend_kernel_jit if NUMBA_AVAILABLE else None)
+
+    dir_arr = pd.Series(direction, index=close.index)
+    buy  = (dir_arr == 1) & (dir_arr.shift(1) == -1)
+    sell = (dir_arr == -1) & (dir_arr.shift(1) == 1)
+    return buy, sell, {}
+
+
+def stoch_rsi_signals(data, params):
+    """
+    Stochastic RSI 策略:對 RSI 再做隨機指標計算。
+    對超買超賣更敏感，適合虛擬幣高波動環境。
+    %K 穿越 %D 且在低位（<20）時買入，高位（>80）時賣出。
+    """
+    rsi_period   = int(params.get("RSI 週期", 14))
+    stoch_period = int(params.get("Stoch 週期", 14))
+    k_period     = int(params.get("%K 平滑", 3))
+    d_period     = int(params.get("%D 平滑", 3))
+    buy_level    = float(params.get("買入閾值", 20))
+    sell_level   = float(params.get("賣出閾值", 80))
+
+    # RSI
+    delta    = data['Close'].diff()
+    gain     = delta.clip(lower=0).rolling(rsi_period).mean()
+    loss     = (-delta.clip(upper=0)).rolling(rsi_period).mean()
+    rs       = gain / loss
+    rsi      = 100 - (100 / (1 + rs))
+
+    # Stochastic of RSI
+    rsi_min  = rsi.rolling(stoch_period).min()
+    rsi_max  = rsi.rolling(stoch_period).max()
+    stoch    = (rsi - rsi_min) / (rsi_max - rsi_min + 1e-10) * 100
+    k        = stoch.rolling(k_period).mean()
+    d        = k.rolling(d_period).mean()
+
+    # 訊號：%K 穿越 %D 且在低/高區域
+    buy  = (k > d) & (k.shift(1) <= d.shift(1)) & (k < buy_level)
+    sell = (k < d) & (k.shift(1) >= d.shift(1)) & (k > sell_level)
+    return buy, sell, {}
+
+
+def atr_breakout_signals(data, params):
+    """
+    ATR 波動突破策略:當價格突破前 N 日收盤均值 + ATR 倍數時買入。
+    根據市場波動自動調整突破門檻，適合高波動的虛擬幣市場。
+    """
+    period = int(params.get("均線週期", 20))
+    atr_p  = int(params.get("ATR 週期", 14))
+    mult   = float(params.get("突破倍數", 1.5))
+    high, low, close = data['High'], data['Low'], data['Close']
+
+    ma  = close.rolling(period).mean()
+    hl  = high - low
+    hc  = (high - close.shift(1)).abs()
+    lc  = (low  - close.shift(1)).abs()
+    atr = pd.concat([hl, hc, lc], axis=1).max(axis=1).rolling(atr_p).mean()
+
+    upper = ma + mult * atr
+    lower = ma - mult * atr
+
+    buy  = (close > upper.shift(1)).fillna(False)
+    sell = (close < lower.shift(1)).fillna(False)
+    return buy, sell, {}
+
+
+def dca_signals(data, params):
+    """
+    DCA 定期買入策略（Dollar Cost Averaging）:
+    每隔固定天數買入一次，持有到下次買入（不主動賣出）。
+    適合長線看多、不想擇時的投資者。
+    """
+    interval = int(params.get("買入間隔（天）", 7))
+    index    = data['Close'].index
+    buy  = pd.Series(np.arange(len(index)) % interval == 0, index=index)
+    sell = pd.Series(False, index=index)
+    return buy, sell, {}
+
+
+def adx_trend_signals(data, params):
+    """
+    ADX 趨勢強度過濾策略:
+    用 ADX 判斷趨勢強度，只在趨勢明確（ADX > 閾值）時配合均線方向進場。
+    ADX < 閾值時不進場（市場盤整），有效過濾震盪行情。
+    """
+    adx_period    = int(params.get("ADX 週期", 14))
+    adx_threshold = float(params.get("ADX 閾值", 25))
+    ma_period     = int(params.get("均線週期", 20))
+
+    # 計算 ADX
+    high, low, close = data['High'], data['Low'], data['Close']
+    up_move   = high.diff()
+    down_move = -low.diff()
+    plus_dm   = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
+    minus_dm  = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
+
+    tr = pd.concat([
+        high - low,
+        (high - close.shift(1)).abs(),
+        (low  - close.shift(1)).abs()
+    ], axis=1).max(axis=1)
+
+    atr      = tr.rolling(adx_period).mean()
+    plus_di  = 100 * pd.Series(plus_dm,  index=close.index).rolling(adx_period).mean() / atr
+    minus_di = 100 * pd.Series(minus_dm, index=close.index).rolling(adx_period).mean() / atr
+    dx       = (100 * (plus_di - minus_di).abs() / (plus_di + minus_di + 1e-10))
+    adx      = dx.rolling(adx_period).mean()
+
+    ma = close.rolling(ma_period).mean()
+
+    # 趨勢夠強（ADX > 閾值）且在均線上方才買入
+    buy  = ((adx > adx_threshold) & (close > ma) & (close.shift(1) <= ma.shift(1))).fillna(False)
+    sell = ((close < ma) & (close.shift(1) >= ma.shift(1))).fillna(False)
+    return buy, sell, {}
+
+
+def vwap_signals(data, params):
+    """
+    VWAP 均值回歸策略（Volume Weighted Average Price）:
+    結合成交量的加權均價，機構廣泛使用。
+    收盤價從 VWAP 下方回升穿越時買入，跌破時賣出。
+    """
+    period = int(params.get("VWAP 週期", 20))
+    high, low, close, volume = data['High'], data['Low'], data['Close'], data['Volume']
+
+    # 滾動 VWAP
+    typical_price = (high + low + close) / 3
+    vwap = (typical_price * volume).rolling(period).sum() / volume.rolling(period).sum()
+
+    buy  = ((close > vwap) & (close.shift(1) <= vwap.shift(1))).fillna(False)
+    sell = ((close < vwap) & (close.shift(1) >= vwap.shift(1))).fillna(False)
+    return buy, sell, {}
+
+
+# =====================
+# 虛擬幣回測績效（單一交易對最佳化與跨交易對最佳化共用）
+# =====================
+# 與台股的 backtest_metrics 不同：虛擬幣單日漲跌超過 50% 仍屬真實行情，不剔除；
+# 交易次數以原始 Position 變化計算
+CRYPTO_TRADING_DAYS = 365
+
+
+def finish_strategy(df, risk_cfg=None):
+    """已有 Position 欄的 df → 套用摩擦成本 & 停損停利，計算 Strategy / DailyReturn"""
+    if risk_cfg:
+        df = apply_friction_and_risk(df, **risk_cfg)
+    else:
+        df['DailyReturn'] = df['Close'].pct_change()
+        df['Strategy']    = df['Position'].shift(1) * df['DailyReturn']
+    df['DailyReturn'] = df['Close'].pct_change()
+    df = df.dropna(subset=['DailyReturn', 'Strategy'])
+    return df
+
+
+def crypto_metrics(df, trading_days=CRYPTO_TRADING_DAYS):
+    """finish_strategy 的結果 → 累積報酬、夏普、最大回撤、交易次數"""
+    cum_s  = (1 + df['Strategy']).cumprod()
+    sharpe = (df['Strategy'].mean() / df['Strategy'].std() * trading_days ** 0.5
+              if df['Strategy'].std() != 0 else 0)
+    return {
+        "累積報酬率(%)": round(float((cum_s.iloc[-1] - 1) * 100), 2),
+        "夏普比率":       round(float(sharpe), 2),
+        "最大回撤(%)":    round(float(((cum_s - cum_s.cummax()) / cum_s.cummax()).min() * 100), 2),
+        "交易次數":       int((df['Position'].diff().abs() > 0).sum()),
+    }
+
+
+def crypto_backtest(df, strategy_name, params, risk_cfg=None, trading_days=CRYPTO_TRADING_DAYS):
+    # 精簡模式：只取持倉，不複製整個 df、不寫入指標欄位
+    try:
+        position, _ = strategy_positions(df, strategy_name, params)
+        df_s = df[price_columns_for(df, risk_cfg)].copy()
+        df_s['Position'] = position
+        df_s = finish_strategy(df_s, risk_cfg)
+        return crypto_metrics(df_s, trading_days) if not df_s.empty else None
+    except Exception:
+        return None
+
+
+def crypto_backtest_batch(df, strategy_name, combos, risk_cfg=None, trading_days=CRYPTO_TRADING_DAYS):
+    """
+    虛擬幣版 optimizer.run_backtest_batch（可直接傳給 cross_symbol_search 的 evaluate）：
+    以 batch_positions 一次算出整個網格的持倉矩陣，逐欄只做成本與績效計算。逐筆 yield 結果。
+    """
+    try:
+        positions, valid = batch_positions(df, strategy_name, combos)
+    except Exception:
+        for params in combos:
+            yield crypto_backtest(df, strategy_name, params, risk_cfg, trading_days)
+        return
+    base = df[price_columns_for(df, risk_cfg)].copy()
+    for j in range(len(combos)):
+        if not valid[j]:
+            yield None
+            continue
+        df_s = base.copy()
+        df_s['Position'] = positions[:, j]
+        try:
+            df_s = finish_strategy(df_s, risk_cfg)
+            yield crypto_metrics(df_s, trading_days) if not df_s.empty else None
+        except Exception:
+            yield None
+
+
+# =====================
+# 註冊
+# =====================
+register_strategy(
+    "SMA/Hull 趨勢策略", sma_hull_trend_signals, warmup=_sma_hull_warmup,
+    description="短期均線與長期均線交叉策略 (SMA/HullMA)，可選 SMA 或 Hull 移動平均",
+    parameters={"type": "sma", "n1": 30, "n2": 130},
+)
+register_strategy(
+    "Supertrend 策略", supertrend_signals, inputs=("High", "Low", "Close"),
+    warmup=lambda p: int(p.get("ATR 週期", 10)),
+    description="ATR 基礎趨勢追蹤指標，收盤價突破 Supertrend 線時進出場。2025 年虛擬幣最熱門策略之一。",
+    parameters={"ATR 週期": 10, "ATR 倍數": 3.0},
+)
+register_strategy(
+    "Stochastic RSI 策略", stoch_rsi_signals,
+    warmup=lambda p: (int(p.get("RSI 週期", 14)) + int(p.get("Stoch 週期", 14))
+                      + int(p.get("%K 平滑", 3)) + int(p.get("%D 平滑", 3))),
+    description="對 RSI 再做隨機指標，對超買超賣更敏感。%K 穿越 %D 且在低位買入、高位賣出。",
+    parameters={"RSI 週期": 14, "Stoch 週期": 14, "%K 平滑": 3, "%D 平滑": 3, "買入閾值": 20.0, "賣出閾值": 80.0},
+)
+register_strategy(
+    "ATR 波動突破策略", atr_breakout_signals, inputs=("High", "Low", "Close"),
+    warmup=lambda p: max(int(p.get("均線週期", 20)), int(p.get("ATR 週期", 14)) + 1) + 1,
+    description="根據 ATR 市場波動自動調整突破門檻，高波動時門檻更高，適合虛擬幣高波動環境。",
+    parameters={"均線週期": 20, "ATR 週期": 14, "突破倍數": 1.5},
+)
+register_strategy(
+    "DCA 定期買入策略", dca_signals,
+    description="每隔固定天數買入並持有（Dollar Cost Averaging），不主動賣出，適合長線看多。",
+    parameters={"買入間隔（天）": 7},
+)
+register_strategy(
+    "ADX 趨勢強度過濾策略", adx_trend_signals, inputs=("High", "Low", "Close"),
+    warmup=lambda p: max(3 * int(p.get("ADX 週期", 14)), int(p.get("均線週期", 20)) + 1),
+    description="ADX > 閾值時確認趨勢明確，配合均線方向進場。盤整期不交易，有效降低假訊號。",
+    parameters={"ADX 週期": 14, "ADX 閾值": 25.0, "均線週期": 20},
+)
+register_strategy(
+    "VWAP 均值回歸策略", vwap_signals, inputs=("High", "Low", "Close", "Volume"),
+    warmup=lambda p: int(p.get("VWAP 週期", 20)),
+    description="成交量加權均價（機構廣泛使用），收盤價從 VWAP 下方穿越時買入，跌破時賣出。",
+    parameters={"VWAP 週期": 20},
+)
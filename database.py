@@ -1,8 +1,16 @@
 # database.py
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text, bindparam
+from sqlalchemy.pool import QueuePool, StaticPool
+import hashlib
+import io
 import json
+import time
+import zlib
+
+import numpy as np
+import parquet_store
 
 # =====================
 # 路徑設定：自動偵測 Streamlit Cloud 環境
@@ -17,51 +25,313 @@ def _get_db_path() -> str:
         # 本機：使用當前工作目錄
         return "sqlite:///stock_data.db"
 
+# =====================
+# 連線設定檔：多個 Streamlit session 同時回測時，預設的 rollback journal
+# 寫入會鎖住整個檔案、讀取也要等。tuned 改用 WAL（讀寫互不阻塞）、
+# synchronous=NORMAL（WAL 下只在 checkpoint 時 fsync）並放大 page cache 與 mmap。
+# 以環境變數 SQLITE_ENGINE_PROFILE=default 可切回 SQLAlchemy 預設行為。
+# =====================
+ENGINE_PROFILES = {
+    "tuned": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous":  "NORMAL",
+            "cache_size":   -64000,          # 負值單位為 KiB，約 64 MB
+            "mmap_size":    268435456,       # 256 MB
+            "temp_store":   "MEMORY",
+            "busy_timeout": 30000,           # 毫秒，寫入衝突時等待而非立即報錯
+        },
+        "pool_size":    5,
+        "max_overflow": 10,
+    },
+    "default": {
+        "pragmas": {},
+    },
+}
+
+def _engine_profile() -> str:
+    profile = os.environ.get("SQLITE_ENGINE_PROFILE", "tuned").lower()
+    return profile if profile in ENGINE_PROFILES else "tuned"
+
+def make_engine(url: str, profile: str = None):
+    """依設定檔建立 SQLite engine（benchmark 與測試也用這個建立暫存 DB 的 engine）"""
+    cfg = ENGINE_PROFILES[profile or _engine_profile()]
+    if not cfg["pragmas"]:
+        return create_engine(url, echo=False, future=True)
+
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if in_memory:
+        # 記憶體資料庫每條連線各自獨立，只能共用同一條
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(poolclass=QueuePool, pool_size=cfg["pool_size"],
+                      max_overflow=cfg["max_overflow"])
+    engine = create_engine(url, echo=False, future=True, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in cfg["pragmas"].items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
 # Lazy engine：第一次呼叫時才建立，確保路徑判斷在執行時發生
 _engine = None
 
 def _get_engine():
     global _engine
     if _engine is None:
-        _engine = create_engine(_get_db_path(), echo=False, future=True)
+        _engine = make_engine(_get_db_path())
     return _engine
 
+# =====================
+# 股價儲存後端：預設 SQLite；設定環境變數 PRICE_STORE_BACKEND=parquet
+# 且已安裝 pyarrow 時，股價改存每支股票一個 Parquet 檔（見 parquet_store.py）
+# 同步紀錄、回測結果等其他資料表仍存在 SQLite
+# =====================
+def _price_backend() -> str:
+    backend = os.environ.get("PRICE_STORE_BACKEND", "sqlite").lower()
+    if backend == "parquet" and parquet_store.PYARROW_AVAILABLE:
+        return "parquet"
+    return "sqlite"
+
 # =====================
 # 建立資料庫表格（若尚未存在）
+# 每個 engine 只執行一次；讀寫函式呼叫 init_db() 時直接返回，
+# 不會每次都送出 CREATE TABLE IF NOT EXISTS
 # =====================
-def init_db():
+_schema_ready_for = None   # 已完成建表的 engine
+
+# stock_price：Date 存 1970-01-01 起算的天數（INTEGER），
+# 主鍵 (stock_code, Date) 且 WITHOUT ROWID，資料直接依主鍵排序存放，
+# 「某支股票 + 日期區間」的查詢是一段連續的 B-tree 掃描，不必回表
+_CREATE_STOCK_PRICE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    stock_code TEXT NOT NULL,
+    Date INTEGER NOT NULL,
+    Open REAL,
+    High REAL,
+    Low REAL,
+    Close REAL,
+    Volume INTEGER,
+    "Adj Close" REAL,
+    PRIMARY KEY (stock_code, Date)
+) WITHOUT ROWID
+"""
+
+def _migrate_stock_price(conn):
+    """
+    舊版 stock_price（Date TEXT、主鍵 (Date, stock_code)）一次轉成新格式：
+    建新表 → 以 julianday 換算天數整批搬移 → 刪舊表 → 改名，全部在同一個交易內；
+    轉換後 VACUUM，把舊表留下的空頁還給檔案系統（否則檔案約大 60%）
+    """
+    columns = conn.execute(text("PRAGMA table_info(stock_price)")).fetchall()
+    date_type = {c[1]: (c[2] or "").upper() for c in columns}.get("Date")
+    if date_type is None or date_type == "INTEGER":
+        return
+    conn.execute(text("DROP TABLE IF EXISTS stock_price_new"))
+    conn.execute(text(_CREATE_STOCK_PRICE_SQL.format(table="stock_price_new")))
+    conn.execute(text("""
+        INSERT OR REPLACE INTO stock_price_new (
+            stock_code, Date, Open, High, Low, Close, Volume, "Adj Close"
+        )
+        SELECT stock_code,
+               CAST(ROUND(julianday(substr(Date, 1, 10)) - 2440587.5) AS INTEGER),
+               Open, High, Low, Close, Volume, "Adj Close"
+        FROM stock_price
+        WHERE julianday(substr(Date, 1, 10)) IS NOT NULL
+    """))
+    conn.execute(text("DROP TABLE stock_price"))
+    conn.execute(text("ALTER TABLE stock_price_new RENAME TO stock_price"))
+    conn.commit()
+    # VACUUM 不能在交易內執行，因此在 commit 之後單獨送出
+    conn.execute(text("VACUUM"))
+    conn.commit()
+
+def _migrate_strategy_result(conn):
+    """
+    舊版 strategy_result（每個交易日一列）搬進 strategy_run：每組 (股票, 策略, 參數) 轉成一列，
+    run_id 已存在時保留 strategy_run 的版本（較新）；搬完刪除舊表並 VACUUM
+    """
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'strategy_result'")).fetchone()
+    if exists is None:
+        return
+    old = pd.read_sql(text("""
+        SELECT Date, stock_code, strategy_name, params, Position, Strategy, DailyReturn
+        FROM strategy_result ORDER BY stock_code, strategy_name, params, Date
+    """), conn, parse_dates=["Date"])
+    rows = [_strategy_run_row(code, name, json.loads(params), group.set_index("Date"))
+            for (code, name, params), group in old.groupby(["stock_code", "strategy_name", "params"],
+                                                           sort=False)]
+    if rows:
+        conn.execute(text(_INSERT_STRATEGY_RUN_SQL.format(verb="INSERT OR IGNORE")), rows)
+    conn.execute(text("DROP TABLE strategy_result"))
+    conn.commit()
+    conn.execute(text("VACUUM"))
+    conn.commit()
+
+# =====================
+# 日期 <-> epoch day 轉換
+# =====================
+def _to_epoch_day(value) -> int:
+    return int(pd.Timestamp(str(value)).normalize().value // 86_400_000_000_000)
+
+def _epoch_days_to_datetime(days) -> pd.DatetimeIndex:
+    values = np.asarray(days, dtype="int64").astype("datetime64[D]").astype("datetime64[ns]")
+    return pd.DatetimeIndex(values, name="Date")
+
+def _date_range_clause(start_date, end_date, params: dict) -> str:
+    clause = ""
+    if start_date:
+        clause += " AND Date >= :start_date"
+        params["start_date"] = _to_epoch_day(start_date)
+    if end_date:
+        clause += " AND Date <= :end_date"
+        params["end_date"] = _to_epoch_day(end_date)
+    return clause
+
+def init_db(force: bool = False):
+    global _schema_ready_for
     engine = _get_engine()
+    if _schema_ready_for is engine and not force:
+        return
     with engine.connect() as conn:
+        _migrate_stock_price(conn)
+        conn.execute(text(_CREATE_STOCK_PRICE_SQL.format(table="stock_price")))
+        # 已向網路要過資料的日期區間（含假日、上市前等本來就沒有資料的區段），
+        # 供增量同步判斷哪些區間不必再下載
         conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS stock_price (
-            Date TEXT NOT NULL,
-            Open REAL,
-            High REAL,
-            Low REAL,
-            Close REAL,
-            Volume INTEGER,
-            "Adj Close" REAL,
+        CREATE TABLE IF NOT EXISTS price_coverage (
             stock_code TEXT NOT NULL,
-            PRIMARY KEY (Date, stock_code)
+            start_date TEXT NOT NULL,
+            end_date   TEXT NOT NULL,
+            PRIMARY KEY (stock_code, start_date)
+        )
+        """))
+        # 回測結果：每次執行一列，日序列以壓縮後的 numpy 陣列存成 BLOB
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS strategy_run (
+            run_id        TEXT PRIMARY KEY,
+            stock_code    TEXT NOT NULL,
+            strategy_name TEXT NOT NULL,
+            params        TEXT NOT NULL,
+            n_rows        INTEGER NOT NULL,
+            start_date    TEXT,
+            end_date      TEXT,
+            dates         BLOB NOT NULL,
+            position      BLOB NOT NULL,
+            strategy      BLOB NOT NULL,
+            daily_return  BLOB NOT NULL,
+            created_at    TEXT NOT NULL
+        )
+        """))
+        # 回測結果快取（見 backtest_cache.py）：key 為資料指紋 + 策略 + 參數的雜湊
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS backtest_cache (
+            cache_key  TEXT PRIMARY KEY,
+            payload    BLOB NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            last_used  REAL NOT NULL
+        )
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_backtest_cache_last_used ON backtest_cache (last_used)"
+        ))
+        # 參數最佳化紀錄（見 opt_store.py）：每次掃描一列 metadata，每組參數一列績效
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS opt_sweep (
+            sweep_id      TEXT PRIMARY KEY,
+            symbol        TEXT NOT NULL,
+            strategy_name TEXT NOT NULL,
+            start_date    TEXT,
+            end_date      TEXT,
+            risk_cfg      TEXT NOT NULL,
+            context       TEXT NOT NULL,
+            created_at    TEXT NOT NULL,
+            updated_at    TEXT NOT NULL
+        )
+        """))
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS opt_result (
+            sweep_id  TEXT NOT NULL,
+            combo_key TEXT NOT NULL,
+            params    TEXT NOT NULL,
+            metrics   TEXT,
+            PRIMARY KEY (sweep_id, combo_key)
         )
         """))
         conn.commit()
+        _migrate_strategy_result(conn)
+    _schema_ready_for = engine
 
 # =====================
 # 儲存股票歷史價格
 # =====================
-def save_stock_prices(df: pd.DataFrame, stock_code: str):
-    engine = _get_engine()
-    init_db()  # 確保表格存在
-    df = df.copy()
+_PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Adj Close"]
+
+_UPSERT_PRICE_SQL = """
+    INSERT OR REPLACE INTO stock_price (
+        Date, Open, High, Low, Close, Volume, "Adj Close", stock_code
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
+def _normalize_price_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """攤平 yfinance 的 MultiIndex 欄位，並把 Date 轉成欄位（已正規化到日）"""
+    df = df.copy()
     if isinstance(df.columns, pd.MultiIndex):
         df.columns = [col[0] for col in df.columns]
     if 'Date' not in df.columns:
         df.reset_index(inplace=True)
-    df['Date'] = pd.to_datetime(df['Date']).dt.normalize()
+    df['Date'] = pd.to_datetime(df['Date'])
+    if df['Date'].dt.tz is not None:
+        df['Date'] = df['Date'].dt.tz_localize(None)
+    df['Date'] = df['Date'].dt.normalize()
     if 'index' in df.columns:
         df.drop(columns=['index'], inplace=True)
+    return df
+
+def _price_rows(df: pd.DataFrame, stock_code: str) -> list:
+    """
+    以欄為單位一次轉換成 executemany 用的 tuple 清單：
+    日期一次換算成 epoch day、NaN 一次換成 None，避免逐列 iterrows 的 Python 開銷。
+    """
+    n       = len(df)
+    days    = df['Date'].to_numpy().astype('datetime64[D]').astype('int64')
+    columns = [days.tolist()]
+    for col in _PRICE_COLUMNS:
+        if col in df.columns:
+            s = df[col]
+            columns.append(s.astype(object).where(s.notna(), None).tolist())
+        else:
+            columns.append([None] * n)
+    columns.append([stock_code] * n)
+    return list(zip(*columns))
+
+def save_stock_prices(df: pd.DataFrame, stock_code: str, bulk: bool = True):
+    """
+    儲存股票歷史價格（INSERT OR REPLACE）。
+    bulk=True  : 欄式轉換後以單一 executemany 批次寫入（預設）
+    bulk=False : 舊版逐列寫入，保留作為 benchmark 對照
+    """
+    engine = _get_engine()
+    init_db()  # 確保表格存在
+    df = _normalize_price_frame(df)
+
+    if _price_backend() == "parquet":
+        parquet_store.save_prices(df, stock_code)
+        return
+
+    if bulk:
+        rows = _price_rows(df, stock_code)
+        if not rows:
+            return
+        with engine.begin() as conn:
+            conn.exec_driver_sql(_UPSERT_PRICE_SQL, rows)
+        return
 
     df['stock_code'] = stock_code
 
@@ -74,7 +344,7 @@ def save_stock_prices(df: pd.DataFrame, stock_code: str):
                     :Date, :Open, :High, :Low, :Close, :Volume, :AdjClose, :stock_code
                 )
             """), {
-                "Date":       row["Date"].strftime('%Y-%m-%d'),
+                "Date":       _to_epoch_day(row["Date"]),
                 "Open":       row.get("Open",      None),
                 "High":       row.get("High",      None),
                 "Low":        row.get("Low",       None),
@@ -87,86 +357,391 @@ def save_stock_prices(df: pd.DataFrame, stock_code: str):
 # =====================
 # 讀取股票歷史價格
 # =====================
+# 欄位順序與舊版 SELECT * 相同（stock_code 在最後）
+_SELECT_PRICE_SQL = """
+SELECT Date, Open, High, Low, Close, Volume, "Adj Close", stock_code FROM stock_price
+"""
+
+def _price_frame_from_sql(df: pd.DataFrame) -> pd.DataFrame:
+    df.index = _epoch_days_to_datetime(df.pop("Date"))
+    return df
+
 def load_stock_prices(stock_code: str, start_date=None, end_date=None):
+    if _price_backend() == "parquet":
+        return parquet_store.load_prices(stock_code, start_date, end_date)
     engine = _get_engine()
     init_db()
-    query  = "SELECT * FROM stock_price WHERE stock_code = :code"
     params = {"code": stock_code}
-    if start_date:
-        query += " AND Date >= :start_date"
-        params["start_date"] = str(start_date)
-    if end_date:
-        query += " AND Date <= :end_date"
-        params["end_date"] = str(end_date)
+    query  = _SELECT_PRICE_SQL + " WHERE stock_code = :code"
+    query += _date_range_clause(start_date, end_date, params)
     query += " ORDER BY Date ASC"
 
     with engine.connect() as conn:
-        df = pd.read_sql(text(query), conn, params=params, parse_dates=["Date"])
-    df.set_index("Date", inplace=True)
-    return df
+        df = pd.read_sql(text(query), conn, params=params)
+    return _price_frame_from_sql(df)
+
+# =====================
+# 一次讀取多支股票（單一 stock_code IN (...) 查詢）
+# =====================
+_MAX_IN_CODES = 500   # SQLite 單一語句的參數上限保守值
+
+def load_stock_prices_many(stock_codes, start_date=None, end_date=None, as_panel: bool = False):
+    """
+    回傳 {stock_code: DataFrame}（順序同 stock_codes，查無資料為空 DataFrame），
+    as_panel=True 時改回傳以 (Date, stock_code) 為 MultiIndex 的單一 DataFrame。
+    """
+    codes = list(dict.fromkeys(stock_codes))
+    if _price_backend() == "parquet":
+        frames = [parquet_store.load_prices(c, start_date, end_date) for c in codes]
+        frames = [f.reset_index() for f in frames if not f.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else \
+            pd.DataFrame(columns=["Date"] + parquet_store.PRICE_COLUMNS + ["stock_code"])
+    else:
+        engine = _get_engine()
+        init_db()
+        params = {}
+        query  = _SELECT_PRICE_SQL + " WHERE stock_code IN :codes"
+        query += _date_range_clause(start_date, end_date, params)
+        query += " ORDER BY stock_code ASC, Date ASC"
+        stmt   = text(query).bindparams(bindparam("codes", expanding=True))
+
+        chunks = []
+        with engine.connect() as conn:
+            for i in range(0, max(len(codes), 1), _MAX_IN_CODES):
+                chunk = codes[i:i + _MAX_IN_CODES]
+                chunks.append(pd.read_sql(stmt, conn, params={**params, "codes": chunk}))
+        df = pd.concat(chunks, ignore_index=True)
+        df["Date"] = _epoch_days_to_datetime(df["Date"])
+
+    if as_panel:
+        return df.set_index(["Date", "stock_code"]).sort_index()
+
+    result = {}
+    groups = dict(tuple(df.groupby("stock_code", sort=False)))
+    for code in codes:
+        part = groups.get(code, df.iloc[0:0])
+        result[code] = part.set_index("Date")
+    return result
 
 # =====================
 # 刪除指定股票的所有快取資料
 # =====================
 def delete_stock_prices(stock_code: str):
+    if _price_backend() == "parquet":
+        parquet_store.delete_prices(stock_code)
     engine = _get_engine()
+    init_db()
     with engine.begin() as conn:
         conn.execute(text(
             "DELETE FROM stock_price WHERE stock_code = :code"
         ), {"code": stock_code})
+        conn.execute(text(
+            "DELETE FROM price_coverage WHERE stock_code = :code"
+        ), {"code": stock_code})
 
 # =====================
 # 檢查股票的最新日期
 # =====================
 def get_latest_date(stock_code: str):
+    if _price_backend() == "parquet":
+        return parquet_store.get_latest_date(stock_code)
     engine = _get_engine()
+    init_db()
     query  = "SELECT MAX(Date) as max_date FROM stock_price WHERE stock_code = :code"
     with engine.connect() as conn:
         result = conn.execute(text(query), {"code": stock_code}).fetchone()
-    return result.max_date if result and result.max_date else None
+    if not result or result.max_date is None:
+        return None
+    return _epoch_days_to_datetime([result.max_date])[0].strftime('%Y-%m-%d')
 
 # =====================
-# 儲存回測結果
+# 讀取已儲存的交易日（增量同步用，只讀 Date 欄）
 # =====================
-def save_strategy_result(stock_code: str, strategy_name: str, params: dict, df: pd.DataFrame):
+def get_stored_dates(stock_code: str, start_date=None, end_date=None) -> pd.DatetimeIndex:
+    if _price_backend() == "parquet":
+        return parquet_store.get_stored_dates(stock_code, start_date, end_date)
     engine = _get_engine()
-    df = df.copy()
-    df.reset_index(inplace=True)
-    df['stock_code']    = stock_code
-    df['strategy_name'] = strategy_name
-    df['params']        = json.dumps(params, ensure_ascii=False)
-
-    delete_sql = """
-    DELETE FROM strategy_result
-    WHERE stock_code = :code AND strategy_name = :name AND params = :params
+    init_db()
+    params = {"code": stock_code}
+    query  = "SELECT Date FROM stock_price WHERE stock_code = :code"
+    query += _date_range_clause(start_date, end_date, params)
+    query += " ORDER BY Date ASC"
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), params).fetchall()
+    return _epoch_days_to_datetime([r[0] for r in rows])
+
+# =====================
+# 已同步區間（price_coverage）讀寫
+# =====================
+def load_price_coverage(stock_code: str) -> list:
+    """回傳 [(start, end), ...]（pd.Timestamp，含頭尾），依 start 排序"""
+    engine = _get_engine()
+    init_db()
+    query  = """
+    SELECT start_date, end_date FROM price_coverage
+    WHERE stock_code = :code ORDER BY start_date ASC
     """
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), {"code": stock_code}).fetchall()
+    return [(pd.Timestamp(r[0]), pd.Timestamp(r[1])) for r in rows]
+
+def save_price_coverage(stock_code: str, intervals: list):
+    """以新的區間清單整批取代該股票的同步紀錄"""
+    engine = _get_engine()
+    init_db()
+    rows = [{"code":  stock_code,
+             "start": pd.Timestamp(s).strftime('%Y-%m-%d'),
+             "end":   pd.Timestamp(e).strftime('%Y-%m-%d')} for s, e in intervals]
     with engine.begin() as conn:
-        conn.execute(text(delete_sql), {
-            "code":   stock_code,
-            "name":   strategy_name,
-            "params": json.dumps(params, ensure_ascii=False),
-        })
+        conn.execute(text(
+            "DELETE FROM price_coverage WHERE stock_code = :code"
+        ), {"code": stock_code})
+        if rows:
+            conn.execute(text("""
+                INSERT INTO price_coverage (stock_code, start_date, end_date)
+                VALUES (:code, :start, :end)
+            """), rows)
+
+# =====================
+# 回測結果（strategy_run）
+# 以 (stock_code, strategy_name, params) 的雜湊當 run_id，一次回測只佔一列：
+# Date / Position / Strategy / DailyReturn 各自以 np.save + zlib 壓成 BLOB，
+# 讀取、覆蓋、刪除都只碰一列，與回測天數無關
+# =====================
+_RESULT_COLUMNS = [("Position", "position"), ("Strategy", "strategy"),
+                   ("DailyReturn", "daily_return")]
+
+def _params_json(params: dict) -> str:
+    # sort_keys：參數順序不同也視為同一組；default=str 處理 numpy 型別
+    return json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+
+def strategy_run_id(stock_code: str, strategy_name: str, params: dict) -> str:
+    key = json.dumps([stock_code, strategy_name, _params_json(params)], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
-    df_to_save = df[["Date", "stock_code", "strategy_name", "params",
-                     "Position", "Strategy", "DailyReturn"]]
-    df_to_save.to_sql("strategy_result", con=engine, if_exists="append", index=False)
+def _pack_array(values) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(values), allow_pickle=False)
+    return zlib.compress(buf.getvalue(), 6)
+
+def _unpack_array(blob: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(zlib.decompress(blob)), allow_pickle=False)
+
+def _strategy_run_row(stock_code: str, strategy_name: str, params: dict, df: pd.DataFrame) -> dict:
+    dates = pd.to_datetime(df.index).values
+    row = {
+        "run_id":        strategy_run_id(stock_code, strategy_name, params),
+        "stock_code":    stock_code,
+        "strategy_name": strategy_name,
+        "params":        _params_json(params),
+        "n_rows":        len(df),
+        "start_date":    pd.Timestamp(dates[0]).strftime('%Y-%m-%d') if len(df) else None,
+        "end_date":      pd.Timestamp(dates[-1]).strftime('%Y-%m-%d') if len(df) else None,
+        "dates":         _pack_array(dates),
+        "created_at":    pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    for col, field in _RESULT_COLUMNS:
+        row[field] = _pack_array(df[col].to_numpy())
+    return row
+
+_INSERT_STRATEGY_RUN_SQL = """
+    {verb} INTO strategy_run (
+        run_id, stock_code, strategy_name, params, n_rows, start_date, end_date,
+        dates, position, strategy, daily_return, created_at
+    ) VALUES (
+        :run_id, :stock_code, :strategy_name, :params, :n_rows, :start_date, :end_date,
+        :dates, :position, :strategy, :daily_return, :created_at
+    )
+"""
+
+# =====================
+# 儲存回測結果
+# =====================
+def save_strategy_result(stock_code: str, strategy_name: str, params: dict, df: pd.DataFrame):
+    """df 需以 Date 為 index，含 Position、Strategy、DailyReturn 欄；同一組參數重存會覆蓋"""
+    engine = _get_engine()
+    init_db()
+    row = _strategy_run_row(stock_code, strategy_name, params, df)
+    with engine.begin() as conn:
+        conn.execute(text(_INSERT_STRATEGY_RUN_SQL.format(verb="INSERT OR REPLACE")), row)
 
 # =====================
 # 讀取回測結果
 # =====================
 def load_strategy_result(stock_code: str, strategy_name: str, params: dict):
-    engine     = _get_engine()
-    params_json = json.dumps(params, ensure_ascii=False)
+    """回傳以 Date 為 index 的 DataFrame（欄位同舊版 strategy_result）；查無結果為空 DataFrame"""
+    engine = _get_engine()
+    init_db()
     query = """
-    SELECT * FROM strategy_result
-    WHERE stock_code = :code AND strategy_name = :name AND params = :params
-    ORDER BY Date ASC
+    SELECT params, dates, position, strategy, daily_return
+    FROM strategy_run WHERE run_id = :run_id
     """
     with engine.connect() as conn:
-        df = pd.read_sql(text(query), conn, params={
-            "code":   stock_code,
-            "name":   strategy_name,
-            "params": params_json,
-        }, parse_dates=["Date"])
-    df.set_index("Date", inplace=True)
+        result = conn.execute(text(query), {
+            "run_id": strategy_run_id(stock_code, strategy_name, params),
+        }).fetchone()
+
+    columns = ["stock_code", "strategy_name", "params"] + [c for c, _ in _RESULT_COLUMNS]
+    if result is None:
+        df = pd.DataFrame(columns=columns)
+        df.index = pd.DatetimeIndex([], name="Date")
+        return df
+
+    data = {col: _unpack_array(getattr(result, field)) for col, field in _RESULT_COLUMNS}
+    df = pd.DataFrame(data, index=pd.DatetimeIndex(_unpack_array(result.dates), name="Date"))
+    df.insert(0, "stock_code", stock_code)
+    df.insert(1, "strategy_name", strategy_name)
+    df.insert(2, "params", result.params)
     return df
+
+# =====================
+# 刪除回測結果 / 列出已存的回測
+# =====================
+def delete_strategy_result(stock_code: str, strategy_name: str, params: dict):
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM strategy_run WHERE run_id = :run_id"), {
+            "run_id": strategy_run_id(stock_code, strategy_name, params),
+        })
+
+def list_strategy_runs(stock_code: str = None) -> pd.DataFrame:
+    """只讀 metadata 欄位，不解壓日序列"""
+    engine = _get_engine()
+    init_db()
+    query  = """
+    SELECT run_id, stock_code, strategy_name, params, n_rows, start_date, end_date, created_at
+    FROM strategy_run
+    """
+    params = {}
+    if stock_code:
+        query += " WHERE stock_code = :code"
+        params["code"] = stock_code
+    query += " ORDER BY created_at DESC"
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+# =====================
+# 回測結果快取（backtest_cache）：依 last_used 做 LRU 淘汰
+# =====================
+def load_cached_backtest(cache_key: str):
+    """命中時回傳 payload（bytes）並更新 last_used，未命中回傳 None"""
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        row = conn.execute(text(
+            "SELECT payload FROM backtest_cache WHERE cache_key = :key"
+        ), {"key": cache_key}).fetchone()
+        if row is None:
+            return None
+        conn.execute(text(
+            "UPDATE backtest_cache SET last_used = :now WHERE cache_key = :key"
+        ), {"key": cache_key, "now": time.time()})
+    return row.payload
+
+def save_cached_backtest(cache_key: str, payload: bytes, max_bytes: int):
+    """寫入快取；總大小超過 max_bytes 時從最久未使用的開始刪除"""
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT OR REPLACE INTO backtest_cache (cache_key, payload, size_bytes, last_used)
+            VALUES (:key, :payload, :size, :now)
+        """), {"key": cache_key, "payload": payload, "size": len(payload), "now": time.time()})
+        total = conn.execute(text(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM backtest_cache"
+        )).scalar()
+        if total <= max_bytes:
+            return
+        rows = conn.execute(text(
+            "SELECT cache_key, size_bytes FROM backtest_cache ORDER BY last_used ASC"
+        )).fetchall()
+        evict = []
+        for key, size in rows:
+            if total <= max_bytes or key == cache_key:
+                break
+            evict.append(key)
+            total -= size
+        if evict:
+            conn.execute(text(
+                "DELETE FROM backtest_cache WHERE cache_key IN :keys"
+            ).bindparams(bindparam("keys", expanding=True)), {"keys": evict})
+
+def clear_backtest_cache():
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM backtest_cache"))
+
+# =====================
+# 參數最佳化紀錄（opt_sweep / opt_result）
+# =====================
+def save_opt_sweep(row: dict):
+    """建立掃描紀錄；已存在時只更新 updated_at"""
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO opt_sweep (sweep_id, symbol, strategy_name, start_date, end_date,
+                                   risk_cfg, context, created_at, updated_at)
+            VALUES (:sweep_id, :symbol, :strategy_name, :start_date, :end_date,
+                    :risk_cfg, :context, :created_at, :created_at)
+            ON CONFLICT (sweep_id) DO UPDATE SET updated_at = excluded.updated_at
+        """), row)
+
+def save_opt_results(sweep_id: str, rows: list):
+    """rows：[(combo_key, params JSON, metrics JSON 或 None)]；已存在的組合不覆蓋"""
+    if not rows:
+        return
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT OR IGNORE INTO opt_result (sweep_id, combo_key, params, metrics)
+            VALUES (:sweep_id, :combo_key, :params, :metrics)
+        """), [{"sweep_id": sweep_id, "combo_key": k, "params": p, "metrics": m} for k, p, m in rows])
+        conn.execute(text("UPDATE opt_sweep SET updated_at = :now WHERE sweep_id = :sweep_id"),
+                     {"sweep_id": sweep_id, "now": pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')})
+
+def load_opt_results(sweep_id: str, combo_keys=None) -> list:
+    """回傳 [(combo_key, params JSON, metrics JSON 或 None)]；combo_keys 為 None 時取整個掃描"""
+    engine = _get_engine()
+    init_db()
+    query = "SELECT combo_key, params, metrics FROM opt_result WHERE sweep_id = :sweep_id"
+    with engine.connect() as conn:
+        if combo_keys is None:
+            return [tuple(r) for r in conn.execute(text(query), {"sweep_id": sweep_id})]
+        keys, rows = list(combo_keys), []
+        stmt = text(query + " AND combo_key IN :keys").bindparams(bindparam("keys", expanding=True))
+        for i in range(0, len(keys), 500):        # SQLite 變數數量上限
+            rows += [tuple(r) for r in conn.execute(stmt, {"sweep_id": sweep_id,
+                                                           "keys": keys[i:i + 500]})]
+        return rows
+
+def list_opt_sweeps(symbol: str = None, strategy_name: str = None) -> pd.DataFrame:
+    """掃描 metadata 與已評估組合數，最近更新的在前"""
+    engine = _get_engine()
+    init_db()
+    query = """
+    SELECT s.sweep_id, s.symbol, s.strategy_name, s.start_date, s.end_date, s.risk_cfg,
+           s.context, s.created_at, s.updated_at, COUNT(r.combo_key) AS n_results
+    FROM opt_sweep s LEFT JOIN opt_result r ON r.sweep_id = s.sweep_id
+    WHERE 1 = 1
+    """
+    params = {}
+    if symbol:
+        query += " AND s.symbol = :symbol"
+        params["symbol"] = symbol
+    if strategy_name:
+        query += " AND s.strategy_name = :strategy_name"
+        params["strategy_name"] = strategy_name
+    query += " GROUP BY s.sweep_id ORDER BY s.updated_at DESC"
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+def delete_opt_sweep(sweep_id: str):
+    engine = _get_engine()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM opt_result WHERE sweep_id = :sweep_id"), {"sweep_id": sweep_id})
+        conn.execute(text("DELETE FROM opt_sweep WHERE sweep_id = :sweep_id"), {"sweep_id": sweep_id})
@@ -0,0 +1,127 @@
+# indicators.py
+# 技術指標共用層：apply_strategy 與參數最佳化都從這裡取 SMA / EMA / 滾動標準差 / RSI
+#
+# 結果以 (序列內容指紋, 指標名稱, 參數) 為 key 暫存在行程內 LRU：
+# 網格搜尋時每個組合都會複製一次 df，但 Close 內容相同，指紋相同，
+# 例如「簡單均線交叉」掃 短期 × 長期 時，每個視窗的 SMA 只計算一次。
+# 股價內容一變指紋就不同，不會取到舊值；舊項目依 LRU 自然淘汰。
+#
+# 回傳的 Series 與快取共用，底層陣列設為唯讀：呼叫端誤改會拋出例外而不會污染快取
+# （指定成 df 欄位或參與運算都會產生新陣列，不受影響）。
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MAX_ENTRIES      = 512
+MAX_MEMORY_BYTES = 128 * 1024 * 1024    # 128 MB（10 年小時線一條指標約 0.7 MB）
+
+_cache       = OrderedDict()   # key -> (Series, nbytes)
+_cache_bytes = 0
+_cache_lock  = threading.Lock()  # Streamlit 各 session 是同一行程的執行緒，共用這份快取
+stats        = {"hits": 0, "misses": 0}
+
+
+def fingerprint(series: pd.Series) -> str:
+    """序列內容（值 + index）的指紋，相同內容的不同副本得到相同結果"""
+    h = hashlib.blake2b(digest_size=16)
+    values = series.to_numpy()
+    if values.dtype.kind in "biuf":
+        h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    else:
+        h.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    index = series.index
+    if isinstance(index, pd.DatetimeIndex):
+        h.update(index.asi8.tobytes())
+    elif isinstance(index, pd.RangeIndex):
+        h.update(repr((index.start, index.stop, index.step)).encode())
+    else:
+        h.update(pd.util.hash_pandas_object(index).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _freeze(result: pd.Series) -> pd.Series:
+    """複製成唯讀陣列，快取中的值無法被呼叫端就地修改"""
+    values = result.to_numpy(copy=True)
+    values.flags.writeable = False
+    return pd.Series(values, index=result.index, name=result.name, copy=False)
+
+
+def _memoize(series: pd.Series, name: str, args: tuple, compute, key: str = None):
+    global _cache_bytes
+    key = (key or fingerprint(series), name, args)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            stats["hits"] += 1
+            return entry[0]
+        stats["misses"] += 1
+    result = _freeze(compute())         # 計算在鎖外進行；兩個 session 同時未命中時各算一次
+    nbytes = result.to_numpy().nbytes   # index 與輸入序列共用，不重複計入
+    with _cache_lock:
+        if key in _cache:
+            _cache_bytes -= _cache.pop(key)[1]
+        _cache[key]   = (result, nbytes)
+        _cache_bytes += nbytes
+        while _cache and (len(_cache) > MAX_ENTRIES or _cache_bytes > MAX_MEMORY_BYTES):
+            _, (_, old_bytes) = _cache.popitem(last=False)
+            _cache_bytes -= old_bytes
+    return result
+
+
+def clear():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+        stats["hits"] = stats["misses"] = 0
+
+
+# =====================
+# 指標（key 可傳入預先算好的 fingerprint，同一序列取多個指標時省去重算）
+# =====================
+def sma(series: pd.Series, window: int, key: str = None) -> pd.Series:
+    return _memoize(series, "sma", (int(window),),
+                    lambda: series.rolling(window=int(window)).mean(), key)
+
+
+def rolling_std(series: pd.Series, window: int, key: str = None) -> pd.Series:
+    return _memoize(series, "std", (int(window),),
+                    lambda: series.rolling(window=int(window)).std(), key)
+
+
+def rolling_max(series: pd.Series, window: int, key: str = None) -> pd.Series:
+    return _memoize(series, "max", (int(window),),
+                    lambda: series.rolling(window=int(window)).max(), key)
+
+
+def rolling_min(series: pd.Series, window: int, key: str = None) -> pd.Series:
+    return _memoize(series, "min", (int(window),),
+                    lambda: series.rolling(window=int(window)).min(), key)
+
+
+def ema(series: pd.Series, span: int, key: str = None) -> pd.Series:
+    return _memoize(series, "ema", (int(span),),
+                    lambda: series.ewm(span=int(span), adjust=False).mean(), key)
+
+
+def pct_change(series: pd.Series, periods: int, key: str = None) -> pd.Series:
+    return _memoize(series, "pct_change", (int(periods),),
+                    lambda: series.pct_change(periods=int(periods)), key)
+
+
+def rsi(series: pd.Series, period: int, key: str = None) -> pd.Series:
+    """簡單平均版 RSI（漲跌幅各取 period 日滾動平均），與原本 apply_strategy 內的算法相同"""
+    def compute():
+        delta = series.diff()
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        avg_gain = gain.rolling(int(period)).mean()
+        avg_loss = loss.rolling(int(period)).mean()
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+    return _memoize(series, "rsi", (int(period),), compute, key)
@@ -0,0 +1,129 @@
+# opt_store.py
+# 參數最佳化紀錄：每次掃描以「標的 + 策略 + 日期區間 + 成本設定 + 股價指紋」的雜湊為 sweep_id，
+# 每組參數（含出場條件）的績效以 combo_key 存進 SQLite opt_result 表（database.py），
+# 無效組合也記錄（metrics 為 NULL），之後同樣略過。
+#
+#   續跑：頁面重跑或瀏覽器斷線後再按一次最佳化，已評估的組合直接取回，只回測剩下的
+#   去重：同一組參數（鍵順序不同、numpy 型別）只存一次，搜尋模式重複提出的組合不會重算
+#   重新載入：list_sweeps / load_sweep 不需股價資料，直接取回過往掃描的結果表畫熱力圖
+# 股價內容改變（資料修正、K 線尚未收完）指紋就不同，會開一個新的掃描，不會混用舊結果。
+
+import hashlib
+import json
+
+import pandas as pd
+
+from backtest_cache import price_fingerprint
+from database import (delete_opt_sweep, list_opt_sweeps, load_opt_results, save_opt_results,
+                      save_opt_sweep)
+
+# 回測或績效計算邏輯變更時調高版本，讓舊紀錄不再被續跑取用（仍可在過往紀錄中載入）
+STORE_VERSION = 2    # 2：Supertrend ATR 暖身期不再讓軌道一路沿用 NaN
+
+
+def _json(obj) -> str:
+    # sort_keys：鍵順序不同也視為同一組；numpy 純量轉成 Python 數值
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True,
+                      default=lambda v: v.item() if hasattr(v, "item") else str(v))
+
+
+def combo_key(params: dict) -> str:
+    return hashlib.sha1(_json(params).encode("utf-8")).hexdigest()
+
+
+def sweep_id(symbol: str, strategy_name: str, start_date, end_date, risk_cfg: dict = None,
+             prices: pd.DataFrame = None, **context) -> str:
+    payload = _json({
+        "version":  STORE_VERSION,
+        "symbol":   symbol,
+        "strategy": strategy_name,
+        "range":    [str(start_date), str(end_date)],
+        "risk":     risk_cfg or {},
+        "prices":   price_fingerprint(prices) if prices is not None else None,
+        "context":  context,
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def open_sweep(symbol: str, strategy_name: str, start_date, end_date, risk_cfg: dict = None,
+               prices: pd.DataFrame = None, **context) -> str:
+    """
+    建立（或接續）一次掃描，回傳 sweep_id。
+    context 為其他會影響結果的設定，例如 trading_days、K 線週期。
+    """
+    sid = sweep_id(symbol, strategy_name, start_date, end_date, risk_cfg, prices, **context)
+    save_opt_sweep({
+        "sweep_id":      sid,
+        "symbol":        symbol,
+        "strategy_name": strategy_name,
+        "start_date":    str(start_date),
+        "end_date":      str(end_date),
+        "risk_cfg":      _json(risk_cfg or {}),
+        "context":       _json(context),
+        "created_at":    pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    return sid
+
+
+def lookup(sweep: str, rows: list):
+    """
+    rows：參數 dict 清單 → (results, missing)
+      results : 與 rows 等長，已評估者為績效 dict（無效組合為 None），未評估者為 None
+      missing : 尚未評估的 rows 位置
+    """
+    keys   = [combo_key(r) for r in rows]
+    stored = {k: (json.loads(m) if m else None) for k, _, m in load_opt_results(sweep, set(keys))}
+    results = [stored.get(k) for k in keys]
+    missing = [i for i, k in enumerate(keys) if k not in stored]
+    return results, missing
+
+
+def record(sweep: str, rows: list, metrics: list):
+    """寫入 rows 對應的績效（None = 無效組合）；已存在的組合不覆蓋"""
+    save_opt_results(sweep, [(combo_key(r), _json(r), _json(m) if m else None)
+                             for r, m in zip(rows, metrics)])
+
+
+def cached_evaluate(sweep: str, evaluate, full_data):
+    """
+    包裝 search_parameters 的 evaluate(combos, data)：data 為全期間資料時，
+    已評估的組合直接取回、同一批重複的組合只回測一次，新結果立即寫入；
+    逐步減半的資料子集結果不記錄。stats 記錄取回與實際回測的組合數。
+    """
+    stats = {"reused": 0, "evaluated": 0}
+
+    def wrapped(combos, data):
+        if data is not full_data:
+            return evaluate(combos, data)
+        keys  = [combo_key(c) for c in combos]
+        results, missing = lookup(sweep, combos)
+        first = {}
+        for i in missing:
+            first.setdefault(keys[i], i)
+        todo  = list(first.values())
+        fresh = list(evaluate([combos[i] for i in todo], data)) if todo else []
+        record(sweep, [combos[i] for i in todo], fresh)
+        by_key = dict(zip((keys[i] for i in todo), fresh))
+        for i in missing:
+            results[i] = by_key[keys[i]]
+        stats["reused"]    += len(combos) - len(missing)
+        stats["evaluated"] += len(todo)
+        return results
+
+    wrapped.stats = stats
+    return wrapped
+
+
+def list_sweeps(symbol: str = None, strategy_name: str = None) -> pd.DataFrame:
+    """過往掃描清單（不含結果），最近更新的在前"""
+    return list_opt_sweeps(symbol, strategy_name)
+
+
+def load_sweep(sweep: str) -> pd.DataFrame:
+    """過往掃描中有效組合的結果表：參數欄 + 績效欄（與頁面 df_opt 相同格式）"""
+    rows = [{**json.loads(p), **json.loads(m)} for _, p, m in load_opt_results(sweep) if m]
+    return pd.DataFrame(rows)
+
+
+def delete_sweep(sweep: str):
+    delete_opt_sweep(sweep)
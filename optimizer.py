@@ -0,0 +1,928 @@
+# optimizer.py
+# 參數最佳化引擎：台股回測頁的 Grid Search 從這裡取回測與績效
+#
+# 單行程：run_backtest_batch 以 batch_positions 一次算出整個網格的持倉矩陣，逐組只剩成本與績效
+# 多行程：parallel_grid_search 把股價欄位放進 multiprocessing 共享記憶體，
+#         worker 行程啟動時掛上同一塊記憶體重建 df（不必每個任務 pickle 一次股價），
+#         參數組合切成 chunk 分送，每個 chunk 完成就回傳，頁面依此更新進度條
+# worker 以 spawn 啟動（Streamlit 行程內 fork 不安全），會 import crypto_strategy，
+# 因此內建策略與虛擬幣策略都能在 worker 內以名稱取得。
+# 搜尋模式：search_parameters 在評估預算內以粗網格細化、逐步減半或 TPE 取樣逼近網格最佳解，
+#           回測本身由頁面提供的 evaluate 批次函式執行（台股頁走 parallel_grid_search）
+# Walk-forward：walk_forward 把歷史切成滾動 / 錨定的訓練、測試視窗，各視窗選出最佳參數後
+#               串接樣本外報酬；每組參數的逐根報酬只在全期間算一次，各視窗只做切片與績效
+# 跨交易對：cross_symbol_search 把每個交易對各放一塊共享記憶體，「交易對 × 參數 chunk」分給 worker，
+#           每組參數以各交易對績效的聚合分數（中位數夏普、最差回撤…）排序
+# 提前淘汰：pruned_grid_search 依時間分段回測，回撤已不可能進榜（或超過回撤上限）的組合提早停止
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from itertools import product
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from risk import (DEFAULT_FEE_STOCK, DEFAULT_TAX_STOCK, apply_costs, apply_friction_and_risk,
+                  average_true_range, batch_performance, calc_performance, format_performance,
+                  price_columns_for, signal_array, stop_positions)
+from strategy import batch_positions, strategy_positions
+
+TRADING_DAYS = 240
+
+# 組合數（含出場條件展開）少於此值時直接單行程計算，行程啟動成本比計算還高
+MIN_PARALLEL_ROWS = 200
+# 每個 worker 平均分到的 chunk 數：越多負載越平均，但每個 chunk 都要重算一次共用指標
+CHUNKS_PER_WORKER = 4
+MAX_CHUNK_SIZE    = 256
+
+
+# =====================
+# 單行程回測（頁面與 worker 共用）
+# =====================
+def run_backtest(df, strategy_name, params, risk_cfg=None, trading_days=TRADING_DAYS):
+    # 精簡模式：只取持倉，不複製整個 df、不寫入指標欄位
+    try:
+        position, _ = strategy_positions(df, strategy_name, params)
+    except Exception:
+        return None
+    df_s = df[price_columns_for(df, risk_cfg)].copy()
+    df_s['Position'] = position
+    return backtest_metrics(df_s, risk_cfg, trading_days)
+
+
+def run_backtest_batch(df, strategy_name, combos, risk_cfg=None, exit_grid=None,
+                       trading_days=TRADING_DAYS):
+    """
+    整個參數網格一次回測：支援批次的策略先以 batch_positions 算出持倉矩陣，
+    再逐欄計算績效（結果與逐組 run_backtest 相同）；其餘策略逐組呼叫 run_backtest。
+    exit_grid 為出場條件覆寫清單（apply_friction_and_risk 參數），每組參數的持倉只算一次，
+    再依序套用每種出場條件，順序為「參數 × 出場條件」。
+    逐筆 yield 績效 dict（無效組合為 None），方便頁面更新進度條。
+    """
+    cfgs = [{**(risk_cfg or {}), **e} for e in exit_grid] if exit_grid else [risk_cfg]
+    try:
+        positions, valid = batch_positions(df, strategy_name, combos)
+    except Exception:
+        for test_params in combos:
+            for cfg in cfgs:
+                yield run_backtest(df, strategy_name, test_params, cfg, trading_days)
+        return
+    if not any(cfgs):
+        yield from batch_metrics(df, positions, valid, trading_days)
+        return
+    base = df[price_columns_for(df, *cfgs)].copy()
+    for j in range(len(combos)):
+        for cfg in cfgs:
+            if not valid[j]:
+                yield None
+                continue
+            df_s = base.copy()
+            df_s['Position'] = positions[:, j]
+            yield backtest_metrics(df_s, cfg, trading_days)
+
+
+def batch_metrics(df, positions, valid, trading_days=TRADING_DAYS):
+    """
+    無成本設定時的矩陣版 backtest_metrics：整個持倉矩陣一次算出策略報酬，
+    再以 batch_performance 一次算出所有組合的績效（與逐組結果相同）。
+    """
+    daily = df['Close'].pct_change().to_numpy()
+    keep  = ~np.isnan(daily)
+    keep[keep] &= np.abs(daily[keep]) < 0.5
+    if not keep.any():
+        for _ in range(positions.shape[1]):
+            yield None
+        return
+    prev_pos = np.empty(positions.shape, dtype=float)
+    prev_pos[0]  = np.nan
+    prev_pos[1:] = positions[:-1]
+    returns = prev_pos[keep] * daily[keep, None]
+    stats   = batch_performance(returns, positions[keep], trading_days=trading_days)
+    for j in range(positions.shape[1]):
+        yield format_performance(stats, j) if valid[j] else None
+
+
+def backtest_metrics(df_s, risk_cfg=None, trading_days=TRADING_DAYS):
+    """已有 Position 欄的 df → 套用成本 / 停損停利 → 績效 dict（無有效資料為 None）"""
+    if risk_cfg:
+        df_s = apply_friction_and_risk(df_s, **risk_cfg)
+    else:
+        df_s['DailyReturn'] = df_s['Close'].pct_change()
+        df_s['Strategy']    = df_s['Position'].shift(1) * df_s['DailyReturn']
+    df_s['DailyReturn'] = df_s['Close'].pct_change()
+    df_s = df_s.dropna(subset=['DailyReturn', 'Strategy'])
+    df_s = df_s[df_s['DailyReturn'].abs() < 0.5]
+    if df_s.empty:
+        return None
+    return calc_performance(df_s, trading_days)
+
+
+# =====================
+# 共享記憶體中的股價
+# =====================
+class SharedPrices:
+    """
+    把 df 的數值欄位（與 DatetimeIndex）複製進一塊 SharedMemory，
+    spec 可 pickle 傳給 worker，worker 以 attach_prices(spec) 重建 df。
+    建立者負責 close()（同時 unlink）；可當 context manager 使用。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        columns = [c for c in df.columns if df[c].dtype.kind in "biuf"]
+        arrays  = [np.ascontiguousarray(df[c].to_numpy()) for c in columns]
+        index   = df.index
+        is_dt   = isinstance(index, pd.DatetimeIndex)
+        if is_dt:
+            arrays.append(np.ascontiguousarray(index.asi8))   # tz-aware 時為 UTC
+
+        layout, offset = [], 0
+        for arr in arrays:
+            layout.append((arr.dtype.str, offset, len(arr)))
+            offset += arr.nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for arr, (dtype, start, length) in zip(arrays, layout):
+            np.ndarray(length, dtype=dtype, buffer=self._shm.buf, offset=start)[:] = arr
+
+        self.spec = {
+            "name":    self._shm.name,
+            "columns": columns,
+            "layout":  layout,
+            # 日期 index 走共享記憶體；其他 index 很少見，直接隨 spec pickle
+            "index":   {"name": index.name, "unit": index.unit, "freq": index.freqstr,
+                        "tz": str(index.tz) if index.tz else None} if is_dt else index,
+        }
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_prices(spec: dict):
+    """依 spec 掛上共享記憶體並重建 df，回傳 (df, shm)；shm 需保留到不再使用 df 為止"""
+    shm    = shared_memory.SharedMemory(name=spec["name"])
+    arrays = [np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)
+              for dtype, start, length in spec["layout"]]
+    index  = spec["index"]
+    if isinstance(index, dict):
+        values = arrays.pop().view(f"M8[{index['unit']}]")
+        dt     = pd.DatetimeIndex(values, name=index["name"])
+        if index["tz"]:
+            dt = dt.tz_localize("UTC").tz_convert(index["tz"])
+        index  = pd.DatetimeIndex(dt, freq=index["freq"])
+    df = pd.DataFrame(dict(zip(spec["columns"], arrays)), index=index, copy=False)
+    return df, shm
+
+
+# =====================
+# worker 行程
+# =====================
+_worker_df     = None
+_worker_frames = {}             # 多個交易對時：{名稱: df}
+_worker_shm    = []
+
+
+def _init_worker(specs: dict):
+    """specs 為 {名稱: SharedPrices.spec}；單一 df 時名稱為 None，掛在 _worker_df"""
+    global _worker_df
+    import crypto_strategy  # noqa: F401  註冊虛擬幣策略，讓 worker 也能以名稱取得
+    for name, spec in specs.items():
+        _worker_frames[name], shm = attach_prices(spec)
+        _worker_shm.append(shm)
+    _worker_df = _worker_frames.get(None)
+
+
+def _evaluate_chunk(start, strategy_name, combos, risk_cfg, exit_grid, trading_days):
+    results = list(run_backtest_batch(_worker_df, strategy_name, combos, risk_cfg,
+                                      exit_grid, trading_days))
+    return start, results
+
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def _chunk_size(n_combos: int, workers: int) -> int:
+    return max(1, min(MAX_CHUNK_SIZE, math.ceil(n_combos / (workers * CHUNKS_PER_WORKER))))
+
+
+def parallel_grid_search(df, strategy_name, combos, risk_cfg=None, exit_grid=None,
+                         workers=None, chunk_size=None, trading_days=TRADING_DAYS):
+    """
+    多行程版 run_backtest_batch，結果與單行程相同。
+    組合依序切成 chunk，完成一個 yield 一次 (start, results)：
+      start   : 此 chunk 第一筆在「參數 × 出場條件」展開後的位置
+      results : 績效 dict 清單（無效組合為 None），長度 = chunk 組合數 × 出場條件數
+    chunk 完成順序不固定，呼叫端依 start 放回原位。
+    workers <= 1 或組合太少時直接在目前行程計算（仍以 chunk 為單位 yield）。
+    """
+    combos   = list(combos)
+    n_exits  = max(len(exit_grid or []), 1)
+    workers  = default_workers() if workers is None else max(1, int(workers))
+    workers  = min(workers, len(combos)) if combos else 1
+    size     = chunk_size or _chunk_size(len(combos), workers)
+    chunks   = [(i, combos[i:i + size]) for i in range(0, len(combos), size)]
+
+    if workers <= 1 or len(combos) * n_exits < MIN_PARALLEL_ROWS:
+        for i, chunk in chunks:
+            yield i * n_exits, list(run_backtest_batch(df, strategy_name, chunk, risk_cfg,
+                                                       exit_grid, trading_days))
+        return
+
+    yield from _map_chunks(df, _evaluate_chunk, workers,
+                           [(i * n_exits, strategy_name, chunk, risk_cfg, exit_grid, trading_days)
+                            for i, chunk in chunks])
+
+
+def _map_chunks(data, fn, workers, jobs):
+    """
+    以掛上共享股價的 spawn 行程池執行 fn(*job)，依完成順序 yield 回傳值。
+    data 為 df，或 {名稱: df}（每個 df 各放一塊共享記憶體，worker 以 _worker_frames[名稱] 取用）
+    """
+    frames = data if isinstance(data, dict) else {None: data}
+    with ExitStack() as stack:
+        specs = {name: stack.enter_context(SharedPrices(df)).spec for name, df in frames.items()}
+        pool  = stack.enter_context(ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn"),
+            initializer=_init_worker, initargs=(specs,)))
+        futures = [pool.submit(fn, *job) for job in jobs]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+# =====================
+# 參數空間與最佳化目標（台股、虛擬幣頁共用）
+# =====================
+# 最佳化目標 → (績效欄位, 是否由小到大排序)
+# 最大回撤為負值，「最小化回撤」= 越接近 0 越好，因此同樣由大到小排序
+OPT_TARGETS = {
+    "夏普比率":              ("夏普比率", False),
+    "累積報酬率(%)":         ("累積報酬率(%)", False),
+    "最大回撤(%)（最小化）": ("最大回撤(%)", False),
+}
+
+
+def grid_values(opt_ranges: dict) -> dict:
+    """opt_ranges {參數: (型別, 最小, 最大, 步長)} → {參數: 候選值清單}"""
+    space = {}
+    for param, (dtype, p_min, p_max, p_step) in opt_ranges.items():
+        space[param] = list(range(int(p_min), int(p_max) + 1, int(p_step))) if dtype == "int" \
+                       else [round(v, 4) for v in np.arange(p_min, p_max + p_step * 0.5, p_step)]
+    return space
+
+
+def target_score(metrics, opt_target: str) -> float:
+    """績效 dict → 越大越好的分數，無效結果為 -inf"""
+    if not metrics:
+        return -np.inf
+    column, ascending = OPT_TARGETS[opt_target]
+    value = metrics.get(column)
+    if value is None or not np.isfinite(value):
+        return -np.inf
+    return -value if ascending else value
+
+
+def rank_results(df_opt: pd.DataFrame, opt_target: str) -> pd.DataFrame:
+    column, ascending = OPT_TARGETS[opt_target]
+    return df_opt.sort_values(column, ascending=ascending, kind="stable")
+
+
+# =====================
+# 搜尋模式：在預算內以較少回測次數逼近網格最佳解
+# =====================
+SEARCH_MODES = {
+    "grid":    "網格搜尋（全部組合）",
+    "coarse":  "粗網格後細化",
+    "halving": "逐步減半（資料子集）",
+    "tpe":     "貝氏最佳化（TPE）",
+}
+
+
+class _BudgetedEvaluator:
+    """
+    以參數索引 tuple 表示組合，記錄已評估結果與預算使用量。
+    evaluate(combos, data) 為頁面提供的批次回測函式，回傳與 combos 等長的績效 dict 清單。
+    """
+
+    def __init__(self, space, evaluate, data, opt_target, budget, progress=None):
+        self.names      = list(space)
+        self.values     = [list(v) for v in space.values()]
+        self.sizes      = [len(v) for v in self.values]
+        self.evaluate   = evaluate
+        self.data       = data
+        self.opt_target = opt_target
+        self.budget     = int(budget)
+        self.progress   = progress
+        self.used       = 0
+        self.bars       = 0             # 實際回測的 K 棒數（子集評估較少）
+        self.full       = {}            # 索引 tuple → 全期間績效
+
+    @property
+    def remaining(self) -> int:
+        return max(self.budget - self.used, 0)
+
+    @property
+    def total(self) -> int:
+        return int(np.prod(self.sizes)) if self.sizes else 0
+
+    def params(self, idx) -> dict:
+        return {name: self.values[d][i] for d, (name, i) in enumerate(zip(self.names, idx))}
+
+    def _call(self, idxs, data):
+        idxs    = idxs[:self.remaining]
+        metrics = list(self.evaluate([self.params(ix) for ix in idxs], data)) if idxs else []
+        self.used += len(idxs)
+        self.bars += len(idxs) * len(data)
+        if self.progress:
+            self.progress(self.used, self.budget)
+        return idxs, metrics
+
+    def run(self, idxs) -> list:
+        """全期間評估尚未評估過的組合（受預算限制），回傳各組合分數"""
+        todo = [ix for ix in dict.fromkeys(idxs) if ix not in self.full]
+        for ix, m in zip(*self._call(todo, self.data)):
+            self.full[ix] = m
+        return [self.score(ix) for ix in idxs]
+
+    def run_subset(self, idxs, data) -> list:
+        """在資料子集上評估（不寫入全期間結果），回傳分數；超出預算的組合記 -inf"""
+        done, metrics = self._call(list(idxs), data)
+        scores = [target_score(m, self.opt_target) for m in metrics]
+        return scores + [-np.inf] * (len(idxs) - len(done))
+
+    def score(self, ix) -> float:
+        return target_score(self.full.get(ix), self.opt_target)
+
+    def top(self, k: int) -> list:
+        ranked = sorted(self.full, key=self.score, reverse=True)
+        return [ix for ix in ranked[:k] if np.isfinite(self.score(ix))]
+
+    def sample(self, n: int, rng) -> list:
+        """不重複隨機抽 n 個組合"""
+        flat = rng.choice(self.total, size=min(n, self.total), replace=False)
+        return [tuple(int(i) for i in ix) for ix in zip(*np.unravel_index(flat, self.sizes))]
+
+    def results(self) -> list:
+        return [(self.params(ix), m) for ix, m in self.full.items() if m]
+
+
+def _all_indices(sizes) -> list:
+    return list(product(*[range(n) for n in sizes]))
+
+
+def grid_search(ev: _BudgetedEvaluator, **_):
+    ev.run(_all_indices(ev.sizes))
+
+
+def coarse_to_fine_search(ev: _BudgetedEvaluator, top_k: int = 3, **_):
+    """
+    先以大步長掃過約一半預算的粗網格，再在目前前 top_k 名附近以同一步長做 pattern search，
+    附近都評估過就把步長減半；步長 1 仍有預算時加倍 top_k，直到預算用完或全部評估過。
+    """
+    stride = [1] * len(ev.sizes)
+    coarse = lambda: math.prod(math.ceil(n / s) for n, s in zip(ev.sizes, stride))
+    while coarse() > max(ev.budget // 2, 1):
+        d = max(range(len(stride)), key=lambda k: math.ceil(ev.sizes[k] / stride[k]))
+        if math.ceil(ev.sizes[d] / stride[d]) <= 1:
+            break
+        stride[d] += 1
+    ev.run(list(product(*[range(0, n, s) for n, s in zip(ev.sizes, stride)])))
+
+    while ev.remaining > 0:
+        new = []
+        for best in ev.top(top_k):
+            for off in product(*[(-s, 0, s) for s in stride]):
+                ix = tuple(min(max(b + o, 0), n - 1) for b, o, n in zip(best, off, ev.sizes))
+                if ix not in ev.full and ix not in new:
+                    new.append(ix)
+        if new:
+            ev.run(new)
+        elif max(stride) > 1:
+            stride = [max(1, s // 2) for s in stride]
+        elif top_k < len(ev.full):
+            top_k *= 2                  # 前幾名附近都看過了，預算還有剩就擴大細化範圍
+        else:
+            break
+
+
+def successive_halving_search(ev: _BudgetedEvaluator, rng=None, eta: int = 3,
+                              fractions=(0.25, 0.5, 1.0), **_):
+    """
+    隨機抽 n0 組，先在最近 25% 的資料上回測，保留前 1/eta 進到 50%，再保留前 1/eta 跑全期間。
+    n0 依預算決定：n0 × (1 + 1/eta + 1/eta²) ≈ budget。
+    """
+    n0   = math.ceil(ev.budget / sum(eta ** -k for k in range(len(fractions))))
+    cand = ev.sample(n0, rng)
+    for r, frac in enumerate(fractions):
+        if frac >= 1:
+            ev.run(cand)
+            return
+        subset = ev.data.iloc[-max(int(len(ev.data) * frac), 1):]
+        scores = ev.run_subset(cand, subset)
+        keep   = max(1, math.ceil(len(cand) / eta))
+        order  = sorted(range(len(cand)), key=lambda j: scores[j], reverse=True)[:keep]
+        cand   = [cand[j] for j in sorted(order)]
+
+
+def _parzen(points, n: int, prior: float = 1.0) -> np.ndarray:
+    """索引 0..n-1 上的離散 Parzen 密度：每個觀測點一個高斯核 + 均勻先驗"""
+    grid = np.arange(n)
+    bw   = max(1.0, n / (len(points) + 1) ** 0.5 / 2)
+    dens = np.full(n, prior / n)
+    if len(points):
+        pts  = np.asarray(points, dtype=float)[:, None]
+        dens = dens + np.exp(-0.5 * ((grid - pts) / bw) ** 2).sum(axis=0) / (bw * (2 * np.pi) ** 0.5)
+    return dens / dens.sum()
+
+
+def tpe_search(ev: _BudgetedEvaluator, rng=None, batch: int = 8, gamma: float = 0.25,
+               n_candidates: int = 32, **_):
+    """
+    Tree-structured Parzen Estimator：先隨機評估約 1/4 預算，之後每輪把結果分成
+    前 gamma 的好組合與其餘組合，各維度分別以 Parzen 密度 l(x)、g(x) 估計，
+    從 l(x) 抽 n_candidates 個候選，取 l(x)/g(x) 最大且未評估過的組合；每輪一次評估 batch 組。
+    """
+    ev.run(ev.sample(max(batch, ev.budget // 4), rng))
+    while ev.remaining > 0:
+        ranked = sorted(ev.full, key=ev.score, reverse=True)
+        n_good = max(1, math.ceil(gamma * len(ranked)))
+        good, bad = ranked[:n_good], ranked[n_good:]
+        l = [_parzen([ix[d] for ix in good], n) for d, n in enumerate(ev.sizes)]
+        g = [_parzen([ix[d] for ix in bad],  n) for d, n in enumerate(ev.sizes)]
+
+        proposals = []
+        for _ in range(min(batch, ev.remaining)):
+            cands = list(zip(*[rng.choice(n, size=n_candidates, p=l[d])
+                               for d, n in enumerate(ev.sizes)]))
+            cands = [tuple(int(i) for i in c) for c in cands]
+            cands = [c for c in dict.fromkeys(cands) if c not in ev.full and c not in proposals]
+            if not cands:
+                continue
+            ratio = [sum(np.log(l[d][i]) - np.log(g[d][i]) for d, i in enumerate(c)) for c in cands]
+            proposals.append(cands[int(np.argmax(ratio))])
+        if not proposals:
+            unseen = [ix for ix in ev.sample(ev.total, rng) if ix not in ev.full]
+            if not unseen:
+                break
+            proposals = unseen[:batch]
+        ev.run(proposals)
+
+
+_SEARCHERS = {
+    "grid":    grid_search,
+    "coarse":  coarse_to_fine_search,
+    "halving": successive_halving_search,
+    "tpe":     tpe_search,
+}
+
+
+def search_parameters(mode: str, space: dict, evaluate, data, opt_target: str,
+                      budget: int = None, seed: int = 0, progress=None) -> dict:
+    """
+    依搜尋模式在參數空間中找最佳組合。
+      space    : {參數: 候選值清單}（見 grid_values）
+      evaluate : evaluate(combos, data) → 與 combos 等長的績效 dict 清單（無效為 None）
+      data     : 全期間股價 df；逐步減半會取最近一段子集傳給 evaluate
+      budget   : 最多回測次數（含子集評估），None 或大於組合總數時等同網格搜尋
+      progress : progress(已用次數, 預算) 回呼，頁面用來更新進度條
+    回傳 {"results": [(參數 dict, 全期間績效 dict)], "evaluations": 回測次數,
+          "bar_evaluations": 回測 K 棒總數, "total": 網格組合總數}
+    """
+    if mode not in _SEARCHERS:
+        raise ValueError(f"未知的搜尋模式：{mode}")
+    total = math.prod(len(v) for v in space.values())
+    if mode == "grid" or budget is None or budget >= total:
+        mode, budget = "grid", total
+    ev = _BudgetedEvaluator(space, evaluate, data, opt_target, max(int(budget), 1), progress)
+    _SEARCHERS[mode](ev, rng=np.random.default_rng(seed))
+    return {"results": ev.results(), "evaluations": ev.used,
+            "bar_evaluations": ev.bars, "total": total}
+
+
+# =====================
+# Walk-forward 樣本外驗證
+# =====================
+# 指標都只看過去的 K 棒，全期間算一次的持倉在任何視窗內都與「只給到該視窗結尾的資料」相同，
+# 且不必在每個視窗重新暖身。每組參數的逐根報酬算一次後，各視窗只是切片再算績效，
+# 因此 10 折 walk-forward 的成本約等於一次全期間網格掃描 + 10 次矩陣版績效計算。
+# 注意：視窗開頭可能延續視窗之前已持有的部位（與策略實際持續執行時相同）。
+WF_MIN_TEST_BARS = 20
+
+
+def walk_forward_windows(n_bars: int, n_folds: int = 5, train_ratio: float = 0.75,
+                         anchored: bool = False) -> list:
+    """
+    切出 n_folds 個訓練 / 測試視窗，回傳 [(訓練起, 訓練迄, 測試起, 測試迄)]（位置，左閉右開）。
+    測試視窗依序接續、最後一個結束於資料尾端；訓練長度 : 測試長度 = train_ratio : 1 - train_ratio。
+    anchored=True 時訓練視窗一律從第 0 根開始（錨定），否則固定長度往後滾動。
+    """
+    if not 0 < train_ratio < 1:
+        raise ValueError("訓練比例需介於 0 與 1 之間")
+    if n_folds < 1:
+        raise ValueError("折數需至少為 1")
+    test_len  = int(n_bars // (train_ratio / (1 - train_ratio) + n_folds))
+    if test_len < WF_MIN_TEST_BARS:
+        raise ValueError(f"資料只有 {n_bars} 根，切成 {n_folds} 折後每個測試視窗不足 "
+                         f"{WF_MIN_TEST_BARS} 根")
+    train_len = n_bars - n_folds * test_len
+    windows   = []
+    for k in range(n_folds):
+        test_start = train_len + k * test_len
+        train_start = 0 if anchored else test_start - train_len
+        windows.append((train_start, test_start, test_start, test_start + test_len))
+    return windows
+
+
+def strategy_returns(df, strategy_name, combos, risk_cfg=None):
+    """
+    全期間一次算出每組參數的逐根策略報酬。
+    回傳 (returns, positions, costs, keep, valid)：
+      returns / positions / costs : bars × 組合（positions 為成本設定調整後的實際持倉）
+      keep  : 計入績效的列（排除規則與 backtest_metrics 相同：首根、單根漲跌 >= 50%）
+      valid : 有效組合
+    所有陣列都與 df 逐列對齊；有成本設定時收盤價缺值的列與 run_backtest_batch 相同，
+    先剔除再計算成本與停損（報酬跨過缺值列），這些列的 keep 為 False。
+    """
+    positions, valid = batch_positions(df, strategy_name, combos)
+    close = df['Close']
+    daily = close.pct_change().to_numpy()
+    keep  = ~np.isnan(daily)
+    keep[keep] &= np.abs(daily[keep]) < 0.5
+    if not risk_cfg:
+        returns = np.zeros(positions.shape)
+        returns[1:] = positions[:-1] * daily[1:, None]
+        return returns, positions, None, keep, valid
+
+    # apply_friction_and_risk 會剔除收盤價缺值的列，先挑出保留的列，結果再放回原位
+    rows    = np.flatnonzero(pd.to_numeric(close, errors='coerce').notna().to_numpy())
+    base    = df[price_columns_for(df, risk_cfg)].iloc[rows]
+    if len(rows) < len(df):
+        kept_daily = pd.to_numeric(base['Close'], errors='coerce').pct_change().to_numpy()
+        keep       = np.zeros(len(df), dtype=bool)
+        keep[rows] = ~np.isnan(kept_daily) & (np.abs(kept_daily) < 0.5)
+    returns = np.zeros(positions.shape)
+    costs   = np.zeros(positions.shape)
+    adj     = np.zeros(positions.shape, dtype=np.int64)
+    for j in np.flatnonzero(valid):
+        df_s = apply_friction_and_risk(base.assign(Position=positions[rows, j]), **risk_cfg)
+        returns[rows, j] = df_s['Strategy'].to_numpy()
+        costs[rows, j]   = df_s['TradeCost'].to_numpy()
+        adj[rows, j]     = df_s['Position_adj'].to_numpy()
+    return returns, adj, costs, keep, valid
+
+
+def window_metrics(returns, positions, costs, keep, windows, trading_days=TRADING_DAYS):
+    """各視窗 [起, 迄) 的矩陣版績效 → [batch_performance 結果]（每個視窗一個 dict）"""
+    stats = []
+    for start, stop in windows:
+        rows = np.flatnonzero(keep[start:stop]) + start
+        stats.append(batch_performance(returns[rows], positions[rows],
+                                       costs[rows] if costs is not None else None, trading_days))
+    return stats
+
+
+def _window_scores(df, strategy_name, combos, risk_cfg, windows, opt_target, trading_days):
+    """各訓練視窗內每組參數的分數（n_windows × 組合，無效組合為 -inf）"""
+    returns, positions, costs, keep, valid = strategy_returns(df, strategy_name, combos, risk_cfg)
+    scores = np.full((len(windows), len(combos)), -np.inf)
+    for w, stats in enumerate(window_metrics(returns, positions, costs, keep, windows, trading_days)):
+        for j in np.flatnonzero(valid):
+            scores[w, j] = target_score(format_performance(stats, j), opt_target)
+    return scores
+
+
+def _score_windows_chunk(start, strategy_name, combos, risk_cfg, windows, opt_target, trading_days):
+    return start, _window_scores(_worker_df, strategy_name, combos, risk_cfg, windows,
+                                 opt_target, trading_days)
+
+
+def walk_forward(df, strategy_name, combos, opt_target="夏普比率", risk_cfg=None, n_folds=5,
+                 train_ratio=0.75, anchored=False, workers=None, chunk_size=None,
+                 trading_days=TRADING_DAYS, progress=None):
+    """
+    Walk-forward 最佳化：每個訓練視窗以 opt_target 選出最佳參數，套用到接續的測試視窗，
+    再把各測試視窗的樣本外報酬串成一條權益曲線。
+    參數組合切成 chunk 分給 worker（與 parallel_grid_search 相同的共享記憶體行程池），
+    每個 chunk 一次算出所有訓練視窗的分數；progress(完成組合數, 總組合數) 用來更新進度條。
+    回傳 dict：
+      folds       : 每折一筆 {折, 訓練期間, 測試期間, 參數, 訓練績效, 測試績效}
+      oos         : 樣本外逐根 df（Strategy、Position、TradeCost、Fold）
+      oos_metrics : 樣本外串接後的績效 dict
+      efficiency  : walk-forward 效率（測試夏普平均 / 訓練夏普平均，訓練平均 <= 0 時為 None）
+    """
+    combos  = list(combos)
+    windows = walk_forward_windows(len(df), n_folds, train_ratio, anchored)
+    train   = [(a, b) for a, b, _, _ in windows]
+    workers = default_workers() if workers is None else max(1, int(workers))
+    workers = min(workers, len(combos)) if combos else 1
+    size    = chunk_size or _chunk_size(len(combos), workers)
+    jobs    = [(i, strategy_name, combos[i:i + size], risk_cfg, train, opt_target, trading_days)
+               for i in range(0, len(combos), size)]
+
+    if workers <= 1 or len(combos) < MIN_PARALLEL_ROWS:
+        chunks = ((job[0], _window_scores(df, *job[1:])) for job in jobs)
+    else:
+        chunks = _map_chunks(df, _score_windows_chunk, workers, jobs)
+    scores = np.full((len(windows), len(combos)), -np.inf)
+    done   = 0
+    for start, chunk in chunks:
+        scores[:, start:start + chunk.shape[1]] = chunk
+        done += chunk.shape[1]
+        if progress:
+            progress(done, len(combos))
+
+    # 各折最佳參數（同分取網格中較前面的組合）只需重算這幾組的逐根報酬
+    best = [int(np.argmax(row)) if np.isfinite(row).any() else None for row in scores]
+    picked = sorted({j for j in best if j is not None})
+    if not picked:
+        raise ValueError("所有參數組合在訓練視窗內均無有效結果")
+    returns, positions, costs, keep, _ = strategy_returns(df, strategy_name,
+                                                          [combos[j] for j in picked], risk_cfg)
+    column = {j: c for c, j in enumerate(picked)}
+
+    folds, pieces = [], []
+    for k, ((a, b, c, d), j) in enumerate(zip(windows, best), start=1):
+        if j is None:
+            continue
+        train_stats, test_stats = window_metrics(returns, positions, costs, keep,
+                                                 [(a, b), (c, d)], trading_days)
+        col  = column[j]
+        rows = np.flatnonzero(keep[c:d]) + c
+        pieces.append(pd.DataFrame({
+            "Strategy":  returns[rows, col],
+            "Position":  positions[rows, col],
+            "TradeCost": costs[rows, col] if costs is not None else 0.0,
+            "Fold":      k,
+        }, index=df.index[rows]))
+        folds.append({
+            "折":       k,
+            "訓練期間": (df.index[a], df.index[b - 1]),
+            "測試期間": (df.index[c], df.index[d - 1]),
+            "參數":     combos[j],
+            "訓練績效": format_performance(train_stats, col),
+            "測試績效": format_performance(test_stats, col),
+        })
+
+    oos = pd.concat(pieces)
+    oos_metrics = calc_performance(oos, trading_days)
+    train_sharpe = np.mean([f["訓練績效"]["夏普比率"] for f in folds])
+    test_sharpe  = np.mean([f["測試績效"]["夏普比率"] for f in folds])
+    return {
+        "folds":       folds,
+        "oos":         oos,
+        "oos_metrics": oos_metrics,
+        "efficiency":  round(test_sharpe / train_sharpe, 2) if train_sharpe > 0 else None,
+    }
+
+
+# =====================
+# 跨交易對交叉驗證
+# =====================
+# 聚合分數 → (績效欄位, 聚合函式)；皆為越大越好（最大回撤為負值，最差 = 最小值）
+CROSS_AGGREGATES = {
+    "中位數夏普比率":       ("夏普比率", np.median),
+    "平均夏普比率":         ("夏普比率", np.mean),
+    "最差夏普比率":         ("夏普比率", np.min),
+    "最差最大回撤(%)":      ("最大回撤(%)", np.min),
+    "中位數累積報酬率(%)":  ("累積報酬率(%)", np.median),
+}
+
+
+def _evaluate_symbol_chunk(symbol, start, evaluate, strategy_name, combos, risk_cfg, trading_days):
+    return symbol, start, list(evaluate(_worker_frames[symbol], strategy_name, combos,
+                                        risk_cfg, trading_days=trading_days))
+
+
+def aggregate_symbol_metrics(metrics: list) -> dict:
+    """同一組參數在各交易對的績效 dict 清單（無效為 None）→ 各聚合分數與有效交易對數"""
+    valid = [m for m in metrics if m]
+    row   = {"有效交易對數": len(valid)}
+    for label, (column, fn) in CROSS_AGGREGATES.items():
+        row[label] = round(float(fn([m[column] for m in valid])), 2) if valid else np.nan
+    return row
+
+
+def cross_symbol_search(frames: dict, strategy_name, combos, aggregate="中位數夏普比率",
+                        risk_cfg=None, workers=None, chunk_size=None, trading_days=TRADING_DAYS,
+                        progress=None, evaluate=run_backtest_batch):
+    """
+    每組參數在所有交易對上回測，依聚合分數排序。
+      frames : {交易對: 股價 df}（各自的 index 可不同）
+    每個交易對的持倉仍走 run_backtest_batch 批次路徑（同一交易對的指標在 chunk 內只算一次），
+    「交易對 × 參數 chunk」分給 worker；progress(完成回測數, 總回測數) 用來更新進度條。
+    evaluate 可換成其他同介面的批次回測（須為模組層級函式，worker 以 pickle 取得），
+    例如虛擬幣頁傳入 crypto_strategy.crypto_backtest_batch，與單一交易對最佳化的績效算法一致。
+    回傳 (table, per_symbol)：
+      table      : 每列一組參數 + 各聚合分數 + 有效交易對數，依 aggregate 由大到小排序
+                   （同分時有效交易對數多者優先），index 為組合在 combos 中的位置，
+                   無任何有效結果的組合不列入
+      per_symbol : {交易對: 與 combos 等長的績效 dict 清單（無效為 None）}
+    """
+    if aggregate not in CROSS_AGGREGATES:
+        raise ValueError(f"未知的聚合方式：{aggregate}")
+    combos  = list(combos)
+    total   = len(combos) * len(frames)
+    workers = default_workers() if workers is None else max(1, int(workers))
+    size    = chunk_size or _chunk_size(total, workers)
+    jobs    = [(symbol, i, evaluate, strategy_name, combos[i:i + size], risk_cfg, trading_days)
+               for symbol in frames for i in range(0, len(combos), size)]
+
+    if workers <= 1 or total < MIN_PARALLEL_ROWS:
+        chunks = ((symbol, i, list(fn(frames[symbol], name, chunk, cfg, trading_days=td)))
+                  for symbol, i, fn, name, chunk, cfg, td in jobs)
+    else:
+        chunks = _map_chunks(frames, _evaluate_symbol_chunk, min(workers, len(jobs)), jobs)
+    per_symbol = {symbol: [None] * len(combos) for symbol in frames}
+    done = 0
+    for symbol, start, results in chunks:
+        per_symbol[symbol][start:start + len(results)] = results
+        done += len(results)
+        if progress:
+            progress(done, total)
+
+    rows, kept = [], []
+    for j, params in enumerate(combos):
+        row = aggregate_symbol_metrics([per_symbol[symbol][j] for symbol in frames])
+        if row["有效交易對數"]:
+            rows.append({**params, **row})
+            kept.append(j)
+    table = pd.DataFrame(rows, index=kept)
+    if not table.empty:
+        table = table.sort_values([aggregate, "有效交易對數"], ascending=False, kind="stable")
+    return table, per_symbol
+
+
+# =====================
+# 提前淘汰：分段回測，回撤已無望進榜的組合提早停止
+# =====================
+def _drawdown_step(returns, equity, peak, mdd):
+    """接續上一段的權益高點，更新到目前為止的最大回撤（returns 為本段計入績效的列 × 組合）"""
+    if not len(returns):
+        return equity, peak, mdd
+    curve = equity * np.cumprod(1 + returns, axis=0)
+    peaks = np.maximum(peak, np.maximum.accumulate(curve, axis=0))
+    mdd   = np.minimum(mdd, ((curve - peaks) / peaks).min(axis=0))
+    return curve[-1], peaks[-1], mdd
+
+
+def pruned_grid_search(df, strategy_name, combos, risk_cfg=None, exit_grid=None,
+                       opt_target="夏普比率", top_k=20, max_drawdown=0.0, time_chunks=4,
+                       block_size=64, trading_days=TRADING_DAYS, progress=None):
+    """
+    網格搜尋的提前淘汰版：組合每 block_size 組一批，每批依時間切成 time_chunks 段依序回測，
+    每段結束後以「到目前為止的最大回撤」淘汰不可能進榜的組合（最大回撤只會越來越深）：
+      - 目標為最大回撤時：已完成組合的第 top_k 名回撤為門檻，還沒跑完就比門檻差的組合不可能進前 top_k
+      - max_drawdown > 0 時（例如 0.3 = 回撤上限 30%）：任一段超過上限即淘汰，不論最佳化目標
+    其他目標沒有可保證的上界，只有設定回撤上限時才會淘汰。
+    持倉矩陣仍一次算完（指標向量化），分段的是出場條件、成本與績效；
+    停損狀態跨段時從持倉的進場根接續重算，結果與 run_backtest_batch 相同；
+    有成本設定時收盤價缺值的列與 strategy_returns 相同，先剔除再計算出場條件與成本。
+    回傳 dict：
+      results              : 與 run_backtest_batch 順序、長度相同（參數 × 出場條件），淘汰與無效組合為 None
+      pruned               : 被淘汰的位置
+      bar_evaluations      : 實際回測的 K 棒數（組合 × K 棒，含停損接續重算的部分）
+      full_bar_evaluations : 不淘汰時需要回測的 K 棒數
+    """
+    if opt_target not in OPT_TARGETS:
+        raise ValueError(f"未知的最佳化目標：{opt_target}")
+    combos = list(combos)
+    cfgs   = [{**(risk_cfg or {}), **e} for e in exit_grid] if exit_grid else [risk_cfg]
+    n      = len(df)
+    results = [None] * (len(combos) * len(cfgs))
+    try:
+        positions, valid = batch_positions(df, strategy_name, combos)
+    except Exception:
+        positions, valid = np.zeros((n, len(combos)), dtype=np.int64), np.zeros(len(combos), dtype=bool)
+    # 有成本設定的組合在收盤價有值的列（ok）上計算，與 apply_friction_and_risk 相同；
+    # 陣列以 ok 內的位置（壓縮座標）索引，結果再放回原本的列
+    ok      = np.flatnonzero(pd.to_numeric(df['Close'], errors='coerce').notna().to_numpy())
+    rows    = [(j, c) for j in np.flatnonzero(valid) for c in range(len(cfgs))]
+    found   = {"results": results, "pruned": [], "bar_evaluations": 0,
+               "full_bar_evaluations": sum(len(ok) if cfgs[c] else n for _, c in rows)}
+    daily   = df['Close'].pct_change().to_numpy()
+    keep    = ~np.isnan(daily)
+    keep[keep] &= np.abs(daily[keep]) < 0.5
+    closes  = df['Close'].to_numpy(dtype=np.float64)[ok]
+    ok_daily = pd.Series(closes).pct_change().to_numpy()
+    keep_ok = np.zeros(n, dtype=bool)
+    keep_ok[ok] = ~np.isnan(ok_daily) & (np.abs(ok_daily) < 0.5)
+    if not (keep.any() or keep_ok.any()):
+        return found
+
+    signals = signal_array(positions[ok]) if any(cfgs) else None
+    atrs    = {cfg.get("atr_period", 14): average_true_range(df.iloc[ok], cfg.get("atr_period", 14))
+               for cfg in cfgs if cfg and cfg.get("atr_stop", 0) > 0}
+    bounds  = np.unique(np.linspace(0, n, max(int(time_chunks), 1) + 1).astype(int))
+    ok_bounds = np.searchsorted(ok, bounds)       # 各段在壓縮座標的起迄
+    has_cost  = np.array([bool(cfgs[c]) for _, c in rows])
+    by_drawdown = OPT_TARGETS[opt_target][0] == "最大回撤(%)"
+    leaders = []                                  # 已完成組合的最大回撤(%)，由好到差
+    done    = 0
+
+    for b0 in range(0, len(rows), block_size):
+        block   = rows[b0:b0 + block_size]
+        width   = len(block)
+        returns = np.zeros((n, width))
+        held    = np.zeros((n, width), dtype=np.int64)
+        costs   = np.zeros((n, width)) if any(cfgs) else None
+        entry   = np.full(width, -1)              # 目前持倉的進場根（壓縮座標，-1 = 空手）
+        equity, peak, mdd = np.ones(width), np.ones(width), np.zeros(width)
+        alive   = np.ones(width, dtype=bool)
+        costed  = has_cost[b0:b0 + width]
+
+        for start, stop, ok_start, ok_stop in zip(bounds[:-1], bounds[1:], ok_bounds[:-1], ok_bounds[1:]):
+            cols = np.flatnonzero(alive)
+            if not len(cols):
+                break
+            for k in cols:
+                j, c = block[k]
+                cfg  = cfgs[c]
+                if not cfg:
+                    held[start:stop, k] = positions[start:stop, j]
+                    if start:
+                        returns[start:stop, k] = positions[start - 1:stop - 1, j] * daily[start:stop]
+                    else:
+                        returns[1:stop, k] = positions[:stop - 1, j] * daily[1:stop]
+                    found["bar_evaluations"] += stop - start
+                    continue
+                if ok_start == ok_stop:
+                    continue                             # 本段收盤價全為缺值
+                # 持倉中跨段：從進場根重跑出場 kernel，還原進場價、最高價、持有根數
+                resume = entry[k] if entry[k] >= 0 else ok_start
+                signal = signals[resume:ok_stop, j].copy()
+                signal[0] = 1 if entry[k] >= 0 else signal[0]
+                atr = atrs.get(cfg.get("atr_period", 14))
+                adj, _ = stop_positions(
+                    closes[resume:ok_stop], signal, cfg.get("stop_loss", 0.0), cfg.get("take_profit", 0.0),
+                    trailing_stop=cfg.get("trailing_stop", 0.0),
+                    atr=atr[resume:ok_stop] if atr is not None else None,
+                    atr_stop=cfg.get("atr_stop", 0.0), max_hold_bars=cfg.get("max_hold_bars", 0),
+                )
+                held[ok[ok_start:ok_stop], k] = adj[ok_start - resume:]
+                found["bar_evaluations"] += ok_stop - resume
+                # 成本只看相鄰兩根持倉，多取前一根接上上一段
+                lead = min(ok_start, 1)
+                seg  = held[ok[ok_start - lead:ok_stop], k]
+                _, strat, cost, _ = apply_costs(
+                    closes[ok_start - lead:ok_stop], seg, None,
+                    cfg.get("buy_fee", DEFAULT_FEE_STOCK), cfg.get("sell_fee", DEFAULT_FEE_STOCK),
+                    cfg.get("sell_tax", DEFAULT_TAX_STOCK),
+                )
+                returns[ok[ok_start:ok_stop], k] = strat[lead:]
+                costs[ok[ok_start:ok_stop], k]   = cost[lead:]
+                opens = np.flatnonzero((seg[1:] == 1) & (seg[:-1] == 0)) + ok_start - lead + 1
+                if seg[-1] == 0:
+                    entry[k] = -1
+                elif len(opens):
+                    entry[k] = opens[-1]
+                elif entry[k] < 0:
+                    entry[k] = ok_start                  # 第 0 根即持倉
+
+            for group, mask in ((cols[~costed[cols]], keep), (cols[costed[cols]], keep_ok)):
+                if len(group):
+                    rows_kept = np.flatnonzero(mask[start:stop]) + start
+                    equity[group], peak[group], mdd[group] = _drawdown_step(
+                        returns[np.ix_(rows_kept, group)], equity[group], peak[group], mdd[group])
+
+            out = np.zeros(width, dtype=bool)
+            if max_drawdown > 0:
+                out[cols] |= mdd[cols] < -max_drawdown
+            if by_drawdown and stop < n and len(leaders) >= top_k:
+                # 績效表的回撤四捨五入到 0.01%：比門檻差超過半個單位，進位後也不會與第 top_k 名並列
+                out[cols] |= mdd[cols] * 100 < leaders[top_k - 1] - 0.005 - 1e-9
+            alive &= ~out
+
+        finished = np.flatnonzero(alive)
+        for group, mask in ((finished[~costed[finished]], keep), (finished[costed[finished]], keep_ok)):
+            if not len(group):
+                continue
+            rows_kept = np.flatnonzero(mask)
+            stats = batch_performance(returns[np.ix_(rows_kept, group)],
+                                      held[np.ix_(rows_kept, group)],
+                                      costs[np.ix_(rows_kept, group)] if costs is not None else None,
+                                      trading_days)
+            for i, k in enumerate(group):
+                j, c = block[k]
+                results[j * len(cfgs) + c] = format_performance(stats, i)
+                leaders.append(results[j * len(cfgs) + c]["最大回撤(%)"])
+        leaders.sort(reverse=True)
+        found["pruned"] += [j * len(cfgs) + c for (j, c), ok in zip(block, alive) if not ok]
+        done += width
+        if progress:
+            progress(done, len(rows))
+    found["pruned"].sort()
+    return found
@@ -4,10 +4,15 @@ import numpy as np
 import plotly.graph_objs as go
 import plotly.express as px
 from itertools import product
-from strategy import apply_strategy, strategies, stock_list
-from database import load_stock_prices, save_stock_prices, delete_stock_prices
-from risk import apply_friction_and_risk, calc_performance, build_risk_ui
-import yfinance as yf
+from strategy import strategies, stock_list
+from database import delete_stock_prices
+from price_sync import load_synced_prices
+from risk import build_risk_ui, performance_stats
+from optimizer import (run_backtest, parallel_grid_search, default_workers, MIN_PARALLEL_ROWS,
+                       OPT_TARGETS, SEARCH_MODES, grid_values, rank_results, search_parameters,
+                       walk_forward, pruned_grid_search)
+from backtest_cache import run_backtest_cached
+import opt_store
 import os
 import json
 
@@ -135,17 +140,6 @@ risk_cfg = build_risk_ui(prefix="bt_", market="stock")
 # =====================
 # 輔助函式
 # =====================
-def fetch_stock_data_from_web(stock_code, start_date, end_date):
-    df = yf.download(stock_code, start=start_date, end=end_date, auto_adjust=False)
-    if df.empty:
-        return df
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [col[0] for col in df.columns]
-    df.reset_index(inplace=True)
-    df['Date'] = pd.to_datetime(df['Date'])
-    df.set_index('Date', inplace=True)
-    return df
-
 def clean_price_data(df):
     df = df.sort_index()
     df['Close'] = pd.to_numeric(df['Close'], errors='coerce')
@@ -153,31 +147,8 @@ def clean_price_data(df):
 
 @st.cache_data(show_spinner=False)
 def load_price(stock_code, start_date, end_date):
-    df = load_stock_prices(stock_code, start_date, end_date)
-    if not df.empty:
-        df.index = pd.to_datetime(df.index)
-    if df.empty:
-        df = fetch_stock_data_from_web(stock_code, start_date, end_date)
-        if not df.empty:
-            save_stock_prices(df, stock_code)
-    return df
-
-def run_backtest(df, strategy_name, params, risk_cfg=None):
-    try:
-        df_s = apply_strategy(df.copy(), strategy_name, params)
-    except Exception:
-        return None
-    if risk_cfg:
-        df_s = apply_friction_and_risk(df_s, **risk_cfg)
-    else:
-        df_s['DailyReturn'] = df_s['Close'].pct_change()
-        df_s['Strategy']    = df_s['Position'].shift(1) * df_s['DailyReturn']
-    df_s['DailyReturn'] = df_s['Close'].pct_change()
-    df_s = df_s.dropna(subset=['DailyReturn', 'Strategy'])
-    df_s = df_s[df_s['DailyReturn'].abs() < 0.5]
-    if df_s.empty:
-        return None
-    return calc_performance(df_s, TRADING_DAYS)
+    # ✅ 增量同步：只下載資料庫缺少的日期區間
+    return load_synced_prices(stock_code, start_date, end_date)
 
 # ✅ 歷史買賣紀錄計算
 def calc_trade_history(df_s):
@@ -279,6 +250,23 @@ def plot_strategy_performance(df_s):
                       xaxis_title="日期", yaxis_title="累積報酬率")
     return fig
 
+def show_param_landscape(df_opt, int_params, best):
+    """兩個 int 參數畫熱力圖，一個畫折線圖（df_opt 已依最佳化目標排序，best 為第一列）"""
+    metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
+    if len(int_params) >= 2:
+        p1, p2   = int_params[0], int_params[1]
+        pivot    = df_opt.pivot_table(index=p1, columns=p2, values=metric_col, aggfunc="mean")
+        fig_heat = px.imshow(pivot, color_continuous_scale="RdYlGn",
+                             title=f"{strategy_name} 參數熱力圖（{p1} × {p2}）", aspect="auto")
+        st.plotly_chart(fig_heat, use_container_width=True)
+    elif len(int_params) == 1:
+        p1       = int_params[0]
+        df_line  = df_opt.groupby(p1)[metric_col].mean().reset_index()
+        fig_line = px.line(df_line, x=p1, y=metric_col, title=f"{p1} 對 {metric_col} 的影響", markers=True)
+        fig_line.add_vline(x=best[p1], line_dash="dash", line_color="red",
+                           annotation_text=f"最佳={best[p1]}")
+        st.plotly_chart(fig_line, use_container_width=True)
+
 # =====================
 # 參數最佳化設定 UI
 # =====================
@@ -314,25 +302,107 @@ for param, default in strategies[strategy_name]["parameters"].items():
         col_idx += 1
 
 opt_target = st.selectbox("最佳化目標",
-    ["夏普比率", "累積報酬率(%)", "最大回撤(%)（最小化）"],
+    list(OPT_TARGETS),
     help="依照哪個指標選出最佳參數組合"
 )
+search_mode = st.selectbox(
+    "搜尋模式", list(SEARCH_MODES), format_func=SEARCH_MODES.get, key="opt_search_mode",
+    help="網格搜尋回測全部組合；其餘模式在評估預算內只回測一部分組合，"
+         "逐步減半先以最近 25% / 50% 的資料淘汰較差的組合，再以全期間回測留下的組合"
+)
 
 if not has_optimizable:
     st.info("此策略無數值型參數，無法進行最佳化。")
 
+# ✅ 出場條件掃描：欄位名稱 → (apply_friction_and_risk 參數, 型別, 換算倍率, 預設候選值)
+EXIT_SWEEP_FIELDS = {
+    "移動停損(%)":   ("trailing_stop", float, 0.01, "0, 5, 10"),
+    "ATR停損倍數":   ("atr_stop",      float, 1.0,  "0, 2, 3"),
+    "最多持有K棒":   ("max_hold_bars", int,   1,    "0, 20, 60"),
+}
+
+def parse_sweep_values(text, dtype):
+    values = []
+    for tok in str(text).replace("，", ",").split(","):
+        tok = tok.strip()
+        if not tok:
+            continue
+        try:
+            v = dtype(float(tok))
+        except ValueError:
+            continue
+        if v >= 0 and v not in values:
+            values.append(v)
+    return values or [dtype(0)]
+
+exit_grid    = []
+exit_labels  = []
+opt_prune    = False
+opt_dd_limit = 0.0
+if has_optimizable and search_mode == "grid":
+    sweep_exits = st.checkbox(
+        "同時掃描出場條件（移動停損 / ATR 停損 / 時間停損）", value=False, key="opt_sweep_exits",
+        help="每組參數的持倉只計算一次，再套用各種出場條件；掃描時會一併套用上方的摩擦成本與停損停利設定，0 = 不啟用"
+    )
+    if sweep_exits:
+        exit_cols   = st.columns(len(EXIT_SWEEP_FIELDS))
+        exit_values = []
+        for col, (label, (_, dtype, _, default)) in zip(exit_cols, EXIT_SWEEP_FIELDS.items()):
+            text = col.text_input(f"{label} 候選值", value=default, key=f"opt_exit_{label}",
+                                  help="以逗號分隔，例如 0, 5, 10")
+            exit_values.append(parse_sweep_values(text, dtype))
+        exit_labels = list(EXIT_SWEEP_FIELDS)
+        exit_grid   = [dict(zip(exit_labels, combo)) for combo in product(*exit_values)]
+    opt_prune = st.checkbox(
+        "✂️ 提前淘汰無望的組合（依時間分段回測）", value=False, key="opt_prune",
+        help="每批組合依時間切段回測，到目前為止的最大回撤已不可能進入前 20 名（目標為最大回撤時）"
+             "或超過回撤上限的組合提早停止；淘汰的組合不會出現在結果表，也不寫入掃描紀錄。"
+             "分段回測在目前行程執行，不使用平行處理"
+    )
+    if opt_prune:
+        opt_dd_limit = st.number_input(
+            "回撤上限(%)", min_value=0.0, max_value=100.0, value=0.0, step=5.0, key="opt_dd_limit",
+            help="最大回撤超過此比例的組合直接淘汰，0 = 不設上限（只有最佳化目標為最大回撤時才會淘汰）"
+        )
+
+opt_workers = default_workers()
+if has_optimizable:
+    opt_workers = st.number_input(
+        "平行處理程序數", min_value=1, max_value=max(default_workers(), 1) * 2,
+        value=default_workers(), step=1, key="opt_workers",
+        help=f"參數組合分給多個行程同時計算，預設為 CPU 核心數；組合數少於 "
+             f"{MIN_PARALLEL_ROWS} 組時直接在目前行程計算"
+    )
+    opt_use_store = st.checkbox(
+        "💾 記錄掃描結果（中斷後可續跑，已評估的組合直接取回）", value=True, key="opt_use_store",
+        help="以股票、策略、日期區間、成本設定與股價內容為 key 存進 stock_data.db，"
+             "相同設定再次掃描時只回測尚未評估的組合"
+    )
+
+def exit_overrides(exit_row):
+    """{欄位名稱: 顯示值} → apply_friction_and_risk 的參數覆寫"""
+    return {EXIT_SWEEP_FIELDS[k][0]: v * EXIT_SWEEP_FIELDS[k][2] for k, v in exit_row.items()}
+
 def estimate_combinations(opt_ranges):
     total = 1
-    for _, (dtype, p_min, p_max, p_step) in opt_ranges.items():
-        n = len(range(int(p_min), int(p_max) + 1, int(p_step))) if dtype == "int" \
-            else len(np.arange(p_min, p_max + p_step * 0.5, p_step))
-        total *= max(n, 1)
-    return total
+    for vals in grid_values(opt_ranges).values():
+        total *= max(len(vals), 1)
+    return total * max(len(exit_grid), 1)
 
+opt_budget = None
 if has_optimizable and opt_ranges:
     est   = estimate_combinations(opt_ranges)
-    color = "🟢" if est <= 100 else ("🟡" if est <= 500 else "🔴")
-    st.caption(f"{color} 預估參數組合數：**{est}** 組")
+    if search_mode == "grid":
+        color = "🟢" if est <= 100 else ("🟡" if est <= 500 else "🔴")
+        st.caption(f"{color} 預估參數組合數：**{est}** 組")
+    else:
+        opt_budget = st.number_input(
+            "評估預算（最多回測次數）", min_value=1, max_value=max(est, 1),
+            value=min(max(20, est // 10), est), step=10, key="opt_budget",
+            help="逐步減半在資料子集上的回測也計入預算；預算不小於組合數時等同網格搜尋"
+        )
+        st.caption(f"🎯 參數組合共 **{est}** 組，最多回測 **{opt_budget}** 次"
+                   f"（約 {est / max(opt_budget, 1):.0f} 分之 1）")
 
 # =====================
 # 快取清除
@@ -362,20 +432,11 @@ if st.button("🚀 開始回測"):
     if df.empty:
         st.error("❌ 清理後資料為空"); st.stop()
 
+    # ✅ 套用策略 + 摩擦成本 & 停損停利（相同股價 / 參數 / 成本設定直接取快取）
     try:
-        df_s = apply_strategy(df, strategy_name, params)
+        df_s = run_backtest_cached(df, strategy_name, params, risk_cfg)
     except Exception as e:
         st.error(f"策略執行失敗：{e}"); st.stop()
-
-    # ✅ 套用摩擦成本 & 停損停利
-    df_s = apply_friction_and_risk(
-        df_s,
-        buy_fee=risk_cfg["buy_fee"],
-        sell_fee=risk_cfg["sell_fee"],
-        sell_tax=risk_cfg["sell_tax"],
-        stop_loss=risk_cfg["stop_loss"],
-        take_profit=risk_cfg["take_profit"],
-    )
     df_s['DailyReturn'] = df_s['Close'].pct_change()
     df_s = df_s.dropna(subset=['DailyReturn', 'Strategy'])
     abnormal = df_s['DailyReturn'].abs() >= 0.5
@@ -398,25 +459,23 @@ if st.button("🚀 開始回測"):
     st.plotly_chart(plot_candlestick_with_signals(df_s), use_container_width=True)
     st.plotly_chart(plot_strategy_performance(df_s), use_container_width=True)
 
-    # ── 績效總表 ──
-    sharpe_ratio      = (df_s['Strategy'].mean() / df_s['Strategy'].std()) * TRADING_DAYS ** 0.5 \
-                        if df_s['Strategy'].std() != 0 else 0
-    cum_ret           = (1 + df_s['Strategy']).cumprod()
-    strategy_drawdown = ((cum_ret - cum_ret.cummax()) / cum_ret.cummax()).min()
-    strategy_risk     = df_s['Strategy'].std() * TRADING_DAYS ** 0.5
+    # ── 績效總表（單次 kernel 算出全部指標）──
+    perf = performance_stats(df_s, TRADING_DAYS)
 
     st.markdown("### 📋 策略績效總表")
-    total_cost = df_s['TradeCost'].sum() if 'TradeCost' in df_s.columns else 0
     st.table(pd.DataFrame({
-        "項目": ["期間", "買入持有報酬率", "策略報酬率（含成本）", "策略風險（年化波動）", "最大回撤", "夏普比率", "總手續費成本"],
+        "項目": ["期間", "買入持有報酬率", "策略報酬率（含成本）", "策略風險（年化波動）", "最大回撤",
+                 "夏普比率", "索提諾比率", "卡瑪比率", "總手續費成本"],
         "數值": [
             f"{df_s.index.min().date()} ~ {df_s.index.max().date()}",
             f"{df_s['BuyHoldCumulative'].iloc[-1]:.2%}",
-            f"{df_s['StrategyCumulative'].iloc[-1]:.2%}",
-            f"{strategy_risk:.2%}",
-            f"{strategy_drawdown:.2%}",
-            f"{sharpe_ratio:.2f}",
-            f"{total_cost:.4%}",
+            f"{perf['cum_return']:.2%}",
+            f"{perf['volatility']:.2%}",
+            f"{perf['mdd']:.2%}",
+            f"{perf['sharpe']:.2f}",
+            f"{perf['sortino']:.2f}",
+            f"{perf['calmar']:.2f}",
+            f"{perf['cost']:.4%}",
         ]
     }))
 
@@ -528,32 +587,101 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     if df.empty:
         st.error("❌ 清理後資料為空"); st.stop()
 
-    param_names  = []
-    param_values = []
-    for param, (dtype, p_min, p_max, p_step) in opt_ranges.items():
-        param_names.append(param)
-        vals = list(range(int(p_min), int(p_max) + 1, int(p_step))) if dtype == "int" \
-               else [round(v, 4) for v in np.arange(p_min, p_max + p_step * 0.5, p_step)]
-        param_values.append(vals)
+    space        = grid_values(opt_ranges)
+    param_names  = list(space)
+    param_values = list(space.values())
 
     fixed_params = {k: v for k, v in params.items() if k not in opt_ranges}
     all_combos   = list(product(*param_values))
-    total        = len(all_combos)
+    combo_params = [{**dict(zip(param_names, combo)), **fixed_params} for combo in all_combos]
+    # 掃描出場條件時每組參數再展開成「參數 × 出場條件」，順序與 run_backtest_batch 相同
+    exit_rows    = exit_grid or [{}]
+    sweep_cfg    = risk_cfg if exit_grid else None
+    total        = len(combo_params) * len(exit_rows)
 
-    st.info(f"🔄 共 {total} 組參數組合，開始掃描...")
     progress_bar = st.progress(0)
     status_text  = st.empty()
+    # ✅ 掃描紀錄：相同股票 / 策略 / 日期 / 成本設定 / 股價內容的組合直接取回，只回測剩下的
+    sweep = opt_store.open_sweep(stock_code, strategy_name, start_date, end_date, sweep_cfg,
+                                 prices=df, trading_days=TRADING_DAYS) if opt_use_store else None
+
+    if search_mode == "grid":
+        # ✅ 多行程平行掃描：股價放共享記憶體，組合切成 chunk，每完成一個 chunk 更新進度
+        rows     = [(p, e) for p in combo_params for e in exit_rows]
+        row_keys = [{**p, **e} for p, e in rows]
+        n_exits  = len(exit_rows)
+        grid     = [exit_overrides(e) for e in exit_grid] if exit_grid else None
+        scored, missing = opt_store.lookup(sweep, row_keys) if sweep else ([None] * total, range(total))
+        pending  = sorted({i // n_exits for i in missing})
+        done     = total - len(pending) * n_exits
+        n_valid  = sum(m is not None for m in scored)
+        if done:
+            st.info(f"🔄 共 {total} 組參數組合，{done} 組已有紀錄，繼續掃描其餘 {total - done} 組...")
+        else:
+            st.info(f"🔄 共 {total} 組參數組合，開始掃描...")
+        if opt_prune:
+            # ✅ 提前淘汰：依時間分段回測，回撤已無望進榜的組合提早停止（單行程）
+            def on_pruned_progress(n_done, n_rows):
+                progress_bar.progress((done + n_done) / total)
+                status_text.text(f"進度：{done + n_done}/{total} 組完成")
+
+            pruned_run = pruned_grid_search(df, strategy_name, [combo_params[j] for j in pending],
+                                            sweep_cfg, grid, opt_target=opt_target,
+                                            max_drawdown=opt_dd_limit / 100,
+                                            trading_days=TRADING_DAYS, progress=on_pruned_progress)
+            chunks = [(0, pruned_run["results"])]
+            cut    = {pending[k // n_exits] * n_exits + k % n_exits for k in pruned_run["pruned"]}
+        else:
+            chunks = parallel_grid_search(df, strategy_name, [combo_params[j] for j in pending],
+                                          sweep_cfg, grid, workers=opt_workers, trading_days=TRADING_DAYS)
+            cut    = set()
+        for start, chunk in chunks:
+            # start 為 pending 組合展開後的位置，換回完整網格的位置
+            pos = [pending[k // n_exits] * n_exits + k % n_exits for k in range(start, start + len(chunk))]
+            for i, metrics in zip(pos, chunk):
+                scored[i] = metrics
+            if sweep:
+                # 被淘汰的組合沒有完整績效，不寫入紀錄
+                kept = [(row_keys[i], m) for i, m in zip(pos, chunk) if i not in cut]
+                opt_store.record(sweep, [r for r, _ in kept], [m for _, m in kept])
+            done    += len(chunk)
+            n_valid += sum(m is not None for m in chunk)
+            progress_bar.progress(done / total)
+            status_text.text(f"進度：{done}/{total} 組完成，有效結果：{n_valid} 組")
+        if opt_prune:
+            saved = pruned_run["full_bar_evaluations"] - pruned_run["bar_evaluations"]
+            st.caption(f"✂️ 提前淘汰 {len(cut)} 組，回測 K 棒 {pruned_run['bar_evaluations']:,} 根"
+                       f"（不淘汰需 {pruned_run['full_bar_evaluations']:,} 根，省下 {saved:,} 根，"
+                       f"{saved / max(pruned_run['full_bar_evaluations'], 1):.0%}）")
+        results = [{**test_params, **exit_row, **metrics}
+                   for (test_params, exit_row), metrics in zip(rows, scored) if metrics]
+    else:
+        st.info(f"🔄 {SEARCH_MODES[search_mode]}：{total} 組參數組合，最多回測 {opt_budget} 次...")
+
+        def run_combos(combos, data):
+            scored = [None] * len(combos)
+            for start, chunk in parallel_grid_search(data, strategy_name, combos,
+                                                     workers=opt_workers, trading_days=TRADING_DAYS):
+                scored[start:start + len(chunk)] = chunk
+            return scored
+
+        if sweep:
+            run_combos = opt_store.cached_evaluate(sweep, run_combos, df)
+
+        def evaluate(combos, data):
+            return run_combos([{**c, **fixed_params} for c in combos], data)
 
-    results = []
-    for i, combo in enumerate(all_combos):
-        test_params = dict(zip(param_names, combo))
-        test_params.update(fixed_params)
-        metrics = run_backtest(df, strategy_name, test_params)
-        if metrics:
-            results.append({**test_params, **metrics})
-        progress_bar.progress((i + 1) / total)
-        if (i + 1) % 20 == 0 or (i + 1) == total:
-            status_text.text(f"進度：{i+1}/{total} 組完成，有效結果：{len(results)} 組")
+        def on_progress(used, budget):
+            progress_bar.progress(min(used / budget, 1.0))
+            status_text.text(f"進度：已回測 {used}/{budget} 次")
+
+        found   = search_parameters(search_mode, space, evaluate, df, opt_target,
+                                    budget=opt_budget, progress=on_progress)
+        results = [{**test_params, **fixed_params, **metrics}
+                   for test_params, metrics in found["results"]]
+        st.caption(f"🎯 實際回測 {found['evaluations']} 次（網格共 {found['total']} 組），"
+                   f"全期間回測 {len(found['results'])} 組，回測 K 棒合計 {found['bar_evaluations']:,} 根"
+                   + (f"；{run_combos.stats['reused']} 組取自掃描紀錄" if sweep else ""))
 
     progress_bar.empty()
     status_text.empty()
@@ -561,26 +689,28 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     if not results:
         st.error("❌ 所有參數組合均無法產生有效結果"); st.stop()
 
-    df_opt = pd.DataFrame(results)
-    if opt_target == "最大回撤(%)（最小化）":
-        df_opt = df_opt.sort_values("最大回撤(%)", ascending=True)
-    elif opt_target == "夏普比率":
-        df_opt = df_opt.sort_values("夏普比率", ascending=False)
-    else:
-        df_opt = df_opt.sort_values("累積報酬率(%)", ascending=False)
+    # 最大回撤為負值，越接近 0 越好
+    df_opt = rank_results(pd.DataFrame(results), opt_target)
 
     best = df_opt.iloc[0]
     st.success(f"✅ 掃描完成！共 {len(df_opt)} 組有效結果")
 
     # 最佳參數展示
     st.markdown("### 🏆 最佳參數組合")
-    best_cols = st.columns(len(param_names) + 4)
-    for i, p in enumerate(param_names):
+    shown     = param_names + exit_labels
+    best_cols = st.columns(len(shown) + 4)
+    for i, p in enumerate(shown):
         best_cols[i].metric(p, best[p])
-    best_cols[len(param_names)].metric("累積報酬率",  f"{best['累積報酬率(%)']:.2f}%")
-    best_cols[len(param_names)+1].metric("夏普比率",   f"{best['夏普比率']:.2f}")
-    best_cols[len(param_names)+2].metric("最大回撤",   f"{best['最大回撤(%)']:.2f}%")
-    best_cols[len(param_names)+3].metric("交易次數",   f"{int(best['交易次數'])}")
+    best_cols[len(shown)].metric("累積報酬率",  f"{best['累積報酬率(%)']:.2f}%")
+    best_cols[len(shown)+1].metric("夏普比率",   f"{best['夏普比率']:.2f}")
+    best_cols[len(shown)+2].metric("最大回撤",   f"{best['最大回撤(%)']:.2f}%")
+    best_cols[len(shown)+3].metric("交易次數",   f"{int(best['交易次數'])}")
+    best_risk_cfg = None
+    if exit_grid:
+        best_exit     = {k: EXIT_SWEEP_FIELDS[k][1](best[k]) for k in exit_labels}
+        best_risk_cfg = {**risk_cfg, **exit_overrides(best_exit)}
+        st.caption("📌 最佳出場條件：" + "、".join(f"{k} = {v}" for k, v in best_exit.items())
+                   + "（0 = 不啟用；儲存最佳參數時只儲存策略參數）")
 
     # ✅ 把最佳參數存進 session_state，讓儲存按鈕在 rerun 後仍能讀到
     best_params_to_save = {p: (int(best[p]) if isinstance(strategies[strategy_name]["parameters"][p], int)
@@ -610,28 +740,14 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     )
 
     # 熱力圖
-    int_params = [p for p in param_names if opt_ranges[p][0] == "int"]
-    if len(int_params) >= 2:
-        p1, p2     = int_params[0], int_params[1]
-        metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
-        pivot      = df_opt.pivot_table(index=p1, columns=p2, values=metric_col, aggfunc="mean")
-        fig_heat   = px.imshow(pivot, color_continuous_scale="RdYlGn",
-                               title=f"{strategy_name} 參數熱力圖（{p1} × {p2}）", aspect="auto")
-        st.plotly_chart(fig_heat, use_container_width=True)
-    elif len(int_params) == 1:
-        p1         = int_params[0]
-        metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
-        df_line    = df_opt.groupby(p1)[metric_col].mean().reset_index()
-        fig_line   = px.line(df_line, x=p1, y=metric_col, title=f"{p1} 對 {metric_col} 的影響", markers=True)
-        fig_line.add_vline(x=best[p1], line_dash="dash", line_color="red",
-                           annotation_text=f"最佳={best[p1]}")
-        st.plotly_chart(fig_line, use_container_width=True)
+    show_param_landscape(df_opt, [p for p in param_names if opt_ranges[p][0] == "int"], best)
 
     # 最佳參數回測圖
     st.markdown("### 📈 使用最佳參數執行回測")
-    df_best = apply_strategy(df.copy(), strategy_name, best_params_to_save)
+    df_best = run_backtest_cached(df, strategy_name, best_params_to_save, best_risk_cfg)
     df_best['DailyReturn']        = df_best['Close'].pct_change()
-    df_best['Strategy']           = df_best['Position'].shift(1) * df_best['DailyReturn']
+    if not best_risk_cfg:
+        df_best['Strategy']       = df_best['Position'].shift(1) * df_best['DailyReturn']
     df_best = df_best.dropna(subset=['DailyReturn', 'Strategy'])
     df_best = df_best[df_best['DailyReturn'].abs() < 0.5]
     df_best['BuyHoldCumulative']  = (1 + df_best['DailyReturn']).cumprod() - 1
@@ -639,7 +755,7 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     st.plotly_chart(plot_strategy_performance(df_best), use_container_width=True)
 
     # 原始 vs 最佳比較
-    orig_metrics = run_backtest(df, strategy_name, params)
+    orig_metrics = run_backtest(df, strategy_name, params, sweep_cfg, TRADING_DAYS)
     st.markdown("### ⚖️ 原始參數 vs 最佳化參數比較")
     st.table(pd.DataFrame({
         "項目": ["累積報酬率(%)", "夏普比率", "最大回撤(%)", "交易次數"],
@@ -659,8 +775,116 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
 
     st.warning(
         "⚠️ **過度擬合警告**：參數最佳化基於歷史資料，最佳參數不代表未來同樣有效。"
-        "建議搭配不同時間段驗證。"
+        "建議搭配下方 Walk-forward 驗證檢查樣本外表現。"
     )
+
+# =====================
+# 過往最佳化紀錄（直接從資料庫載入，不重新回測）
+# =====================
+if has_optimizable:
+    with st.expander("📂 過往最佳化紀錄", expanded=False):
+        sweeps = opt_store.list_sweeps(stock_code, strategy_name)
+        if sweeps.empty:
+            st.caption(f"尚無 {stock_code} × {strategy_name} 的掃描紀錄")
+        else:
+            sweep_labels = {
+                row.sweep_id: f"{row.start_date} ~ {row.end_date}｜{row.n_results} 組｜"
+                              f"{'含成本設定' if row.risk_cfg != '{}' else '無成本'}｜更新於 {row.updated_at}"
+                for row in sweeps.itertuples()
+            }
+            chosen = st.selectbox("選擇掃描", list(sweep_labels), format_func=sweep_labels.get,
+                                  key="opt_past_sweep")
+            col_l, col_d = st.columns([3, 1])
+            if col_d.button("🗑️ 刪除此紀錄", key="opt_delete_sweep"):
+                opt_store.delete_sweep(chosen)
+                st.rerun()
+            if col_l.button("📂 載入結果", key="opt_load_sweep"):
+                df_past = opt_store.load_sweep(chosen)
+                if df_past.empty:
+                    st.warning("此掃描沒有有效結果")
+                else:
+                    df_past    = rank_results(df_past, opt_target)
+                    past_ints  = [p for p, v in strategies[strategy_name]["parameters"].items()
+                                  if isinstance(v, int) and p in df_past and df_past[p].nunique() > 1]
+                    st.dataframe(
+                        df_past.head(20).style.format({"累積報酬率(%)": "{:.2f}%", "夏普比率": "{:.2f}",
+                                                       "最大回撤(%)": "{:.2f}%"}),
+                        use_container_width=True
+                    )
+                    show_param_landscape(df_past, past_ints, df_past.iloc[0])
+
+# =====================
+# Walk-forward 樣本外驗證
+# =====================
+if has_optimizable:
+    st.markdown("---")
+    st.markdown("## 🧪 Walk-forward 樣本外驗證")
+    st.caption("把回測期間切成多個「訓練 → 測試」視窗：每個訓練視窗以上方的參數範圍與最佳化目標掃描全部組合，"
+               "最佳參數只套用到緊接著的測試視窗，再把各測試視窗串成樣本外權益曲線。")
+    wf_c1, wf_c2, wf_c3 = st.columns(3)
+    wf_folds    = wf_c1.number_input("折數（測試視窗數）", min_value=2, max_value=20, value=5, step=1,
+                                     key="wf_folds")
+    wf_ratio    = wf_c2.slider("訓練視窗比例", min_value=0.5, max_value=0.9, value=0.75, step=0.05,
+                               key="wf_ratio", help="每個視窗中訓練期間所佔比例，例如 0.75 = 訓練長度為測試的 3 倍")
+    wf_anchored = wf_c3.radio("訓練視窗", ["滾動", "錨定（從頭累積）"], key="wf_anchored",
+                              horizontal=True) != "滾動"
+    wf_costs    = st.checkbox("套用摩擦成本與停損停利設定", value=True, key="wf_costs")
+
+if has_optimizable and st.button("🧪 開始 Walk-forward 驗證"):
+    with st.spinner("載入股價資料..."):
+        df = load_price(stock_code, start_date, end_date)
+    df = clean_price_data(df) if not df.empty else df
+    if df.empty:
+        st.error("❌ 無法取得股票資料"); st.stop()
+
+    space        = grid_values(opt_ranges)
+    fixed_params = {k: v for k, v in params.items() if k not in opt_ranges}
+    combo_params = [{**dict(zip(space, combo)), **fixed_params} for combo in product(*space.values())]
+    st.info(f"🔄 {len(combo_params)} 組參數 × {wf_folds} 折，開始驗證...")
+    progress_bar = st.progress(0)
+
+    try:
+        wf = walk_forward(df, strategy_name, combo_params, opt_target,
+                          risk_cfg=risk_cfg if wf_costs else None, n_folds=int(wf_folds),
+                          train_ratio=wf_ratio, anchored=wf_anchored, workers=opt_workers,
+                          trading_days=TRADING_DAYS,
+                          progress=lambda done, total: progress_bar.progress(done / total))
+    except ValueError as e:
+        progress_bar.empty()
+        st.error(f"❌ {e}"); st.stop()
+    progress_bar.empty()
+
+    oos = wf["oos"]
+    m   = wf["oos_metrics"]
+    st.markdown("### 📊 樣本外績效（各測試視窗串接）")
+    wf_cols = st.columns(5)
+    wf_cols[0].metric("累積報酬率", f"{m['累積報酬率(%)']:.2f}%")
+    wf_cols[1].metric("夏普比率",   f"{m['夏普比率']:.2f}")
+    wf_cols[2].metric("最大回撤",   f"{m['最大回撤(%)']:.2f}%")
+    wf_cols[3].metric("交易次數",   f"{m['交易次數']}")
+    wf_cols[4].metric("Walk-forward 效率", "N/A" if wf["efficiency"] is None else f"{wf['efficiency']:.2f}",
+                      help="測試視窗平均夏普 / 訓練視窗平均夏普，越接近 1 表示樣本內外表現越一致")
+
+    df_wf = pd.DataFrame({
+        "BuyHoldCumulative":  (1 + df['Close'].pct_change().reindex(oos.index)).cumprod() - 1,
+        "StrategyCumulative": (1 + oos['Strategy']).cumprod() - 1,
+    })
+    fig_wf = plot_strategy_performance(df_wf)
+    fig_wf.update_layout(title="樣本外策略 vs 買入持有累積報酬率")
+    st.plotly_chart(fig_wf, use_container_width=True)
+
+    st.markdown("### 📋 各折最佳參數")
+    st.dataframe(pd.DataFrame([{
+        "折":           f["折"],
+        "訓練期間":     f"{f['訓練期間'][0]:%Y-%m-%d} ~ {f['訓練期間'][1]:%Y-%m-%d}",
+        "測試期間":     f"{f['測試期間'][0]:%Y-%m-%d} ~ {f['測試期間'][1]:%Y-%m-%d}",
+        "參數":         "、".join(f"{k}={v}" for k, v in f["參數"].items() if k in opt_ranges),
+        "訓練夏普":     f["訓練績效"]["夏普比率"],
+        "測試夏普":     f["測試績效"]["夏普比率"],
+        "測試報酬率(%)": f["測試績效"]["累積報酬率(%)"],
+        "測試回撤(%)":  f["測試績效"]["最大回撤(%)"],
+    } for f in wf["folds"]]), use_container_width=True, hide_index=True)
+
 # =====================
 # 儲存最佳參數區塊（在最佳化 block 外，避免 rerun 後變數消失）
 # =====================
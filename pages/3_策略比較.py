@@ -3,12 +3,12 @@ import streamlit as st
 import pandas as pd
 import json
 import os
-import yfinance as yf
 import plotly.express as px
 import requests
-from strategy import apply_strategy, strategies, stock_list
-from database import load_stock_prices, save_stock_prices
-from risk import apply_friction_and_risk, calc_performance, build_risk_ui
+from strategy import strategies, stock_list
+from price_sync import load_synced_prices_many
+from risk import calc_performance, build_risk_ui
+from backtest_cache import run_backtest_cached, clear as clear_backtest_cache
 
 BEST_PARAM_FILE = "user_best_params.json"
 
@@ -64,6 +64,7 @@ with st.sidebar:
     st.markdown("---")
     if st.button("🗑️ 清除所有快取", help="若 AI 回應異常或模型沒更新，請點此清除"):
         st.cache_data.clear()
+        clear_backtest_cache()
         st.success("✅ 快取已清除，請重新執行回測")
 
 # =====================
@@ -119,17 +120,6 @@ risk_cfg = build_risk_ui(prefix="cmp_", market="stock")
 # =====================
 # 輔助函式
 # =====================
-def fetch_stock_data_from_web(stock_code, start_date, end_date):
-    df = yf.download(stock_code, start=start_date, end=end_date, auto_adjust=False)
-    if df.empty:
-        return df
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [col[0] for col in df.columns]
-    df.reset_index(inplace=True)
-    df['Date'] = pd.to_datetime(df['Date'])
-    df.set_index('Date', inplace=True)
-    return df
-
 def clean_price_data(df):
     df = df.sort_index()
     df['Close'] = pd.to_numeric(df['Close'], errors='coerce')
@@ -267,19 +257,15 @@ if st.button("🚀 執行回測比較"):
     TRADING_DAYS = 240
     results = []
 
-    for stock_code in stock_codes:
-        df = load_stock_prices(stock_code, start_date, end_date)
-        if not df.empty:
-            df.index = pd.to_datetime(df.index)
+    # ✅ 增量同步後，所有股票以單一查詢讀出
+    with st.spinner("資料讀取中..."):
+        price_map = load_synced_prices_many(stock_codes, start_date, end_date)
 
+    for stock_code in stock_codes:
+        df = price_map[stock_code]
         if df.empty:
-            st.info(f"資料庫無 {stock_code} 資料，從網路下載中...")
-            df_web = fetch_stock_data_from_web(stock_code, start_date, end_date)
-            if df_web.empty:
-                st.warning(f"無法取得 {stock_code} 資料，跳過此股票")
-                continue
-            save_stock_prices(df_web, stock_code)
-            df = df_web
+            st.warning(f"無法取得 {stock_code} 資料，跳過此股票")
+            continue
 
         if 'Close' not in df.columns:
             st.warning(f"{stock_code} 資料缺 Close 欄位，跳過")
@@ -299,21 +285,12 @@ if st.button("🚀 執行回測比較"):
                            "、".join([f"{k}={v}" for k, v in params.items()]))
             else:
                 params = strategies[strat]["parameters"]
+            # ✅ 套用策略 + 摩擦成本 & 停損停利（重跑相同比較時直接取快取）
             try:
-                df_strategy = apply_strategy(df.copy(), strat, params)
+                df_strategy = run_backtest_cached(df, strat, params, risk_cfg)
             except Exception as e:
                 st.warning(f"{stock_code} × {strat} 策略套用失敗: {e}")
                 continue
-
-            # ✅ 套用摩擦成本 & 停損停利
-            df_strategy = apply_friction_and_risk(
-                df_strategy,
-                buy_fee=risk_cfg["buy_fee"],
-                sell_fee=risk_cfg["sell_fee"],
-                sell_tax=risk_cfg["sell_tax"],
-                stop_loss=risk_cfg["stop_loss"],
-                take_profit=risk_cfg["take_profit"],
-            )
             df_strategy['DailyReturn'] = df_strategy['Close'].pct_change()
             df_strategy = df_strategy.dropna(subset=['DailyReturn', 'Strategy'])
             df_strategy = df_strategy[df_strategy['DailyReturn'].abs() < 0.5]
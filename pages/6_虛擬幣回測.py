@@ -5,11 +5,17 @@ import plotly.graph_objs as go
 import plotly.express as px
 from itertools import product
 from strategy import apply_strategy, strategies
-from risk import apply_friction_and_risk, calc_performance, build_risk_ui
+import crypto_strategy  # 註冊虛擬幣專屬策略（SMA/Hull、Supertrend、Stochastic RSI…）
+from crypto_strategy import finish_strategy, crypto_metrics, crypto_backtest, crypto_backtest_batch
+import opt_store
+from risk import build_risk_ui
+from optimizer import (OPT_TARGETS, SEARCH_MODES, CROSS_AGGREGATES, grid_values, rank_results,
+                       search_parameters, cross_symbol_search, default_workers, MIN_PARALLEL_ROWS)
 import ccxt
 import time
 import os
 import json
+import inspect
 
 st.title("💰 虛擬幣策略回測系統")
 
@@ -41,304 +47,6 @@ def save_best_params(symbol, strategy_name, params, metrics):
     with open(BEST_PARAM_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-# =====================
-# SMA/Hull 趨勢策略（虛擬幣專屬）
-# =====================
-def sma_hull_trend_strategy(df, params):
-    type_ = params.get("type", "sma")
-    n1    = int(params.get("n1", 30))
-    n2    = int(params.get("n2", 130))
-    df    = df.copy()
-    if type_ == "sma":
-        df['trend1'] = df['Close'].rolling(n1).mean()
-        df['trend2'] = df['Close'].rolling(n2).mean()
-    elif type_ == "hull":
-        def WMA(series, n):
-            weights = pd.Series(range(1, n + 1))
-            return series.rolling(n).apply(lambda x: (x * weights).sum() / weights.sum(), raw=True)
-        half1 = int(n1 / 2)
-        df['trend1'] = WMA(2 * WMA(df['Close'], half1) - WMA(df['Close'], n1), int(n1 ** 0.5))
-        half2 = int(n2 / 2)
-        df['trend2'] = WMA(2 * WMA(df['Close'], half2) - WMA(df['Close'], n2), int(n2 ** 0.5))
-    else:
-        df['trend1'] = df['Close']
-        df['trend2'] = df['Close']
-
-    buy  = (df['trend1'] > df['trend2']) & (df['trend1'].shift(1) <= df['trend2'].shift(1))
-    sell = (df['trend1'] < df['trend2']) & (df['trend1'].shift(1) >= df['trend2'].shift(1))
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:   position = 0
-        elif buy.iloc[i]:  position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-# =====================
-# 新增虛擬幣專屬策略
-# 根據 2025 年最熱門的量化策略研究整理
-# =====================
-
-def supertrend_strategy(df, params):
-    """
-    Supertrend 策略:結合 ATR 的趨勢追蹤指標。
-    當收盤價在 Supertrend 線上方時持有，跌破時出場。
-    2025 年虛擬幣最廣泛使用的趨勢策略之一。
-    """
-    period = int(params.get("ATR 週期", 10))
-    mult   = float(params.get("ATR 倍數", 3.0))
-    df     = df.copy()
-
-    # 計算 ATR
-    hl    = df['High'] - df['Low']
-    hc    = (df['High'] - df['Close'].shift(1)).abs()
-    lc    = (df['Low']  - df['Close'].shift(1)).abs()
-    tr    = pd.concat([hl, hc, lc], axis=1).max(axis=1)
-    atr   = tr.rolling(period).mean()
-
-    # 計算基礎上下軌
-    hl2        = (df['High'] + df['Low']) / 2
-    upper_band = hl2 + mult * atr
-    lower_band = hl2 - mult * atr
-
-    # 動態調整軌道（Supertrend 核心）
-    supertrend = pd.Series(index=df.index, dtype=float)
-    direction  = pd.Series(index=df.index, dtype=int)
-
-    for i in range(1, len(df)):
-        # 上軌
-        if upper_band.iloc[i] < upper_band.iloc[i-1] or df['Close'].iloc[i-1] > upper_band.iloc[i-1]:
-            upper_band.iloc[i] = upper_band.iloc[i]
-        else:
-            upper_band.iloc[i] = upper_band.iloc[i-1]
-        # 下軌
-        if lower_band.iloc[i] > lower_band.iloc[i-1] or df['Close'].iloc[i-1] < lower_band.iloc[i-1]:
-            lower_band.iloc[i] = lower_band.iloc[i]
-        else:
-            lower_band.iloc[i] = lower_band.iloc[i-1]
-
-    # 決定 Supertrend 方向
-    st_line = lower_band.copy()
-    dir_arr = pd.Series(1, index=df.index)
-    for i in range(1, len(df)):
-        if df['Close'].iloc[i] > upper_band.iloc[i]:
-            dir_arr.iloc[i] = 1
-        elif df['Close'].iloc[i] < lower_band.iloc[i]:
-            dir_arr.iloc[i] = -1
-        else:
-            dir_arr.iloc[i] = dir_arr.iloc[i-1]
-
-    buy  = (dir_arr == 1) & (dir_arr.shift(1) == -1)
-    sell = (dir_arr == -1) & (dir_arr.shift(1) == 1)
-
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:  position = 0
-        elif buy.iloc[i]: position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-
-def stoch_rsi_strategy(df, params):
-    """
-    Stochastic RSI 策略:對 RSI 再做隨機指標計算。
-    對超買超賣更敏感，適合虛擬幣高波動環境。
-    %K 穿越 %D 且在低位（<20）時買入，高位（>80）時賣出。
-    """
-    rsi_period   = int(params.get("RSI 週期", 14))
-    stoch_period = int(params.get("Stoch 週期", 14))
-    k_period     = int(params.get("%K 平滑", 3))
-    d_period     = int(params.get("%D 平滑", 3))
-    buy_level    = float(params.get("買入閾值", 20))
-    sell_level   = float(params.get("賣出閾值", 80))
-    df           = df.copy()
-
-    # RSI
-    delta    = df['Close'].diff()
-    gain     = delta.clip(lower=0).rolling(rsi_period).mean()
-    loss     = (-delta.clip(upper=0)).rolling(rsi_period).mean()
-    rs       = gain / loss
-    rsi      = 100 - (100 / (1 + rs))
-
-    # Stochastic of RSI
-    rsi_min  = rsi.rolling(stoch_period).min()
-    rsi_max  = rsi.rolling(stoch_period).max()
-    stoch    = (rsi - rsi_min) / (rsi_max - rsi_min + 1e-10) * 100
-    k        = stoch.rolling(k_period).mean()
-    d        = k.rolling(d_period).mean()
-
-    # 訊號：%K 穿越 %D 且在低/高區域
-    buy  = (k > d) & (k.shift(1) <= d.shift(1)) & (k < buy_level)
-    sell = (k < d) & (k.shift(1) >= d.shift(1)) & (k > sell_level)
-
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:  position = 0
-        elif buy.iloc[i]: position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-
-def atr_breakout_strategy(df, params):
-    """
-    ATR 波動突破策略:當價格突破前 N 日收盤均值 + ATR 倍數時買入。
-    根據市場波動自動調整突破門檻，適合高波動的虛擬幣市場。
-    """
-    period = int(params.get("均線週期", 20))
-    atr_p  = int(params.get("ATR 週期", 14))
-    mult   = float(params.get("突破倍數", 1.5))
-    df     = df.copy()
-
-    ma  = df['Close'].rolling(period).mean()
-    hl  = df['High'] - df['Low']
-    hc  = (df['High'] - df['Close'].shift(1)).abs()
-    lc  = (df['Low']  - df['Close'].shift(1)).abs()
-    atr = pd.concat([hl, hc, lc], axis=1).max(axis=1).rolling(atr_p).mean()
-
-    upper = ma + mult * atr
-    lower = ma - mult * atr
-
-    buy  = (df['Close'] > upper.shift(1)).fillna(False)
-    sell = (df['Close'] < lower.shift(1)).fillna(False)
-
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:  position = 0
-        elif buy.iloc[i]: position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-
-def dca_strategy(df, params):
-    """
-    DCA 定期買入策略（Dollar Cost Averaging）:
-    每隔固定天數買入一次，持有到下次買入（不主動賣出）。
-    適合長線看多、不想擇時的投資者。
-    """
-    interval = int(params.get("買入間隔（天）", 7))
-    df = df.copy()
-
-    positions = []
-    for i in range(len(df)):
-        if i % interval == 0:
-            positions.append(1)
-        else:
-            positions.append(positions[-1] if positions else 0)
-    df['Position'] = positions
-    return df
-
-
-def adx_trend_strategy(df, params):
-    """
-    ADX 趨勢強度過濾策略:
-    用 ADX 判斷趨勢強度，只在趨勢明確（ADX > 閾值）時配合均線方向進場。
-    ADX < 閾值時不進場（市場盤整），有效過濾震盪行情。
-    """
-    adx_period    = int(params.get("ADX 週期", 14))
-    adx_threshold = float(params.get("ADX 閾值", 25))
-    ma_period     = int(params.get("均線週期", 20))
-    df            = df.copy()
-
-    # 計算 ADX
-    high, low, close = df['High'], df['Low'], df['Close']
-    up_move   = high.diff()
-    down_move = -low.diff()
-    plus_dm   = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
-    minus_dm  = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
-
-    tr = pd.concat([
-        high - low,
-        (high - close.shift(1)).abs(),
-        (low  - close.shift(1)).abs()
-    ], axis=1).max(axis=1)
-
-    atr      = tr.rolling(adx_period).mean()
-    plus_di  = 100 * pd.Series(plus_dm,  index=df.index).rolling(adx_period).mean() / atr
-    minus_di = 100 * pd.Series(minus_dm, index=df.index).rolling(adx_period).mean() / atr
-    dx       = (100 * (plus_di - minus_di).abs() / (plus_di + minus_di + 1e-10))
-    adx      = dx.rolling(adx_period).mean()
-
-    ma = close.rolling(ma_period).mean()
-
-    # 趨勢夠強（ADX > 閾值）且在均線上方才買入
-    buy  = ((adx > adx_threshold) & (close > ma) & (close.shift(1) <= ma.shift(1))).fillna(False)
-    sell = ((close < ma) & (close.shift(1) >= ma.shift(1))).fillna(False)
-
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:  position = 0
-        elif buy.iloc[i]: position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-
-def vwap_strategy(df, params):
-    """
-    VWAP 均值回歸策略（Volume Weighted Average Price）:
-    結合成交量的加權均價，機構廣泛使用。
-    收盤價從 VWAP 下方回升穿越時買入，跌破時賣出。
-    """
-    period = int(params.get("VWAP 週期", 20))
-    df     = df.copy()
-
-    # 滾動 VWAP
-    typical_price = (df['High'] + df['Low'] + df['Close']) / 3
-    vwap = (typical_price * df['Volume']).rolling(period).sum() / df['Volume'].rolling(period).sum()
-
-    buy  = ((df['Close'] > vwap) & (df['Close'].shift(1) <= vwap.shift(1))).fillna(False)
-    sell = ((df['Close'] < vwap) & (df['Close'].shift(1) >= vwap.shift(1))).fillna(False)
-
-    position, positions = 0, []
-    for i in range(len(df)):
-        if sell.iloc[i]:  position = 0
-        elif buy.iloc[i]: position = 1
-        positions.append(position)
-    df['Position'] = positions
-    return df
-
-
-strategies.update({
-    "SMA/Hull 趨勢策略": {
-        "description": "短期均線與長期均線交叉策略 (SMA/HullMA)，可選 SMA 或 Hull 移動平均",
-        "parameters":  {"type": "sma", "n1": 30, "n2": 130},
-        "function":    sma_hull_trend_strategy
-    },
-    "Supertrend 策略": {
-        "description": "ATR 基礎趨勢追蹤指標，收盤價突破 Supertrend 線時進出場。2025 年虛擬幣最熱門策略之一。",
-        "parameters":  {"ATR 週期": 10, "ATR 倍數": 3.0},
-        "function":    supertrend_strategy
-    },
-    "Stochastic RSI 策略": {
-        "description": "對 RSI 再做隨機指標，對超買超賣更敏感。%K 穿越 %D 且在低位買入、高位賣出。",
-        "parameters":  {"RSI 週期": 14, "Stoch 週期": 14, "%K 平滑": 3, "%D 平滑": 3, "買入閾值": 20.0, "賣出閾值": 80.0},
-        "function":    stoch_rsi_strategy
-    },
-    "ATR 波動突破策略": {
-        "description": "根據 ATR 市場波動自動調整突破門檻，高波動時門檻更高，適合虛擬幣高波動環境。",
-        "parameters":  {"均線週期": 20, "ATR 週期": 14, "突破倍數": 1.5},
-        "function":    atr_breakout_strategy
-    },
-    "DCA 定期買入策略": {
-        "description": "每隔固定天數買入並持有（Dollar Cost Averaging），不主動賣出，適合長線看多。",
-        "parameters":  {"買入間隔（天）": 7},
-        "function":    dca_strategy
-    },
-    "ADX 趨勢強度過濾策略": {
-        "description": "ADX > 閾值時確認趨勢明確，配合均線方向進場。盤整期不交易，有效降低假訊號。",
-        "parameters":  {"ADX 週期": 14, "ADX 閾值": 25.0, "均線週期": 20},
-        "function":    adx_trend_strategy
-    },
-    "VWAP 均值回歸策略": {
-        "description": "成交量加權均價（機構廣泛使用），收盤價從 VWAP 下方穿越時買入，跌破時賣出。",
-        "parameters":  {"VWAP 週期": 20},
-        "function":    vwap_strategy
-    },
-})
-
 # =====================
 # 幣種清單
 # =====================
@@ -468,19 +176,36 @@ for param, default in strategies[strategy_name]["parameters"].items():
         opt_ranges[param] = ("float", p_min, p_max, p_step)
         col_idx += 1
 
-opt_target = st.selectbox("最佳化目標", ["夏普比率", "累積報酬率(%)", "最大回撤(%)（最小化）"])
+opt_target  = st.selectbox("最佳化目標", list(OPT_TARGETS))
+search_mode = st.selectbox(
+    "搜尋模式", list(SEARCH_MODES), format_func=SEARCH_MODES.get, key="opt_search_mode",
+    help="網格搜尋回測全部組合；其餘模式在評估預算內只回測一部分組合"
+)
 
+opt_budget = None
 if has_optimizable and opt_ranges:
     def estimate_combinations(opt_ranges):
         total = 1
-        for _, (dtype, p_min, p_max, p_step) in opt_ranges.items():
-            n = len(range(int(p_min), int(p_max) + 1, int(p_step))) if dtype == "int" \
-                else len(np.arange(p_min, p_max + p_step * 0.5, p_step))
-            total *= max(n, 1)
+        for vals in grid_values(opt_ranges).values():
+            total *= max(len(vals), 1)
         return total
     est   = estimate_combinations(opt_ranges)
-    color = "🟢" if est <= 100 else ("🟡" if est <= 500 else "🔴")
-    st.caption(f"{color} 預估參數組合數：**{est}** 組")
+    if search_mode == "grid":
+        color = "🟢" if est <= 100 else ("🟡" if est <= 500 else "🔴")
+        st.caption(f"{color} 預估參數組合數：**{est}** 組")
+    else:
+        opt_budget = st.number_input(
+            "評估預算（最多回測次數）", min_value=1, max_value=max(est, 1),
+            value=min(max(20, est // 10), est), step=10, key="opt_budget",
+            help="逐步減半在資料子集上的回測也計入預算；預算不小於組合數時等同網格搜尋"
+        )
+        st.caption(f"🎯 參數組合共 **{est}** 組，最多回測 **{opt_budget}** 次"
+                   f"（約 {est / max(opt_budget, 1):.0f} 分之 1）")
+    opt_use_store = st.checkbox(
+        "💾 記錄掃描結果（中斷後可續跑，已評估的組合直接取回）", value=True, key="opt_use_store",
+        help="以交易對、策略、日期區間、K 線週期、成本設定與價格內容為 key 存進 stock_data.db，"
+             "相同設定再次掃描時只回測尚未評估的組合"
+    )
 
 if not has_optimizable:
     st.info("此策略無數值型參數，無法進行最佳化。")
@@ -523,37 +248,18 @@ def convert_to_usdt(df, symbol, start_date, end_date, interval):
 
 def run_strategy(df, strat_name, custom_params=None, risk_cfg=None):
     p = custom_params if custom_params else strategies[strat_name]["parameters"]
-    if "function" in strategies[strat_name]:
-        df = strategies[strat_name]["function"](df.copy(), p)
-    else:
-        df = apply_strategy(df.copy(), strat_name, p)
-    # ✅ 套用摩擦成本 & 停損停利
-    if risk_cfg:
-        df = apply_friction_and_risk(df, **risk_cfg)
-    else:
-        df['DailyReturn'] = df['Close'].pct_change()
-        df['Strategy']    = df['Position'].shift(1) * df['DailyReturn']
-    df['DailyReturn'] = df['Close'].pct_change()
-    df = df.dropna(subset=['DailyReturn', 'Strategy'])
-    return df
+    df = apply_strategy(df, strat_name, p)
+    return finish_strategy(df, risk_cfg)
 
+# 績效算法與跨交易對最佳化共用 crypto_strategy 的同一份實作
 def calc_metrics(df):
-    cum_s  = (1 + df['Strategy']).cumprod()
-    sharpe = (df['Strategy'].mean() / df['Strategy'].std() * TRADING_DAYS ** 0.5
-              if df['Strategy'].std() != 0 else 0)
-    return {
-        "累積報酬率(%)": round((cum_s.iloc[-1] - 1) * 100, 2),
-        "夏普比率":       round(sharpe, 2),
-        "最大回撤(%)":    round(((cum_s - cum_s.cummax()) / cum_s.cummax()).min() * 100, 2),
-        "交易次數":       int((df['Position'].diff().abs() > 0).sum()),
-    }
+    return crypto_metrics(df, TRADING_DAYS)
 
 def run_backtest_opt(df, strat_name, test_params, risk_cfg=None):
-    try:
-        df_s = run_strategy(df, strat_name, test_params, risk_cfg=risk_cfg)
-        return calc_metrics(df_s) if not df_s.empty else None
-    except Exception:
-        return None
+    return crypto_backtest(df, strat_name, test_params, risk_cfg, TRADING_DAYS)
+
+def run_backtest_opt_batch(df, strat_name, combos, risk_cfg=None):
+    return crypto_backtest_batch(df, strat_name, combos, risk_cfg, TRADING_DAYS)
 
 def plot_single(df, crypto_code, strat_name):
     fig = go.Figure()
@@ -565,6 +271,23 @@ def plot_single(df, crypto_code, strat_name):
                       xaxis_title="日期", yaxis_title="累積報酬率")
     return fig
 
+def show_param_landscape(df_opt, int_params, best):
+    """兩個 int 參數畫熱力圖，一個畫折線圖（df_opt 已依最佳化目標排序，best 為第一列）"""
+    metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
+    if len(int_params) >= 2:
+        p1, p2   = int_params[0], int_params[1]
+        pivot    = df_opt.pivot_table(index=p1, columns=p2, values=metric_col, aggfunc="mean")
+        fig_heat = px.imshow(pivot, color_continuous_scale="RdYlGn",
+                             title=f"{strategy_name} 參數熱力圖（{p1} × {p2}）", aspect="auto")
+        st.plotly_chart(fig_heat, use_container_width=True)
+    elif len(int_params) == 1:
+        p1       = int_params[0]
+        df_line  = df_opt.groupby(p1)[metric_col].mean().reset_index()
+        fig_line = px.line(df_line, x=p1, y=metric_col, title=f"{p1} 對 {metric_col} 的影響", markers=True)
+        fig_line.add_vline(x=best[p1], line_dash="dash", line_color="red",
+                           annotation_text=f"最佳={best[p1]}")
+        st.plotly_chart(fig_line, use_container_width=True)
+
 def plot_comparison_line(result_map):
     fig = go.Figure()
     for (crypto_code, strat_name), df in result_map.items():
@@ -694,31 +417,65 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     df_raw = convert_to_usdt(df_raw, opt_symbol, start_date, end_date, interval)
 
     # 建立參數網格
-    param_names, param_values = [], []
-    for param, (dtype, p_min, p_max, p_step) in opt_ranges.items():
-        param_names.append(param)
-        vals = list(range(int(p_min), int(p_max)+1, int(p_step))) if dtype == "int" \
-               else [round(v, 4) for v in np.arange(p_min, p_max + p_step*0.5, p_step)]
-        param_values.append(vals)
+    space        = grid_values(opt_ranges)
+    param_names  = list(space)
+    param_values = list(space.values())
 
     fixed_params = {k: v for k, v in params.items() if k not in opt_ranges}
     all_combos   = list(product(*param_values))
     total        = len(all_combos)
 
-    st.info(f"🔄 共 {total} 組參數組合，開始掃描...")
     progress_bar = st.progress(0)
     status_text  = st.empty()
+    # ✅ 掃描紀錄：相同交易對 / 策略 / 日期 / 週期 / 成本設定 / 價格內容的組合直接取回
+    sweep = opt_store.open_sweep(opt_symbol, strategy_name, start_date, end_date, risk_cfg,
+                                 prices=df_raw, interval=interval,
+                                 trading_days=TRADING_DAYS) if opt_use_store else None
+
+    if search_mode == "grid":
+        # ✅ 內建策略批次計算整個網格的持倉矩陣
+        combo_params = [{**dict(zip(param_names, combo)), **fixed_params} for combo in all_combos]
+        scored, missing = opt_store.lookup(sweep, combo_params) if sweep else ([None] * total, list(range(total)))
+        done = total - len(missing)
+        if done:
+            st.info(f"🔄 共 {total} 組參數組合，{done} 組已有紀錄，繼續掃描其餘 {len(missing)} 組...")
+        else:
+            st.info(f"🔄 共 {total} 組參數組合，開始掃描...")
+        unsaved = []
+        for i, m in zip(missing, run_backtest_opt_batch(df_raw, strategy_name,
+                                                        [combo_params[i] for i in missing], risk_cfg)):
+            scored[i] = m
+            unsaved.append(i)
+            done += 1
+            progress_bar.progress(done/total)
+            if done % 20 == 0 or done == total:
+                if sweep:
+                    opt_store.record(sweep, [combo_params[i] for i in unsaved], [scored[i] for i in unsaved])
+                unsaved = []
+                status_text.text(f"進度：{done}/{total} 完成，有效結果：{sum(m is not None for m in scored)} 組")
+        results = [{**test_params, **m} for test_params, m in zip(combo_params, scored) if m]
+    else:
+        st.info(f"🔄 {SEARCH_MODES[search_mode]}：{total} 組參數組合，最多回測 {opt_budget} 次...")
+
+        def run_combos(combos, data):
+            return list(run_backtest_opt_batch(data, strategy_name, combos, risk_cfg))
+
+        if sweep:
+            run_combos = opt_store.cached_evaluate(sweep, run_combos, df_raw)
 
-    results = []
-    for i, combo in enumerate(all_combos):
-        test_params = dict(zip(param_names, combo))
-        test_params.update(fixed_params)
-        m = run_backtest_opt(df_raw, strategy_name, test_params, risk_cfg=risk_cfg)
-        if m:
-            results.append({**test_params, **m})
-        progress_bar.progress((i+1)/total)
-        if (i+1) % 20 == 0 or (i+1) == total:
-            status_text.text(f"進度：{i+1}/{total} 完成，有效結果：{len(results)} 組")
+        def evaluate(combos, data):
+            return run_combos([{**c, **fixed_params} for c in combos], data)
+
+        def on_progress(used, budget):
+            progress_bar.progress(min(used / budget, 1.0))
+            status_text.text(f"進度：已回測 {used}/{budget} 次")
+
+        found   = search_parameters(search_mode, space, evaluate, df_raw, opt_target,
+                                    budget=opt_budget, progress=on_progress)
+        results = [{**test_params, **fixed_params, **m} for test_params, m in found["results"]]
+        st.caption(f"🎯 實際回測 {found['evaluations']} 次（網格共 {found['total']} 組），"
+                   f"全期間回測 {len(found['results'])} 組，回測 K 棒合計 {found['bar_evaluations']:,} 根"
+                   + (f"；{run_combos.stats['reused']} 組取自掃描紀錄" if sweep else ""))
 
     progress_bar.empty()
     status_text.empty()
@@ -726,13 +483,8 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     if not results:
         st.error("❌ 所有組合均無有效結果"); st.stop()
 
-    df_opt = pd.DataFrame(results)
-    if opt_target == "最大回撤(%)（最小化）":
-        df_opt = df_opt.sort_values("最大回撤(%)", ascending=True)
-    elif opt_target == "夏普比率":
-        df_opt = df_opt.sort_values("夏普比率", ascending=False)
-    else:
-        df_opt = df_opt.sort_values("累積報酬率(%)", ascending=False)
+    # 最大回撤為負值，越接近 0 越好
+    df_opt = rank_results(pd.DataFrame(results), opt_target)
 
     best = df_opt.iloc[0]
     st.success(f"✅ 掃描完成！共 {len(df_opt)} 組有效結果")
@@ -759,22 +511,7 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     )
 
     # 熱力圖
-    int_params = [p for p in param_names if opt_ranges[p][0] == "int"]
-    if len(int_params) >= 2:
-        p1, p2     = int_params[0], int_params[1]
-        metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
-        pivot      = df_opt.pivot_table(index=p1, columns=p2, values=metric_col, aggfunc="mean")
-        fig_heat   = px.imshow(pivot, color_continuous_scale="RdYlGn",
-                               title=f"{strategy_name} 參數熱力圖（{p1} × {p2}）", aspect="auto")
-        st.plotly_chart(fig_heat, use_container_width=True)
-    elif len(int_params) == 1:
-        p1         = int_params[0]
-        metric_col = "夏普比率" if opt_target == "夏普比率" else "累積報酬率(%)"
-        df_line    = df_opt.groupby(p1)[metric_col].mean().reset_index()
-        fig_line   = px.line(df_line, x=p1, y=metric_col, title=f"{p1} 對 {metric_col} 的影響", markers=True)
-        fig_line.add_vline(x=best[p1], line_dash="dash", line_color="red",
-                           annotation_text=f"最佳={best[p1]}")
-        st.plotly_chart(fig_line, use_container_width=True)
+    show_param_landscape(df_opt, [p for p in param_names if opt_ranges[p][0] == "int"], best)
 
     # 最佳參數回測圖
     st.markdown("### 📈 使用最佳參數執行回測")
@@ -823,12 +560,145 @@ if has_optimizable and st.button("⚙️ 開始參數最佳化"):
     }
     st.session_state["pending_best_stock"]    = opt_symbol
     st.session_state["pending_best_strategy"] = strategy_name
+    st.session_state.pop("pending_best_symbols", None)
 
     st.warning(
         "⚠️ **過度擬合警告**：最佳參數基於歷史資料，不代表未來同樣有效。"
         "建議搭配不同時間段驗證。"
     )
 
+# =====================
+# 過往最佳化紀錄（直接從資料庫載入，不重新回測）
+# =====================
+if has_optimizable and first_code:
+    with st.expander("📂 過往最佳化紀錄", expanded=False):
+        sweeps = opt_store.list_sweeps(first_code, strategy_name)
+        if sweeps.empty:
+            st.caption(f"尚無 {first_code} × {strategy_name} 的掃描紀錄")
+        else:
+            sweep_labels = {
+                row.sweep_id: f"{row.start_date} ~ {row.end_date}｜{row.n_results} 組｜"
+                              f"{'含成本設定' if row.risk_cfg != '{}' else '無成本'}｜更新於 {row.updated_at}"
+                for row in sweeps.itertuples()
+            }
+            chosen = st.selectbox("選擇掃描", list(sweep_labels), format_func=sweep_labels.get,
+                                  key="opt_past_sweep")
+            col_l, col_d = st.columns([3, 1])
+            if col_d.button("🗑️ 刪除此紀錄", key="opt_delete_sweep"):
+                opt_store.delete_sweep(chosen)
+                st.rerun()
+            if col_l.button("📂 載入結果", key="opt_load_sweep"):
+                df_past = opt_store.load_sweep(chosen)
+                if df_past.empty:
+                    st.warning("此掃描沒有有效結果")
+                else:
+                    df_past   = rank_results(df_past, opt_target)
+                    past_ints = [p for p, v in strategies[strategy_name]["parameters"].items()
+                                 if isinstance(v, int) and p in df_past and df_past[p].nunique() > 1]
+                    st.dataframe(
+                        df_past.head(20).style.format({"累積報酬率(%)": "{:.2f}%", "夏普比率": "{:.2f}",
+                                                       "最大回撤(%)": "{:.2f}%"}),
+                        use_container_width=True
+                    )
+                    show_param_landscape(df_past, past_ints, df_past.iloc[0])
+
+# =====================
+# 跨交易對交叉驗證最佳化
+# =====================
+if has_optimizable:
+    st.markdown("---")
+    st.markdown("## 🌐 跨交易對交叉驗證最佳化")
+    st.caption("每組參數在所有選定的交易對上回測，以聚合分數排序，避免只對單一交易對過度擬合。"
+               "參數範圍與上方最佳化設定相同，一律掃描全部組合。")
+    cv_c1, cv_c2 = st.columns(2)
+    cv_aggregate = cv_c1.selectbox("排序依據", list(CROSS_AGGREGATES), key="cv_aggregate",
+                                   help="中位數夏普：多數交易對的典型表現；最差最大回撤：最壞情況下的回撤（越接近 0 越好）")
+    cv_workers   = cv_c2.number_input(
+        "平行處理程序數", min_value=1, max_value=max(default_workers(), 1) * 2,
+        value=default_workers(), step=1, key="cv_workers",
+        help=f"「交易對 × 參數組合」分給多個行程同時計算；回測總數少於 {MIN_PARALLEL_ROWS} 次時直接在目前行程計算"
+    )
+
+if has_optimizable and st.button("🌐 開始跨交易對最佳化"):
+    if len(selected_cryptos) < 2:
+        st.error("請至少選擇兩個交易對"); st.stop()
+
+    # 下載結果由 fetch_crypto_data 快取，/BTC 交易對換算用的 BTC/USDT 也只下載一次
+    frames = {}
+    with st.spinner("下載各交易對資料中..."):
+        for crypto in selected_cryptos:
+            symbol = crypto.split("(")[-1].strip(")")
+            df_sym = fetch_crypto_data(symbol, start_date, end_date, interval)
+            if df_sym.empty:
+                st.warning(f"⚠️ {symbol} 無資料，已略過")
+                continue
+            frames[symbol] = convert_to_usdt(df_sym, symbol, start_date, end_date, interval)
+    if len(frames) < 2:
+        st.error("❌ 有資料的交易對不足兩個"); st.stop()
+
+    space        = grid_values(opt_ranges)
+    param_names  = list(space)
+    fixed_params = {k: v for k, v in params.items() if k not in opt_ranges}
+    combo_params = [{**dict(zip(param_names, combo)), **fixed_params} for combo in product(*space.values())]
+    total        = len(combo_params) * len(frames)
+
+    st.info(f"🔄 {len(combo_params)} 組參數 × {len(frames)} 個交易對，共 {total} 次回測...")
+    progress_bar = st.progress(0)
+    status_text  = st.empty()
+
+    def on_progress(done, total):
+        progress_bar.progress(done / total)
+        status_text.text(f"進度：{done}/{total} 次回測完成")
+
+    df_cv, per_symbol = cross_symbol_search(frames, strategy_name, combo_params, cv_aggregate,
+                                            risk_cfg=risk_cfg, workers=cv_workers,
+                                            trading_days=TRADING_DAYS, progress=on_progress,
+                                            evaluate=crypto_backtest_batch)
+    progress_bar.empty()
+    status_text.empty()
+    if df_cv.empty:
+        st.error("❌ 所有組合均無有效結果"); st.stop()
+
+    best    = df_cv.iloc[0]
+    best_j  = int(best.name)
+    st.success(f"✅ 掃描完成！依「{cv_aggregate}」排序，共 {len(df_cv)} 組有效結果")
+
+    st.markdown("### 🏆 最佳參數組合")
+    best_cols = st.columns(len(param_names) + 3)
+    for i, p in enumerate(param_names):
+        best_cols[i].metric(p, best[p])
+    best_cols[len(param_names)].metric("中位數夏普",   f"{best['中位數夏普比率']:.2f}")
+    best_cols[len(param_names)+1].metric("最差夏普",   f"{best['最差夏普比率']:.2f}")
+    best_cols[len(param_names)+2].metric("最差回撤",   f"{best['最差最大回撤(%)']:.2f}%")
+
+    st.markdown("### 📋 最佳參數在各交易對的表現")
+    st.dataframe(pd.DataFrame([
+        {"交易對": symbol, **(per_symbol[symbol][best_j] or {})} for symbol in frames
+    ]).style.format({"累積報酬率(%)": "{:.2f}%", "夏普比率": "{:.2f}", "最大回撤(%)": "{:.2f}%"}, na_rep="N/A"),
+        use_container_width=True, hide_index=True)
+
+    st.markdown("### 📋 Top 20 參數組合")
+    agg_cols = list(CROSS_AGGREGATES)
+    st.dataframe(
+        df_cv.head(20).style.format({c: "{:.2f}" for c in agg_cols})
+            .background_gradient(subset=agg_cols, cmap="RdYlGn"),
+        use_container_width=True, hide_index=True
+    )
+
+    best_params_to_save = {p: (int(best[p]) if isinstance(strategies[strategy_name]["parameters"].get(p, 0), int)
+                               else round(float(best[p]), 4))
+                           for p in param_names}
+    best_params_to_save.update(fixed_params)
+    st.session_state["pending_best_params"]   = best_params_to_save
+    st.session_state["pending_best_symbols"]  = {
+        symbol: {k: float(per_symbol[symbol][best_j][k]) for k in ("累積報酬率(%)", "夏普比率", "最大回撤(%)")}
+        for symbol in frames if per_symbol[symbol][best_j]
+    }
+    first_symbol = next(iter(st.session_state["pending_best_symbols"]))
+    st.session_state["pending_best_metrics"]  = st.session_state["pending_best_symbols"][first_symbol]
+    st.session_state["pending_best_stock"]    = first_symbol
+    st.session_state["pending_best_strategy"] = strategy_name
+
 # =====================
 # 儲存最佳參數（在最佳化 block 外，避免 rerun 後變數消失）
 # =====================
@@ -837,11 +707,13 @@ if "pending_best_params" in st.session_state:
     pending_strategy = st.session_state.get("pending_best_strategy", "")
     pending_params   = st.session_state["pending_best_params"]
     pending_metrics  = st.session_state["pending_best_metrics"]
+    # 跨交易對最佳化：同一組參數分別以各交易對自己的績效儲存
+    pending_symbols  = st.session_state.get("pending_best_symbols") or {pending_symbol: pending_metrics}
 
     st.markdown("---")
     st.markdown("### 💾 儲存最佳化結果")
     st.info(
-        f"**{pending_symbol} × {pending_strategy}** 最佳參數：" +
+        f"**{'、'.join(pending_symbols)} × {pending_strategy}** 最佳參數：" +
         "、".join([f"{k}={v}" for k, v in pending_params.items()]) +
         f"　｜　報酬率 {pending_metrics['累積報酬率(%)']:.2f}%、"
         f"夏普 {pending_metrics['夏普比率']:.2f}、"
@@ -851,15 +723,17 @@ if "pending_best_params" in st.session_state:
     col_s1, col_s2 = st.columns([2, 1])
     with col_s1:
         if st.button("💾 儲存最佳參數（套用至回測 & 策略比較）", type="primary"):
-            save_best_params(pending_symbol, pending_strategy, pending_params, pending_metrics)
-            ss_key = f"use_best_{pending_symbol}_{pending_strategy}"
-            st.session_state[ss_key] = True
+            for symbol, metrics in pending_symbols.items():
+                save_best_params(symbol, pending_strategy, pending_params, metrics)
+                st.session_state[f"use_best_{symbol}_{pending_strategy}"] = True
             del st.session_state["pending_best_params"]
+            st.session_state.pop("pending_best_symbols", None)
             st.success("✅ 已儲存！頁面將重新整理，可套用最佳參數進行回測。")
             st.rerun()
     with col_s2:
         if st.button("🗑️ 捨棄"):
             del st.session_state["pending_best_params"]
+            st.session_state.pop("pending_best_symbols", None)
             st.rerun()
 
 
@@ -976,17 +850,8 @@ def generate_bot_code(
         "Supertrend 策略":
 """    atr_p = int(p.get("ATR 週期", 10))
     mult  = float(p.get("ATR 倍數", 3.0))
-    hl2   = (high + low) / 2
-    tr    = pd.concat([high-low,(high-close.shift(1)).abs(),(low-close.shift(1)).abs()],axis=1).max(axis=1)
-    atr   = tr.rolling(atr_p).mean()
-    upper_b = hl2 + mult * atr
-    lower_b = hl2 - mult * atr
-    dir_ = pd.Series(1, index=close.index)
-    for i in range(1, len(close)):
-        if   close.iloc[i] > upper_b.iloc[i]: dir_.iloc[i] = 1
-        elif close.iloc[i] < lower_b.iloc[i]: dir_.iloc[i] = -1
-        else:                                  dir_.iloc[i] = dir_.iloc[i-1]
-    is_bullish = bool(dir_.iloc[-1] == 1)""",
+    _, _, _, position = supertrend(high, low, close, atr_p, mult)
+    is_bullish = bool(position[-1] == 1)""",
         "Stochastic RSI 策略":
 """    rsi_p   = int(p.get("RSI 週期", 14))
     stoch_p = int(p.get("Stoch 週期", 14))
@@ -1006,13 +871,10 @@ def generate_bot_code(
     is_bullish = bool(close.iloc[-1] > vwap.iloc[-1])""",
         "SMA/Hull 趨勢策略":
 """    n1, n2 = int(p.get("n1", 30)), int(p.get("n2", 130))
-    def wma(s, n):
-        w = pd.Series(range(1, n+1))
-        return s.rolling(n).apply(lambda x: (x*w).sum()/w.sum(), raw=True)
-    def hma(s, n):
-        h = int(n/2)
-        return wma(2*wma(s, h) - wma(s, n), int(n**0.5))
-    t1, t2 = hma(close, n1), hma(close, n2)
+    if p.get("type", "sma") == "hull":
+        t1, t2 = hull_moving_average(close, n1), hull_moving_average(close, n2)
+    else:
+        t1, t2 = close.rolling(n1).mean(), close.rolling(n2).mean()
     is_bullish = bool(t1.iloc[-1] > t2.iloc[-1])""",
         "ATR 波動突破策略":
 """    period = int(p.get("均線週期", 20))
@@ -1042,7 +904,15 @@ def generate_bot_code(
     is_bullish = (dt_.datetime.utcnow().timetuple().tm_yday % interval == 0)""",
     }
 
-    strategy_logic = strategy_logic_map.get(strategy_name, strategy_logic_map["SMA/Hull 趨勢策略"])
+    logic_key      = strategy_name if strategy_name in strategy_logic_map else "SMA/Hull 趨勢策略"
+    strategy_logic = strategy_logic_map[logic_key]
+
+    # ✅ 與回測共用的指標函式（只依賴 numpy / pandas），以原始碼內嵌進機器人
+    helper_map = {
+        "SMA/Hull 趨勢策略": [crypto_strategy.wma, crypto_strategy.hull_moving_average],
+        "Supertrend 策略":   [crypto_strategy.supertrend_kernel, crypto_strategy.supertrend],
+    }
+    helpers = "".join(inspect.getsource(f) + "\n" for f in helper_map.get(logic_key, []))
 
     import datetime as _dt
     generated_at = _dt.datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -1141,7 +1011,7 @@ def get_ohlcv(exchange, symbol, freq, lookback):
     df.set_index("Date", inplace=True)
     return df
 
-def get_signal(df, p):
+{helpers}def get_signal(df, p):
     \"\"\"回傳 is_bullish: True=看多, False=看空\"\"\"
     close  = df["Close"]
     high   = df["High"]
@@ -1252,6 +1122,7 @@ if __name__ == "__main__":
         bot_name        = bot_name,
         bot_name_safe   = bot_name.replace("/", "-").replace(" ", "_").replace("\\", "-"),
         strategy_logic  = strategy_logic,
+        helpers         = helpers,
     )
 
 
@@ -1,13 +1,13 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import requests
 import json
 import os
 from datetime import datetime, date
-from strategy import apply_strategy, strategies, stock_list
-from database import load_stock_prices, save_stock_prices
-from risk import apply_friction_and_risk, build_risk_ui
+from strategy import strategies, stock_list
+from price_sync import load_synced_prices, load_synced_prices_many
+from risk import build_risk_ui
+from backtest_cache import run_backtest_cached
 
 st.title("🔔 策略訊號推播")
 st.caption("設定監控清單與策略，手動觸發或每日定時推播買賣訊號至 Line Notify 或 Email。")
@@ -68,33 +68,30 @@ with st.sidebar:
 # 抓股價（共用）
 # =====================
 def fetch_price(stock_code, days=120):
-    """抓最近 N 天股價，先從 DB，沒有就從網路"""
+    """抓最近 N 天股價，DB 缺少的日期區間才從網路補"""
     end   = date.today()
     start = pd.Timestamp(end) - pd.Timedelta(days=days)
-    df    = load_stock_prices(stock_code, start.date(), end)
-    if not df.empty:
-        df.index = pd.to_datetime(df.index)
-        return df
     try:
-        df = yf.download(stock_code, start=start, end=end, auto_adjust=False, progress=False)
-        if df.empty:
-            return pd.DataFrame()
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = [col[0] for col in df.columns]
-        df.reset_index(inplace=True)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        save_stock_prices(df, stock_code)
-        return df
+        return load_synced_prices(stock_code, start.date(), end)
     except Exception:
         return pd.DataFrame()
 
-def get_signal(stock_code, strategy_name, params, risk_cfg=None):
+def fetch_prices(stock_codes, days=120):
+    """多支股票版 fetch_price：補齊缺口後以單一查詢讀出，回傳 {code: df}"""
+    end   = date.today()
+    start = pd.Timestamp(end) - pd.Timedelta(days=days)
+    try:
+        return load_synced_prices_many(stock_codes, start.date(), end)
+    except Exception:
+        return {code: pd.DataFrame() for code in stock_codes}
+
+def get_signal(stock_code, strategy_name, params, risk_cfg=None, df=None):
     """
-    取得最新訊號：
+    取得最新訊號（df 為預先讀好的股價，None 時自行抓取）：
     回傳 dict：signal（持有/買入/空手）、last_date、close、pnl_unrealized
     """
-    df = fetch_price(stock_code)
+    if df is None:
+        df = fetch_price(stock_code)
     if df.empty or 'Close' not in df.columns:
         return None
 
@@ -102,13 +99,10 @@ def get_signal(stock_code, strategy_name, params, risk_cfg=None):
     df = df[df['Close'].notna()].sort_index()
 
     try:
-        df_s = apply_strategy(df, strategy_name, params)
+        df_s = run_backtest_cached(df, strategy_name, params, risk_cfg)
     except Exception:
         return None
 
-    if risk_cfg:
-        df_s = apply_friction_and_risk(df_s, **risk_cfg)
-
     pos_col = 'Position_adj' if 'Position_adj' in df_s.columns else 'Position'
     last_pos  = int(df_s[pos_col].iloc[-1])
     last_date = df_s.index[-1].date()
@@ -249,8 +243,10 @@ if st.button("🔍 立即檢查所有股票訊號", type="primary"):
     hold_list   = []
 
     with st.spinner("檢查中..."):
+        price_map = fetch_prices(monitor_codes)
         for code in monitor_codes:
-            r = get_signal(code, monitor_strategy, monitor_params, risk_cfg)
+            r = get_signal(code, monitor_strategy, monitor_params, risk_cfg,
+                           df=price_map.get(code, pd.DataFrame()))
             if r is None:
                 st.warning(f"⚠️ {code} 無法取得訊號，跳過")
                 continue
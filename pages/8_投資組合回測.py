@@ -4,9 +4,10 @@ import numpy as np
 import plotly.graph_objs as go
 import plotly.express as px
 import yfinance as yf
-from strategy import apply_strategy, strategies, stock_list
-from database import load_stock_prices, save_stock_prices
-from risk import apply_friction_and_risk, calc_performance, build_risk_ui
+from strategy import strategies, stock_list
+from price_sync import load_synced_prices_many
+from risk import build_risk_ui
+from backtest_cache import run_backtest_cached
 
 st.title("💼 投資組合回測")
 st.caption("同時持有多支股票，設定各自權重，計算整體投組報酬率、風險與大盤比較。")
@@ -117,29 +118,15 @@ st.markdown("---")
 # 輔助函式
 # =====================
 @st.cache_data(show_spinner=False)
-def fetch_price(stock_code, start_date, end_date):
-    df = load_stock_prices(stock_code, start_date, end_date)
-    if not df.empty:
-        df.index = pd.to_datetime(df.index)
-        return df
+def fetch_prices(stock_codes, start_date, end_date):
+    # ✅ 增量同步後，所有股票以單一查詢讀出，回傳 {code: df}
     try:
-        df = yf.download(stock_code, start=start_date, end=end_date,
-                         auto_adjust=False, progress=False)
-        if df.empty:
-            return pd.DataFrame()
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = [col[0] for col in df.columns]
-        df.reset_index(inplace=True)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        save_stock_prices(df, stock_code)
-        return df
+        return load_synced_prices_many(list(stock_codes), start_date, end_date)
     except Exception:
-        return pd.DataFrame()
+        return {code: pd.DataFrame() for code in stock_codes}
 
-def get_stock_return_series(stock_code, start_date, end_date, strategy_name, params, risk_cfg):
-    """取得單一股票的日報酬率序列"""
-    df = fetch_price(stock_code, start_date, end_date)
+def get_stock_return_series(df, strategy_name, params, risk_cfg):
+    """取得單一股票的日報酬率序列（df 為該股票股價）"""
     if df.empty or 'Close' not in df.columns:
         return None
 
@@ -148,10 +135,9 @@ def get_stock_return_series(stock_code, start_date, end_date, strategy_name, par
 
     if strategy_name:
         try:
-            df = apply_strategy(df, strategy_name, params)
+            df = run_backtest_cached(df, strategy_name, params, risk_cfg)
         except Exception:
             return None
-        df = apply_friction_and_risk(df, **risk_cfg)
         df['DailyReturn'] = df['Close'].pct_change()
         return_col = 'Strategy'
     else:
@@ -271,9 +257,10 @@ if st.button("🚀 開始投組回測", type="primary"):
     failed_codes = []
 
     with st.spinner("下載股票資料並計算回測中..."):
+        price_map = fetch_prices(tuple(stock_codes), start_date, end_date)
         for code in stock_codes:
             r = get_stock_return_series(
-                code, start_date, end_date,
+                price_map.get(code, pd.DataFrame()).copy(),
                 strategy_name, strategy_params, risk_cfg
             )
             if r is None or r.empty:
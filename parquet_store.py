@@ -0,0 +1,123 @@
+# parquet_store.py
+# 欄式股價儲存（選用）：每支股票一個 Parquet 檔，Date 以 timestamp 原生型別儲存
+# 由 database.py 依 PRICE_STORE_BACKEND=parquet 切換使用，API 與 SQLite 版相同
+#
+# 每個檔案依 ROW_GROUP_SIZE（約一年交易日）切成 row group，
+# 讀取時把日期區間轉成 filters，pyarrow 會依 row group 統計值直接跳過區間外的資料，
+# 再以 memory_map 讀檔，不需要逐列解析日期字串。
+
+import os
+from urllib.parse import quote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Streamlit Cloud 唯讀目錄，改存 /tmp/
+_IS_CLOUD  = os.path.exists("/mount/src")
+_STORE_DIR = os.path.join("/tmp" if _IS_CLOUD else ".", "price_store")
+
+PRICE_COLUMNS  = ["Open", "High", "Low", "Close", "Volume", "Adj Close"]
+ROW_GROUP_SIZE = 256   # 約一年的日線
+
+
+def _schema():
+    return pa.schema(
+        [("Date", pa.timestamp("ns"))] +
+        [(c, pa.int64() if c == "Volume" else pa.float64()) for c in PRICE_COLUMNS]
+    )
+
+
+def _symbol_path(stock_code: str) -> str:
+    # ^TWII、BTC/USDT 之類的代號含特殊字元，以 URL 編碼當檔名
+    return os.path.join(_STORE_DIR, f"{quote(stock_code, safe='')}.parquet")
+
+
+def _empty_frame() -> pd.DataFrame:
+    df = pd.DataFrame(columns=PRICE_COLUMNS + ["stock_code"])
+    df.index = pd.DatetimeIndex([], name="Date")
+    return df
+
+
+def _to_table(df: pd.DataFrame):
+    n      = len(df)
+    arrays = [pa.array(pd.to_datetime(df["Date"]).values.astype("datetime64[ns]"))]
+    for col in PRICE_COLUMNS:
+        values = df[col] if col in df.columns else pd.Series([None] * n, dtype=float)
+        if col == "Volume":
+            values = pd.to_numeric(values, errors="coerce").round()
+        arrays.append(pa.array(values.to_numpy(dtype=float), type=pa.float64(),
+                               from_pandas=True))
+    table = pa.Table.from_arrays(arrays, names=["Date"] + PRICE_COLUMNS)
+    return table.cast(_schema())
+
+
+def _read_table(stock_code: str, start_date=None, end_date=None, columns=None):
+    path = _symbol_path(stock_code)
+    if not os.path.exists(path):
+        return None
+    filters = []
+    if start_date:
+        filters.append(("Date", ">=", pd.Timestamp(str(start_date))))
+    if end_date:
+        filters.append(("Date", "<=", pd.Timestamp(str(end_date))))
+    return pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+
+
+def save_prices(df: pd.DataFrame, stock_code: str):
+    """
+    寫入已正規化（含 Date 欄）的股價，與既有檔案合併：
+    同一天以新資料為準（等同 SQLite 的 INSERT OR REPLACE）。
+    """
+    if df.empty:
+        return
+    os.makedirs(_STORE_DIR, exist_ok=True)
+    new_table = _to_table(df)
+
+    path = _symbol_path(stock_code)
+    if os.path.exists(path):
+        old   = pq.read_table(path, memory_map=True)
+        keep  = pc.invert(pc.is_in(old["Date"], value_set=new_table["Date"]))
+        new_table = pa.concat_tables([old.filter(keep), new_table])
+    new_table = new_table.sort_by("Date")
+
+    # 先寫暫存檔再 rename，避免其他 session 讀到寫一半的檔案
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    pq.write_table(new_table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+def load_prices(stock_code: str, start_date=None, end_date=None) -> pd.DataFrame:
+    table = _read_table(stock_code, start_date, end_date)
+    if table is None or table.num_rows == 0:
+        return _empty_frame()
+    df = table.to_pandas()
+    df["stock_code"] = stock_code
+    df.set_index("Date", inplace=True)
+    return df
+
+
+def delete_prices(stock_code: str):
+    path = _symbol_path(stock_code)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def get_latest_date(stock_code: str):
+    table = _read_table(stock_code, columns=["Date"])
+    if table is None or table.num_rows == 0:
+        return None
+    return pd.Timestamp(pc.max(table["Date"]).as_py()).strftime("%Y-%m-%d")
+
+
+def get_stored_dates(stock_code: str, start_date=None, end_date=None) -> pd.DatetimeIndex:
+    table = _read_table(stock_code, start_date, end_date, columns=["Date"])
+    if table is None:
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(table["Date"].to_pandas())
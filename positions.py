@@ -0,0 +1,24 @@
+# positions.py
+# 訊號 → 持倉狀態機（只依賴 numpy）
+# strategy.py 與 risk.py 共用；risk.py 不 import strategy，
+# 避免載入 strategy 時連帶讀取 stocks.db 等初始化成本
+
+import numpy as np
+
+
+def build_position_array(buy, sell) -> np.ndarray:
+    """
+    strategy._build_position 的 NumPy 版本，buy / sell 可為 1-D（bars）或 2-D（bars × 組合）布林陣列。
+
+    每根 K 棒的事件：sell → 0、buy → 1（同時出現 sell 優先）、皆無 → -1；
+    持倉 = 最近一次事件的值（以事件索引的 maximum.accumulate 向前填補），
+    第一個事件之前為 0（空手）。結果與逐根迴圈完全相同。
+    """
+    buy  = np.asarray(buy,  dtype=bool)
+    sell = np.asarray(sell, dtype=bool)
+    event = np.where(sell, 0, np.where(buy, 1, -1))
+
+    bars  = np.arange(event.shape[0]).reshape((-1,) + (1,) * (event.ndim - 1))
+    last  = np.maximum.accumulate(np.where(event >= 0, bars, -1), axis=0)
+    value = np.take_along_axis(event, np.maximum(last, 0), axis=0)
+    return np.where(last >= 0, value, 0).astype(np.int64)
@@ -0,0 +1,153 @@
+# price_sync.py
+# 股價增量同步：只下載本地缺少的日期區間（開頭、結尾、中間斷層），寫回 SQLite 後再讀出
+# 回測、策略比較、訊號推播、投資組合頁面都從這裡取股價
+
+import pandas as pd
+import yfinance as yf
+
+from database import (
+    load_stock_prices, load_stock_prices_many, save_stock_prices, get_latest_date,
+    get_stored_dates, load_price_coverage, save_price_coverage,
+)
+
+# 相鄰兩筆資料相隔超過此日曆天數才視為斷層（春節連假最長約 9 天）
+MAX_GAP_DAYS = 10
+# 結束日在今天前幾天內視為「尚在更新」的尾端，只記錄實際拿到的最後一天
+LIVE_TAIL_DAYS = 3
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+
+def fetch_stock_data_from_web(stock_code, start_date, end_date):
+    """從 yfinance 下載日線（end_date 不含當日，與 yf.download 相同）"""
+    df = yf.download(stock_code, start=start_date, end=end_date,
+                     auto_adjust=False, progress=False)
+    if df.empty:
+        return df
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [col[0] for col in df.columns]
+    df.reset_index(inplace=True)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df.set_index('Date', inplace=True)
+    return df
+
+
+def _merge_intervals(intervals: list) -> list:
+    """合併重疊或相鄰（差一天）的日期區間"""
+    merged = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1] + _ONE_DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def _coverage_from_dates(dates: pd.DatetimeIndex) -> list:
+    """
+    舊資料沒有同步紀錄時，從已存的交易日推估已涵蓋的區間：
+    相鄰交易日差距超過 MAX_GAP_DAYS 就切開，視為中間斷層。
+    """
+    if len(dates) == 0:
+        return []
+    gaps   = dates[1:] - dates[:-1]
+    breaks = [i + 1 for i, g in enumerate(gaps) if g > pd.Timedelta(days=MAX_GAP_DAYS)]
+    bounds = [0] + breaks + [len(dates)]
+    return [(dates[a], dates[b - 1]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _current_coverage(stock_code: str) -> list:
+    coverage = load_price_coverage(stock_code)
+    if not coverage and get_latest_date(stock_code):
+        coverage = _coverage_from_dates(get_stored_dates(stock_code))
+    return coverage
+
+
+def _subtract(start, end, coverage: list) -> list:
+    """[start, end] 扣掉已涵蓋區間後剩下的缺口"""
+    missing, cursor = [], start
+    for s, e in coverage:
+        if e < cursor or s > end:
+            continue
+        if s > cursor:
+            missing.append((cursor, s - _ONE_DAY))
+        cursor = max(cursor, e + _ONE_DAY)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    # 整段都是週末的缺口不可能有資料，不必下載
+    return [(s, e) for s, e in missing if len(pd.bdate_range(s, e)) > 0]
+
+
+def find_missing_ranges(stock_code: str, start_date, end_date) -> list:
+    """回傳 [start_date, end_date] 內尚未同步的日期區間 [(start, end), ...]（含頭尾）"""
+    today = pd.Timestamp.today().normalize()
+    start = pd.Timestamp(start_date).normalize()
+    end   = min(pd.Timestamp(end_date).normalize(), today)
+    if start > end:
+        return []
+    return _subtract(start, end, _current_coverage(stock_code))
+
+
+def sync_stock_prices(stock_code: str, start_date, end_date,
+                      fetcher=fetch_stock_data_from_web) -> int:
+    """
+    只下載缺少的區間並寫入資料庫，回傳新寫入的列數。
+    下載失敗的區間不記錄，下次呼叫會再補；yf.download 在網路錯誤時回傳空表而非拋出例外，
+    無法與「區間內真的沒有交易」區分，因此只有拿到資料的區間才記錄為已同步
+    （上市前等確實無資料的區間每次都會再查詢一次）。
+    """
+    gaps = find_missing_ranges(stock_code, start_date, end_date)
+    if not gaps:
+        return 0
+
+    coverage  = _current_coverage(stock_code)
+    live_from = pd.Timestamp.today().normalize() - pd.Timedelta(days=LIVE_TAIL_DAYS)
+    written   = 0
+
+    for gap_start, gap_end in gaps:
+        try:
+            df = fetcher(stock_code, gap_start.date(), (gap_end + _ONE_DAY).date())
+        except Exception:
+            continue
+
+        if df is None or df.empty:
+            continue
+        save_stock_prices(df, stock_code)
+        written += len(df)
+
+        if gap_end < live_from:
+            # 歷史區間：已拿到資料，區間內之後不會再變動
+            coverage.append((gap_start, gap_end))
+        else:
+            # 尾端：今日可能尚未收盤，只記錄到實際拿到的最後一天
+            last = pd.Timestamp(pd.to_datetime(df.index).max()).normalize()
+            coverage.append((gap_start, min(last, gap_end)))
+
+    save_price_coverage(stock_code, _merge_intervals(coverage))
+    return written
+
+
+def load_synced_prices(stock_code: str, start_date, end_date,
+                       fetcher=fetch_stock_data_from_web) -> pd.DataFrame:
+    """先補齊缺少的區間，再從資料庫讀出完整的 [start_date, end_date] 股價"""
+    sync_stock_prices(stock_code, start_date, end_date, fetcher=fetcher)
+    df = load_stock_prices(stock_code, start_date, end_date)
+    if not df.empty:
+        df.index = pd.to_datetime(df.index)
+    return df
+
+
+def load_synced_prices_many(stock_codes, start_date, end_date,
+                            fetcher=fetch_stock_data_from_web) -> dict:
+    """
+    多支股票版：逐一補齊缺口後，以單一 IN 查詢讀出全部股價。
+    回傳 {stock_code: DataFrame}，取不到資料的股票為空 DataFrame。
+    """
+    for code in dict.fromkeys(stock_codes):
+        try:
+            sync_stock_prices(code, start_date, end_date, fetcher=fetcher)
+        except Exception:
+            continue
+    return load_stock_prices_many(stock_codes, start_date, end_date)
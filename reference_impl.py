@@ -0,0 +1,47 @@
+# reference_impl.py
+# 被向量化版本取代前的原始實作，只供測試（test_crypto_strategy.py）與 benchmark
+# （bench_crypto_strategy.py）比對結果與耗時，應用程式不使用
+
+import pandas as pd
+
+
+def lambda_wma(series, n):
+    """原本 SMA/Hull 趨勢策略的 rolling.apply 加權移動平均"""
+    weights = pd.Series(range(1, n + 1))
+    return series.rolling(n).apply(lambda x: (x * weights).sum() / weights.sum(), raw=True)
+
+
+def lambda_hull(series, n):
+    return lambda_wma(2 * lambda_wma(series, int(n / 2)) - lambda_wma(series, n), int(n ** 0.5))
+
+
+def supertrend_basic_bands(df, period, mult):
+    """Supertrend 基礎上下軌：hl2 ± mult × ATR（真實波幅的 period 根簡單平均）"""
+    tr  = pd.concat([df["High"] - df["Low"], (df["High"] - df["Close"].shift(1)).abs(),
+                     (df["Low"] - df["Close"].shift(1)).abs()], axis=1).max(axis=1)
+    atr = tr.rolling(period).mean()
+    hl2 = (df["High"] + df["Low"]) / 2
+    return hl2 + mult * atr, hl2 - mult * atr
+
+
+def supertrend_loop(close, upper_band, lower_band):
+    """原本 supertrend_signals 的 .iloc 迴圈：調整軌道、決定方向 → (upper, lower, direction)"""
+    upper_band, lower_band = upper_band.copy(), lower_band.copy()
+    for i in range(1, len(close)):
+        if upper_band.iloc[i] < upper_band.iloc[i-1] or close.iloc[i-1] > upper_band.iloc[i-1]:
+            upper_band.iloc[i] = upper_band.iloc[i]
+        else:
+            upper_band.iloc[i] = upper_band.iloc[i-1]
+        if lower_band.iloc[i] > lower_band.iloc[i-1] or close.iloc[i-1] < lower_band.iloc[i-1]:
+            lower_band.iloc[i] = lower_band.iloc[i]
+        else:
+            lower_band.iloc[i] = lower_band.iloc[i-1]
+    dir_arr = pd.Series(1, index=close.index)
+    for i in range(1, len(close)):
+        if close.iloc[i] > upper_band.iloc[i]:
+            dir_arr.iloc[i] = 1
+        elif close.iloc[i] < lower_band.iloc[i]:
+            dir_arr.iloc[i] = -1
+        else:
+            dir_arr.iloc[i] = dir_arr.iloc[i-1]
+    return upper_band, lower_band, dir_arr
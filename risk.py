@@ -5,6 +5,14 @@
 import pandas as pd
 import numpy as np
 
+from positions import build_position_array
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 # =====================
 # 預設手續費設定
 # =====================
@@ -20,31 +28,312 @@ def apply_friction_and_risk(
     sell_tax: float  = DEFAULT_TAX_STOCK,
     stop_loss: float = 0.0,      # 停損比例，0 = 不啟用（例如 0.05 = -5%）
     take_profit: float = 0.0,    # 停利比例，0 = 不啟用（例如 0.10 = +10%）
+    trailing_stop: float = 0.0,  # 移動停損：自持倉期間最高收盤回落此比例出場，0 = 不啟用
+    atr_stop: float = 0.0,       # ATR 停損：跌破 進場價 - 倍數 × 進場時 ATR 出場，0 = 不啟用
+    atr_period: int = 14,        # ATR 停損使用的 ATR 週期
+    max_hold_bars: int = 0,      # 時間停損：持有滿此根數出場，0 = 不啟用
+    fast: bool = True,
 ) -> pd.DataFrame:
     """
     在已有 Position 欄位的 df 上，套用摩擦成本與停損停利，
     回傳加上 Strategy（實際策略日報酬）欄位的 df。
 
     參數說明：
-      buy_fee    : 買入手續費（單邊），例如 0.001425
-      sell_fee   : 賣出手續費（單邊），例如 0.001425
-      sell_tax   : 賣出交易稅，台股 0.003，虛擬幣 0
-      stop_loss  : 持倉中跌幅達此比例強制出場（0 = 不啟用）
-      take_profit: 持倉中漲幅達此比例強制出場（0 = 不啟用）
+      buy_fee      : 買入手續費（單邊），例如 0.001425
+      sell_fee     : 賣出手續費（單邊），例如 0.001425
+      sell_tax     : 賣出交易稅，台股 0.003，虛擬幣 0
+      stop_loss    : 持倉中跌幅達此比例強制出場（0 = 不啟用）
+      take_profit  : 持倉中漲幅達此比例強制出場（0 = 不啟用）
+      trailing_stop: 自進場後最高收盤回落達此比例強制出場（0 = 不啟用）
+      atr_stop     : 收盤跌破 進場價 - atr_stop × 進場當根 ATR 強制出場（0 = 不啟用）；
+                     df 有 High / Low 時以真實波幅計算 ATR，否則以收盤價變動絕對值
+      atr_period   : ATR 週期
+      max_hold_bars: 進場後持有滿此根數強制出場（0 = 不啟用）
+      fast         : 持倉走陣列 kernel（無出場條件時整段向量化，有出場條件時見
+                     stop_positions），成本與報酬向量化計算，結果與逐根迴圈相同；
+                     False 使用原本的逐根迴圈（僅支援 stop_loss / take_profit），
+                     保留作為測試與 benchmark 對照
 
     回傳欄位：
       Position_adj  : 套用停損停利後調整的持倉（可能提前出場）
       Strategy      : 考慮手續費、交易稅後的實際日報酬
       TradeCost     : 當日產生的交易成本（進出場日才有值）
-      StopTriggered : 是否由停損停利觸發出場
+      StopTriggered : 是否由停損停利（含移動、ATR、時間停損）觸發出場
     """
     df = df.copy()
     df['Close'] = pd.to_numeric(df['Close'], errors='coerce')
     df = df[df['Close'].notna()].copy()
 
-    closes      = df['Close'].values
-    positions   = df['Position'].values.copy()
-    n           = len(df)
+    closes    = df['Close'].values.astype(float)
+    positions = df['Position'].values.copy()
+    extra_exits = trailing_stop > 0 or atr_stop > 0 or max_hold_bars > 0
+
+    if not fast:
+        if extra_exits:
+            raise ValueError("逐根迴圈僅支援 stop_loss / take_profit，其他出場條件請用 fast=True")
+        result = _friction_loop(closes, positions, buy_fee, sell_fee, sell_tax,
+                                stop_loss, take_profit)
+    else:
+        signal = signal_array(positions)
+        if stop_loss > 0 or take_profit > 0 or extra_exits:
+            atr = average_true_range(df, atr_period) if atr_stop > 0 else None
+            position_adj, stop_triggered = stop_positions(
+                closes, signal, stop_loss, take_profit,
+                trailing_stop=trailing_stop, atr=atr, atr_stop=atr_stop,
+                max_hold_bars=max_hold_bars,
+            )
+        else:
+            position_adj   = build_position_array(signal == 1, signal == 0)
+            stop_triggered = np.zeros(len(closes), dtype=bool)
+        result = apply_costs(closes, position_adj.astype(int), stop_triggered,
+                              buy_fee, sell_fee, sell_tax)
+    position_adj, daily_strategy, trade_cost, stop_triggered = result
+
+    df['Position_adj']   = position_adj
+    df['Strategy']       = daily_strategy
+    df['TradeCost']      = trade_cost
+    df['StopTriggered']  = stop_triggered
+
+    return df
+
+
+def signal_array(positions) -> np.ndarray:
+    """
+    原始 Position 轉成 stop_positions 使用的 int8 訊號：
+    1 = 買入訊號、0 = 出場訊號、-1 = 其他值（NaN 等，維持前一根）。
+    """
+    raw = np.asarray(positions, dtype=float)
+    return np.where(raw == 1, 1, np.where(raw == 0, 0, -1)).astype(np.int8)
+
+
+def apply_costs(closes, position_adj, stop_triggered, buy_fee, sell_fee, sell_tax):
+    """
+    實際持倉 → (position_adj, Strategy 日報酬, TradeCost, stop_triggered)，
+    即 apply_friction_and_risk 的四個輸出欄位（position_adj、stop_triggered 原樣傳回）。
+      closes       : float64 收盤價（不可含 NaN）
+      position_adj : int 實際持倉（0/1），例如 stop_positions 的結果
+    分段計算時（optimizer.pruned_grid_search）把前一段最後一根與本段一起傳入，
+    再捨棄第一根，結果與整段一次計算相同。
+    持倉確定後，成本與報酬只看相鄰兩根的持倉，可整段向量化：
+      出場日（昨 1 → 今 0）：扣賣出手續費 + 交易稅
+      進場日（昨 0 → 今 1，第 0 根除外）：扣買入手續費
+      前一日持倉為 1 才有部位報酬；前一日收盤 <= 0 時當日報酬記 0
+    """
+    n = len(closes)
+    prev_pos   = np.zeros(n, dtype=int)
+    prev_price = np.full(n, np.nan)
+    prev_pos[1:]   = position_adj[:-1]
+    prev_price[1:] = closes[:-1]
+
+    valid   = prev_price > 0
+    holding = valid & (prev_pos == 1)
+    exits   = holding & (position_adj == 0)
+    entries = (prev_pos == 0) & (position_adj == 1)
+    entries[:1] = False
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw_return = (closes - prev_price) / prev_price
+
+    exit_cost  = np.where(exits, sell_fee + sell_tax, 0.0)
+    trade_cost = exit_cost + np.where(entries, buy_fee, 0.0)
+    daily_strategy = np.where(holding, raw_return - exit_cost, 0.0) - np.where(entries, buy_fee, 0.0)
+    return position_adj, daily_strategy, trade_cost, stop_triggered
+
+
+def price_columns_for(df: pd.DataFrame, *risk_cfgs) -> list:
+    """精簡回測要保留的價格欄位：有啟用 ATR 停損且 df 有 High / Low 時一併保留"""
+    needs_range = any(cfg and cfg.get("atr_stop", 0) > 0 for cfg in risk_cfgs)
+    if needs_range and 'High' in df.columns and 'Low' in df.columns:
+        return ['High', 'Low', 'Close']
+    return ['Close']
+
+
+def average_true_range(df: pd.DataFrame, period: int = 14) -> np.ndarray:
+    """ATR（真實波幅簡單平均）；df 沒有 High / Low 時以收盤價變動絕對值代替真實波幅"""
+    close      = df['Close'].astype(float)
+    prev_close = close.shift(1)
+    if 'High' in df.columns and 'Low' in df.columns:
+        high = pd.to_numeric(df['High'], errors='coerce')
+        low  = pd.to_numeric(df['Low'],  errors='coerce')
+        tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()],
+                       axis=1).max(axis=1)
+    else:
+        tr = (close - prev_close).abs()
+    return tr.rolling(int(period)).mean().to_numpy(dtype=np.float64)
+
+
+# =====================
+# 出場 kernel（依進場價 / 持倉期間最高價逐根判斷，只處理 float64 / int8 陣列）
+# =====================
+def _stop_kernel(closes, atr, signal, stop_loss, take_profit, trailing_stop, atr_stop,
+                 max_hold_bars, position, stopped):
+    """
+    逐根狀態機，與 _friction_loop 的持倉判斷相同：
+    持倉中先檢查各出場條件（觸發當根不會再進場），再依訊號進出場。
+    價格類條件（停損停利、移動停損、ATR 停損）只在進場價 > 0 時檢查。
+    安裝 numba 時以 njit 編譯；未安裝時保留作為純 Python 對照版本。
+    """
+    current_pos = 0
+    entry_price = 0.0
+    entry_bar   = 0
+    peak        = 0.0
+    atr_level   = -np.inf
+    for i in range(closes.shape[0]):
+        price    = closes[i]
+        prev_pos = current_pos
+        hit      = False
+        if current_pos == 1:
+            if entry_price > 0:
+                pnl_ratio = (price - entry_price) / entry_price
+                if stop_loss > 0 and pnl_ratio <= -stop_loss:
+                    hit = True
+                if take_profit > 0 and pnl_ratio >= take_profit:
+                    hit = True
+                if price > peak:
+                    peak = price
+                if trailing_stop > 0 and (price - peak) / peak <= -trailing_stop:
+                    hit = True
+                if price <= atr_level:
+                    hit = True
+            if max_hold_bars > 0 and i - entry_bar >= max_hold_bars:
+                hit = True
+        if hit:
+            current_pos = 0
+            stopped[i]  = True
+        elif signal[i] == 1 and prev_pos == 0:
+            current_pos = 1
+            entry_price = price
+            entry_bar   = i
+            peak        = price
+            atr_level   = -np.inf
+            if atr_stop > 0 and atr[i] > 0:
+                atr_level = price - atr_stop * atr[i]
+        elif signal[i] == 0 and prev_pos == 1:
+            current_pos = 0
+        position[i] = current_pos
+
+
+if NUMBA_AVAILABLE:
+    _stop_kernel_jit = numba.njit(cache=True, nogil=True)(_stop_kernel)
+
+
+def _first_stop(closes, start, stop, entry_price, atr_level, stop_loss, take_profit, trailing_stop):
+    """closes[start:stop] 中第一根觸發價格類出場條件的位置；視窗逐次加倍，長部位不必一次算完"""
+    size = 64
+    peak = entry_price
+    while start < stop:
+        end = min(stop, start + size)
+        seg = closes[start:end]
+        hit = seg <= atr_level
+        if stop_loss > 0 or take_profit > 0:
+            pnl = (seg - entry_price) / entry_price
+            if stop_loss > 0:
+                hit |= pnl <= -stop_loss
+            if take_profit > 0:
+                hit |= pnl >= take_profit
+        if trailing_stop > 0:
+            peaks = np.maximum(np.maximum.accumulate(seg), peak)
+            hit  |= (seg - peaks) / peaks <= -trailing_stop
+            peak  = peaks[-1]
+        first = int(hit.argmax())
+        if hit[first]:
+            return start + first
+        start = end
+        size *= 2
+    return -1
+
+
+def _next_index(mask) -> list:
+    """next[i] = i 之後（含 i）第一個 mask 為 True 的位置，沒有則為 len(mask)"""
+    n   = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1].tolist() + [n]
+
+
+def _stop_positions_numpy(closes, atr, signal, stop_loss, take_profit, trailing_stop, atr_stop,
+                          max_hold_bars, position, stopped):
+    """
+    純 NumPy 版：以「筆」為單位跳躍，每筆交易只做一次向量化掃描。
+    進場 = 空手後第一根買入訊號；出場 = 出場條件先觸發（該根 StopTriggered），
+    否則為下一根出場訊號。觸發出場後從下一根開始找新的買入訊號。
+    時間停損的出場根是確定的，直接當作掃描終點。
+    """
+    n           = closes.shape[0]
+    next_buy    = _next_index(signal == 1)
+    next_sell   = _next_index(signal == 0)
+    price_stops = stop_loss > 0 or take_profit > 0 or trailing_stop > 0 or atr_stop > 0
+    i = 0
+    while i < n:
+        entry = next_buy[i]
+        if entry == n:
+            break
+        exit_    = next_sell[entry + 1]
+        scan_end = min(exit_ + 1, n)
+        hit      = -1
+        time_hit = -1
+        if max_hold_bars > 0 and entry + max_hold_bars < scan_end:
+            scan_end = time_hit = entry + max_hold_bars
+        entry_price = closes[entry]
+        if price_stops and entry_price > 0:
+            atr_level = -np.inf
+            if atr_stop > 0 and atr[entry] > 0:
+                atr_level = entry_price - atr_stop * atr[entry]
+            hit = _first_stop(closes, entry + 1, scan_end, entry_price, atr_level,
+                              stop_loss, take_profit, trailing_stop)
+        if hit < 0:
+            hit = time_hit
+        if hit >= 0:
+            position[entry:hit] = 1
+            stopped[hit] = True
+            i = hit + 1
+        else:
+            position[entry:exit_] = 1
+            i = exit_ + 1
+
+
+STOP_KERNELS = ("numba", "numpy", "python")
+DEFAULT_STOP_KERNEL = "numba" if NUMBA_AVAILABLE else "numpy"
+
+
+def stop_positions(closes, signal, stop_loss: float = 0.0, take_profit: float = 0.0,
+                   trailing_stop: float = 0.0, atr=None, atr_stop: float = 0.0,
+                   max_hold_bars: int = 0, kernel: str = None):
+    """
+    依訊號與出場條件計算實際持倉，回傳 (position int8, stopped bool)。
+      closes : float64 收盤價（不可含 NaN）
+      signal : int8 訊號（1 買入、0 出場、-1 維持），見 signal_array
+      atr    : float64 ATR（與 closes 等長），atr_stop > 0 時必須提供
+      kernel : "numba"（需安裝 numba）/ "numpy"（逐筆跳躍）/ "python"（逐根，對照用），
+               預設有 numba 用 numba，否則用 numpy
+    其餘參數意義同 apply_friction_and_risk。
+    """
+    kernel = kernel or DEFAULT_STOP_KERNEL
+    if kernel not in STOP_KERNELS:
+        raise ValueError(f"未知的停損 kernel：{kernel}")
+    if kernel == "numba" and not NUMBA_AVAILABLE:
+        raise ValueError("未安裝 numba，無法使用 numba kernel")
+    if atr_stop > 0 and atr is None:
+        raise ValueError("atr_stop 需要提供 atr 陣列")
+
+    closes   = np.ascontiguousarray(closes, dtype=np.float64)
+    signal   = np.ascontiguousarray(signal, dtype=np.int8)
+    atr      = np.empty(0) if atr is None else np.ascontiguousarray(atr, dtype=np.float64)
+    position = np.zeros(closes.shape[0], dtype=np.int8)
+    stopped  = np.zeros(closes.shape[0], dtype=bool)
+    args = (closes, atr, signal, float(stop_loss), float(take_profit), float(trailing_stop),
+            float(atr_stop), int(max_hold_bars), position, stopped)
+    if kernel == "numba":
+        _stop_kernel_jit(*args)
+    elif kernel == "numpy":
+        _stop_positions_numpy(*args)
+    else:
+        _stop_kernel(*args)
+    return position, stopped
+
+
+def _friction_loop(closes, positions, buy_fee, sell_fee, sell_tax, stop_loss, take_profit):
+    """逐根 K 棒的原始實作：停損停利依進場價而定，必須依序計算"""
+    n = len(closes)
 
     # 輸出欄位
     position_adj   = np.zeros(n, dtype=int)
@@ -120,50 +409,108 @@ def apply_friction_and_risk(
             trade_cost[i]     += buy_fee
             daily_strategy[i] -= buy_fee
 
-    df['Position_adj']   = position_adj
-    df['Strategy']       = daily_strategy
-    df['TradeCost']      = trade_cost
-    df['StopTriggered']  = stop_triggered
-
-    return df
+    return position_adj, daily_strategy, trade_cost, stop_triggered
 
 
-def calc_performance(df: pd.DataFrame, trading_days: int = 240) -> dict:
+# =====================
+# 績效指標 kernel（float64 陣列，單欄或 bars × 組合矩陣）
+# =====================
+def batch_performance(returns, positions=None, trade_costs=None, trading_days: int = 240) -> dict:
     """
-    計算績效指標，輸入 df 需含 Strategy、DailyReturn 欄位。
-    回傳 dict：累積報酬率、夏普比率、最大回撤、年化波動、交易次數、總手續費成本
+    一次算出所有績效指標，returns 為每根策略報酬（不可含 NaN），
+    1 維視為單一組合，2 維為 bars × 組合（每欄一組參數），所有指標沿 axis 0 計算。
+    positions / trade_costs 與 returns 同形狀（可省略），用來計算交易次數與總成本。
+
+    回傳 dict（值為 float，或每組合一個值的 ndarray）：
+      cum_return : 累積報酬率
+      sharpe     : 年化夏普比率（標準差為 0 時記 0）
+      sortino    : 年化索提諾比率（下檔標準差以 0 為門檻，為 0 時記 0）
+      mdd        : 最大回撤（負值）
+      calmar     : 年化報酬率 / |最大回撤|（無回撤時記 0）
+      volatility : 年化波動
+      trades     : 持倉變化次數
+      cost       : 總交易成本
     """
-    s = df['Strategy'].dropna()
-    r = df['DailyReturn'].dropna() if 'DailyReturn' in df.columns else s
-
-    cum_s    = (1 + s).cumprod()
-    cum_r    = cum_s.iloc[-1] - 1
-    mdd      = ((cum_s - cum_s.cummax()) / cum_s.cummax()).min()
-    vol      = s.std() * (trading_days ** 0.5)
-    sharpe   = (s.mean() / s.std() * trading_days ** 0.5) if s.std() != 0 else 0
+    # 矩陣轉成欄優先排列：沿 axis 0 的加總與單欄版本走相同的 pairwise 累加，結果逐位元相同
+    r = np.asfortranarray(returns, dtype=np.float64)
+    n = r.shape[0]
+    scale = trading_days ** 0.5
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        equity = np.cumprod(1 + r, axis=0)
+        peak   = np.maximum.accumulate(equity, axis=0)
+        cum_return = equity[-1] - 1 if n else np.zeros(r.shape[1:])
+        mdd    = ((equity - peak) / peak).min(axis=0) if n else np.zeros(r.shape[1:])
+        mean   = r.mean(axis=0)
+        std    = r.std(axis=0, ddof=1)
+        down   = np.sqrt((np.minimum(r, 0.0) ** 2).mean(axis=0))
+        sharpe  = np.where(std != 0, mean / std * scale, 0.0)
+        sortino = np.where(down != 0, mean / down * scale, 0.0)
+        annual  = np.where(cum_return > -1,
+                           np.abs(1 + cum_return) ** (trading_days / max(n, 1)) - 1, -1.0)
+        calmar  = np.where(mdd < 0, annual / np.abs(mdd), 0.0)
+
+    if positions is not None and n > 1:
+        trades = (np.abs(np.diff(np.asarray(positions, dtype=np.float64), axis=0)) > 0).sum(axis=0)
+    else:
+        trades = np.zeros(r.shape[1:], dtype=np.int64)
+    cost = (np.nansum(np.asfortranarray(trade_costs, dtype=np.float64), axis=0)
+            if trade_costs is not None else np.zeros(r.shape[1:]))
+
+    stats = {
+        "cum_return": cum_return, "sharpe": sharpe, "sortino": sortino, "mdd": mdd,
+        "calmar": calmar, "volatility": std * scale, "trades": trades, "cost": cost,
+    }
+    if r.ndim == 1:
+        stats = {k: (int(v) if k == "trades" else float(v)) for k, v in stats.items()}
+    return stats
 
-    pos_col  = 'Position_adj' if 'Position_adj' in df.columns else 'Position'
-    trades   = int((df[pos_col].diff().abs() > 0).sum()) if pos_col in df.columns else 0
-    total_cost = df['TradeCost'].sum() if 'TradeCost' in df.columns else 0.0
 
+def format_performance(stats: dict, j: int = None) -> dict:
+    """batch_performance 的結果 → 頁面使用的中文績效 dict（j 為矩陣版的組合欄位），數值一律為 Python float"""
+    pick = (lambda v: float(v)) if j is None else (lambda v: float(v[j]))
     return {
-        "累積報酬率(%)":    round(cum_r * 100, 2),
-        "夏普比率":          round(sharpe, 2),
-        "最大回撤(%)":      round(mdd * 100, 2),
-        "年化波動(%)":      round(vol * 100, 2),
-        "交易次數":          trades,
-        "總手續費成本(%)":  round(total_cost * 100, 4),
+        "累積報酬率(%)":    round(pick(stats["cum_return"]) * 100, 2),
+        "夏普比率":          round(pick(stats["sharpe"]), 2),
+        "索提諾比率":        round(pick(stats["sortino"]), 2),
+        "最大回撤(%)":      round(pick(stats["mdd"]) * 100, 2),
+        "卡瑪比率":          round(pick(stats["calmar"]), 2),
+        "年化波動(%)":      round(pick(stats["volatility"]) * 100, 2),
+        "交易次數":          int(pick(stats["trades"])),
+        "總手續費成本(%)":  round(pick(stats["cost"]) * 100, 4),
     }
 
 
+def performance_stats(df: pd.DataFrame, trading_days: int = 240) -> dict:
+    """df（含 Strategy，可選 Position_adj / Position、TradeCost）→ batch_performance 單欄結果"""
+    s        = df['Strategy'].dropna().to_numpy(dtype=np.float64)
+    pos_col  = 'Position_adj' if 'Position_adj' in df.columns else 'Position'
+    position = df[pos_col].to_numpy(dtype=np.float64) if pos_col in df.columns else None
+    cost     = df['TradeCost'].to_numpy(dtype=np.float64) if 'TradeCost' in df.columns else None
+    stats    = batch_performance(s, trade_costs=cost, trading_days=trading_days)
+    if position is not None and len(position) > 1:
+        stats["trades"] = int((np.abs(np.diff(position)) > 0).sum())
+    return stats
+
+
+def calc_performance(df: pd.DataFrame, trading_days: int = 240) -> dict:
+    """
+    計算績效指標，輸入 df 需含 Strategy 欄位。
+    回傳 dict：累積報酬率、夏普比率、索提諾比率、最大回撤、卡瑪比率、年化波動、
+    交易次數、總手續費成本
+    """
+    return format_performance(performance_stats(df, trading_days))
+
+
 def build_risk_ui(prefix: str = "", market: str = "stock") -> dict:
     """
     在 Streamlit 頁面上渲染摩擦成本與停損停利的設定 UI。
     prefix : 避免多個頁面 widget key 衝突（例如 "bt_"、"cmp_"）
     market : "stock"（台股）或 "crypto"（虛擬幣）
 
-    回傳 dict：
-      buy_fee, sell_fee, sell_tax, stop_loss, take_profit
+    回傳 dict（可直接 ** 傳給 apply_friction_and_risk）：
+      buy_fee, sell_fee, sell_tax, stop_loss, take_profit,
+      trailing_stop, atr_stop, atr_period, max_hold_bars
     """
     import streamlit as st
 
@@ -221,12 +568,53 @@ def build_risk_ui(prefix: str = "", market: str = "stock") -> dict:
                 help="持倉獲利達此比例時強制出場，例如 10 = 漲 10% 出場"
             )
 
+        col6, col7, col8 = st.columns(3)
+        use_trail = col6.checkbox("啟用移動停損", value=False, key=f"{prefix}use_trail")
+        use_atr   = col7.checkbox("啟用 ATR 停損", value=False, key=f"{prefix}use_atr")
+        use_time  = col8.checkbox("啟用時間停損", value=False, key=f"{prefix}use_time")
+
+        trailing_pct  = 0.0
+        atr_mult      = 0.0
+        atr_period    = 14
+        max_hold_bars = 0
+
+        if use_trail:
+            trailing_pct = col6.number_input(
+                "回落比例（%）", min_value=0.1, max_value=50.0,
+                value=8.0, step=0.5, format="%.1f",
+                key=f"{prefix}trail_pct",
+                help="自進場後最高收盤價回落達此比例時出場，例如 8 = 從高點跌 8% 出場"
+            )
+        if use_atr:
+            atr_mult = col7.number_input(
+                "ATR 倍數", min_value=0.1, max_value=20.0,
+                value=2.0, step=0.5, format="%.1f",
+                key=f"{prefix}atr_mult",
+                help="收盤跌破「進場價 - 倍數 × 進場時 ATR」時出場"
+            )
+            atr_period = col7.number_input(
+                "ATR 週期", min_value=2, max_value=200,
+                value=14, step=1, key=f"{prefix}atr_period"
+            )
+        if use_time:
+            max_hold_bars = col8.number_input(
+                "最多持有 K 棒數", min_value=1, max_value=5000,
+                value=20, step=1, key=f"{prefix}max_hold",
+                help="進場後持有滿此根數即出場（日線 = 交易日數，小時線 = 小時數）"
+            )
+
         # 顯示目前設定摘要
         summary = f"手續費：買 {buy_fee_pct:.4f}% / 賣 {sell_fee_pct:.4f}% + 稅 {sell_tax_pct:.2f}%"
         if use_sl:
             summary += f"　｜　停損：-{stop_loss_pct:.1f}%"
         if use_tp:
             summary += f"　｜　停利：+{take_profit_pct:.1f}%"
+        if use_trail:
+            summary += f"　｜　移動停損：-{trailing_pct:.1f}%"
+        if use_atr:
+            summary += f"　｜　ATR 停損：{atr_mult:.1f} × ATR{int(atr_period)}"
+        if use_time:
+            summary += f"　｜　最多持有 {int(max_hold_bars)} 根"
         st.caption(f"📌 目前設定：{summary}")
 
     return {
@@ -235,4 +623,8 @@ def build_risk_ui(prefix: str = "", market: str = "stock") -> dict:
         "sell_tax":   sell_tax_pct  / 100,
         "stop_loss":  stop_loss_pct  / 100,
         "take_profit": take_profit_pct / 100,
+        "trailing_stop": trailing_pct / 100,
+        "atr_stop":      float(atr_mult),
+        "atr_period":    int(atr_period),
+        "max_hold_bars": int(max_hold_bars),
     }
@@ -1,7 +1,11 @@
 import os
+import numpy as np
 import pandas as pd
 import sqlite3
 
+import indicators
+from positions import build_position_array
+
 # Streamlit Cloud 唯讀目錄，資料庫改存 /tmp/
 _IS_CLOUD = os.path.exists("/mount/src")
 _DB_DIR   = "/tmp" if _IS_CLOUD else "."
@@ -130,7 +134,14 @@ def _build_position(buy: pd.Series, sell: pd.Series) -> pd.Series:
 
     這樣可以避免 ffill 把「無訊號日」誤填成持倉，
     造成策略累積報酬在末端暴衝或暴跌的問題。
+    以 build_position_array 向量化計算，與 _build_position_loop 結果相同。
     """
+    return pd.Series(build_position_array(buy.to_numpy(), sell.to_numpy()),
+                     index=buy.index, dtype=int)
+
+
+def _build_position_loop(buy: pd.Series, sell: pd.Series) -> pd.Series:
+    """逐根 K 棒的原始實作，保留作為測試與 benchmark 對照"""
     position = pd.Series(0, index=buy.index, dtype=int)
     current = 0
     for i in range(len(buy)):
@@ -142,86 +153,195 @@ def _build_position(buy: pd.Series, sell: pd.Series) -> pd.Series:
     return position
 
 
+# =====================
+# 策略註冊表：strategies[name] 除了 UI 用的 description / parameters，
+# 由 register_strategy 補上計算用的欄位（dict 查詢 O(1)，註冊時不做任何計算）：
+#   signals  : fn(data, params) -> (buy, sell, columns)
+#              data 為 DataFrame（或欄名 -> Series 的 dict），columns 為要寫回 df 的指標欄位
+#   inputs   : 需要的價量欄位，引擎可只取這些欄位
+#   warmup   : fn(params) -> 訊號開始有效前需要的 K 棒數
+#   min_bars : fn(params) -> 最少資料筆數（不足時 signals 會拋出 ValueError），可為 None
+#   batch    : fn(data, combos, close, close_key) -> (buy, sell) 矩陣的批次版本，可為 None
+# =====================
+def register_strategy(name, signals, inputs=("Close",), warmup=None, batch=None,
+                      min_bars=None, description=None, parameters=None):
+    entry = strategies.setdefault(name, {})
+    if description is not None:
+        entry["description"] = description
+    if parameters is not None:
+        entry["parameters"] = parameters
+    entry.update({
+        "signals":  signals,
+        "inputs":   tuple(inputs),
+        "warmup":   warmup or (lambda params: 0),
+        "batch":    batch,
+        "min_bars": min_bars,
+    })
+    return entry
+
+
+def get_strategy(strategy_name) -> dict:
+    try:
+        spec = strategies[strategy_name]
+    except KeyError:
+        raise ValueError(f"未知的策略：{strategy_name}") from None
+    if "signals" not in spec:
+        raise ValueError(f"策略「{strategy_name}」尚未註冊計算函式")
+    return spec
+
+
+def strategy_warmup(strategy_name, params) -> int:
+    return int(get_strategy(strategy_name)["warmup"](params))
+
+
+def strategy_inputs(strategy_name) -> tuple:
+    return get_strategy(strategy_name)["inputs"]
+
+
+# =====================
+# 內建策略的訊號函式
+# 指標由 indicators 依 Close 內容指紋快取，網格搜尋時相同視窗只計算一次
+# =====================
+def _sma_cross_signals(data, params):
+    close = data['Close']
+    short = int(params["短期均線"])
+    long = int(params["長期均線"])
+    key = indicators.fingerprint(close)
+    sma_short = indicators.sma(close, short, key)
+    sma_long = indicators.sma(close, long, key)
+    buy = (sma_short > sma_long) & (sma_short.shift(1) <= sma_long.shift(1))
+    sell = (sma_short < sma_long) & (sma_short.shift(1) >= sma_long.shift(1))
+    return buy, sell, {'SMA_short': sma_short, 'SMA_long': sma_long}
+
+
+def _reversal_signals(data, params):
+    days = int(params["觀察天數"])
+    threshold = float(params["跌幅閾值（％）"]) / 100
+    ret = indicators.pct_change(data['Close'], days)
+    buy = (ret <= -threshold).fillna(False)
+    # 反轉策略：跌幅不足時視為出場
+    sell = (ret > -threshold).fillna(False)
+    return buy, sell, {'Return': ret}
+
+
+def _breakout_min_bars(params):
+    return int(params["突破天數"]) + 5
+
+
+def _breakout_signals(data, params):
+    close = data['Close']
+    period = int(params["突破天數"])
+    if len(close) < _breakout_min_bars(params):
+        raise ValueError(f"📉 資料天數過短（目前 {len(close)} 天），「突破策略」至少需要 {period + 5} 天。")
+    key = indicators.fingerprint(close)
+    high_n = indicators.rolling_max(close, period, key)
+    low_n = indicators.rolling_min(close, period, key)
+    buy = (close > high_n.shift(1)).fillna(False)
+    sell = (close < low_n.shift(1)).fillna(False)
+    return buy, sell, {'High_N': high_n, 'Low_N': low_n}
+
+
+def _rsi_signals(data, params):
+    rsi_period = int(params["RSI 期間"])
+    buy_level = float(params["買入閾值"])
+    sell_level = float(params["賣出閾值"])
+    rsi = indicators.rsi(data['Close'], rsi_period)
+    # RSI 從超賣區回升（穿越買入閾值）才買，避免一直持倉
+    buy = ((rsi > buy_level) & (rsi.shift(1) <= buy_level)).fillna(False)
+    sell = ((rsi > sell_level)).fillna(False)
+    return buy, sell, {'RSI': rsi}
+
+
+def _macd_signals(data, params):
+    close = data['Close']
+    short_ema = int(params["短期 EMA"])
+    long_ema = int(params["長期 EMA"])
+    signal_period = int(params["訊號線"])
+    key = indicators.fingerprint(close)
+    ema_short = indicators.ema(close, short_ema, key)
+    ema_long = indicators.ema(close, long_ema, key)
+    macd = ema_short - ema_long
+    signal = indicators.ema(macd, signal_period)
+    buy = ((macd > signal) & (macd.shift(1) <= signal.shift(1))).fillna(False)
+    sell = ((macd < signal) & (macd.shift(1) >= signal.shift(1))).fillna(False)
+    return buy, sell, {'EMA_short': ema_short, 'EMA_long': ema_long, 'MACD': macd, 'Signal': signal}
+
+
+def _bollinger_signals(data, params):
+    close = data['Close']
+    period = int(params["期間"])
+    std_mult = float(params["標準差倍數"])
+    key = indicators.fingerprint(close)
+    ma = indicators.sma(close, period, key)
+    std = indicators.rolling_std(close, period, key)
+    upper = ma + std_mult * std
+    lower = ma - std_mult * std
+    buy = (close < lower).fillna(False)
+    sell = (close > upper).fillna(False)
+    return buy, sell, {'MA': ma, 'STD': std, 'Upper': upper, 'Lower': lower}
+
+
+def _ema_cross_signals(data, params):
+    close = data['Close']
+    short = int(params["短期 EMA"])
+    long = int(params["長期 EMA"])
+    key = indicators.fingerprint(close)
+    ema_short = indicators.ema(close, short, key)
+    ema_long = indicators.ema(close, long, key)
+    buy = (ema_short > ema_long) & (ema_short.shift(1) <= ema_long.shift(1))
+    sell = (ema_short < ema_long) & (ema_short.shift(1) >= ema_long.shift(1))
+    return buy, sell, {'EMA_short': ema_short, 'EMA_long': ema_long}
+
+
+def _donchian_signals(data, params):
+    period = int(params["期間"])
+    donchian_high = indicators.rolling_max(data['High'], period)
+    donchian_low = indicators.rolling_min(data['Low'], period)
+    buy = (data['Close'] > donchian_high.shift(1)).fillna(False)
+    sell = (data['Close'] < donchian_low.shift(1)).fillna(False)
+    return buy, sell, {'Donchian_High': donchian_high, 'Donchian_Low': donchian_low}
+
+
+def _input_series(data, inputs):
+    """DataFrame 直接取欄（不複製）；NumPy 陣列包成共用 RangeIndex 的 Series（不複製）"""
+    if isinstance(data, pd.DataFrame):
+        return {col: data[col] for col in inputs}
+    index = None
+    series = {}
+    for col in inputs:
+        values = data[col]
+        if isinstance(values, pd.Series):
+            series[col] = values
+            continue
+        values = np.asarray(values, dtype=float)
+        if index is None:
+            index = pd.RangeIndex(len(values))
+        series[col] = pd.Series(values, index=index, copy=False)
+    return series
+
+
+def strategy_positions(data, strategy_name, params, with_indicators=False):
+    """
+    精簡模式：不複製 df、不把指標寫回欄位，只回傳持倉。
+    data：DataFrame，或欄名 -> NumPy 陣列 / Series 的 dict（只需策略的 inputs 欄位）
+    回傳 (positions, indicators)：
+      positions  : int64 陣列，與 apply_strategy(...)['Position'] 相同
+      indicators : with_indicators=True 時為 {欄名: NumPy 陣列}，否則 None
+    """
+    spec = get_strategy(strategy_name)
+    buy, sell, columns = spec["signals"](_input_series(data, spec["inputs"]), params)
+    positions = build_position_array(np.asarray(buy), np.asarray(sell))
+    if not with_indicators:
+        return positions, None
+    return positions, {col: np.asarray(values) for col, values in columns.items()}
+
+
 def apply_strategy(df, strategy_name, params):
+    spec = get_strategy(strategy_name)
     df = df.copy()
-    buy = pd.Series(False, index=df.index)
-    sell = pd.Series(False, index=df.index)
-
-    if strategy_name == "簡單均線交叉":
-        short = int(params["短期均線"])
-        long = int(params["長期均線"])
-        df['SMA_short'] = df['Close'].rolling(window=short).mean()
-        df['SMA_long'] = df['Close'].rolling(window=long).mean()
-        buy = (df['SMA_short'] > df['SMA_long']) & (df['SMA_short'].shift(1) <= df['SMA_long'].shift(1))
-        sell = (df['SMA_short'] < df['SMA_long']) & (df['SMA_short'].shift(1) >= df['SMA_long'].shift(1))
-
-    elif strategy_name == "反轉策略":
-        days = int(params["觀察天數"])
-        threshold = float(params["跌幅閾值（％）"]) / 100
-        df['Return'] = df['Close'].pct_change(periods=days)
-        buy = (df['Return'] <= -threshold).fillna(False)
-        # 反轉策略：跌幅不足時視為出場
-        sell = (df['Return'] > -threshold).fillna(False)
-
-    elif strategy_name == "突破策略":
-        period = int(params["突破天數"])
-        if len(df) < period + 5:
-            raise ValueError(f"📉 資料天數過短（目前 {len(df)} 天），「突破策略」至少需要 {period + 5} 天。")
-        df['High_N'] = df['Close'].rolling(window=period, min_periods=period).max()
-        df['Low_N'] = df['Close'].rolling(window=period, min_periods=period).min()
-        buy = (df['Close'] > df['High_N'].shift(1)).fillna(False)
-        sell = (df['Close'] < df['Low_N'].shift(1)).fillna(False)
-
-    elif strategy_name == "RSI 策略":
-        rsi_period = int(params["RSI 期間"])
-        buy_level = float(params["買入閾值"])
-        sell_level = float(params["賣出閾值"])
-        delta = df['Close'].diff()
-        gain = delta.clip(lower=0)
-        loss = -delta.clip(upper=0)
-        avg_gain = gain.rolling(rsi_period).mean()
-        avg_loss = loss.rolling(rsi_period).mean()
-        rs = avg_gain / avg_loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-        # RSI 從超賣區回升（穿越買入閾值）才買，避免一直持倉
-        buy = ((df['RSI'] > buy_level) & (df['RSI'].shift(1) <= buy_level)).fillna(False)
-        sell = ((df['RSI'] > sell_level)).fillna(False)
-
-    elif strategy_name == "MACD 策略":
-        short_ema = int(params["短期 EMA"])
-        long_ema = int(params["長期 EMA"])
-        signal_period = int(params["訊號線"])
-        df['EMA_short'] = df['Close'].ewm(span=short_ema, adjust=False).mean()
-        df['EMA_long'] = df['Close'].ewm(span=long_ema, adjust=False).mean()
-        df['MACD'] = df['EMA_short'] - df['EMA_long']
-        df['Signal'] = df['MACD'].ewm(span=signal_period, adjust=False).mean()
-        buy = ((df['MACD'] > df['Signal']) & (df['MACD'].shift(1) <= df['Signal'].shift(1))).fillna(False)
-        sell = ((df['MACD'] < df['Signal']) & (df['MACD'].shift(1) >= df['Signal'].shift(1))).fillna(False)
-
-    elif strategy_name == "布林通道策略":
-        period = int(params["期間"])
-        std_mult = float(params["標準差倍數"])
-        df['MA'] = df['Close'].rolling(window=period).mean()
-        df['STD'] = df['Close'].rolling(window=period).std()
-        df['Upper'] = df['MA'] + std_mult * df['STD']
-        df['Lower'] = df['MA'] - std_mult * df['STD']
-        buy = (df['Close'] < df['Lower']).fillna(False)
-        sell = (df['Close'] > df['Upper']).fillna(False)
-
-    elif strategy_name == "黃金交叉 EMA 策略":
-        short = int(params["短期 EMA"])
-        long = int(params["長期 EMA"])
-        df['EMA_short'] = df['Close'].ewm(span=short, adjust=False).mean()
-        df['EMA_long'] = df['Close'].ewm(span=long, adjust=False).mean()
-        buy = (df['EMA_short'] > df['EMA_long']) & (df['EMA_short'].shift(1) <= df['EMA_long'].shift(1))
-        sell = (df['EMA_short'] < df['EMA_long']) & (df['EMA_short'].shift(1) >= df['EMA_long'].shift(1))
-
-    elif strategy_name == "唐奇安通道策略":
-        period = int(params["期間"])
-        df['Donchian_High'] = df['High'].rolling(window=period).max()
-        df['Donchian_Low'] = df['Low'].rolling(window=period).min()
-        buy = (df['Close'] > df['Donchian_High'].shift(1)).fillna(False)
-        sell = (df['Close'] < df['Donchian_Low'].shift(1)).fillna(False)
+    buy, sell, columns = spec["signals"](df, params)
+    for col, values in columns.items():
+        df[col] = values
 
     # ✅ 修正：用狀態機邏輯建立持倉，買入後持有直到賣出訊號
     df['Position'] = _build_position(buy, sell)
@@ -229,6 +349,171 @@ def apply_strategy(df, strategy_name, params):
     return df
 
 
+# =====================
+# 批次多參數訊號：一次算出整個參數網格的持倉矩陣（bars × 組合）
+# 每個不同視窗的指標只算一次（經 indicators 快取），再以 NumPy 廣播
+# 對所有組合同時比較門檻 / 交叉，最後用 build_position_array 一次建立持倉。
+# 結果與逐組呼叫 apply_strategy 的 Position 完全相同。
+# =====================
+def _prev(a: np.ndarray) -> np.ndarray:
+    """等同 Series.shift(1)：整體下移一列，第一列補 NaN"""
+    out = np.empty_like(a, dtype=float)
+    if len(a):
+        out[0] = np.nan
+        out[1:] = a[:-1]
+    return out
+
+
+def _cross_signals(fast: np.ndarray, slow: np.ndarray):
+    fast_prev, slow_prev = _prev(fast), _prev(slow)
+    buy  = (fast > slow) & (fast_prev <= slow_prev)
+    sell = (fast < slow) & (fast_prev >= slow_prev)
+    return buy, sell
+
+
+def _indicator_matrix(func, series, windows, key=None):
+    """每個不同視窗算一次指標，回傳 (bars × 組合) 矩陣，欄順序同 windows"""
+    unique = sorted(set(windows))
+    cols   = {w: func(series, w, key).to_numpy(dtype=float) for w in unique}
+    return np.column_stack([cols[w] for w in windows]) if windows else \
+        np.empty((len(series), 0))
+
+
+def _column(combos, name, cast):
+    return [cast(p[name]) for p in combos]
+
+
+def _batch_sma_cross(df, combos, close, key):
+    short = _indicator_matrix(indicators.sma, close, _column(combos, "短期均線", int), key)
+    long  = _indicator_matrix(indicators.sma, close, _column(combos, "長期均線", int), key)
+    return _cross_signals(short, long)
+
+
+def _batch_reversal(df, combos, close, key):
+    ret       = _indicator_matrix(indicators.pct_change, close, _column(combos, "觀察天數", int), key)
+    threshold = np.array(_column(combos, "跌幅閾值（％）", float)) / 100
+    return ret <= -threshold, ret > -threshold
+
+
+def _batch_breakout(df, combos, close, key):
+    periods = _column(combos, "突破天數", int)
+    high_n  = _indicator_matrix(indicators.rolling_max, close, periods, key)
+    low_n   = _indicator_matrix(indicators.rolling_min, close, periods, key)
+    c = close.to_numpy(dtype=float)[:, None]
+    return c > _prev(high_n), c < _prev(low_n)
+
+
+def _batch_rsi(df, combos, close, key):
+    rsi        = _indicator_matrix(indicators.rsi, close, _column(combos, "RSI 期間", int), key)
+    buy_level  = np.array(_column(combos, "買入閾值", float))
+    sell_level = np.array(_column(combos, "賣出閾值", float))
+    buy  = (rsi > buy_level) & (_prev(rsi) <= buy_level)
+    sell = rsi > sell_level
+    return buy, sell
+
+
+def _batch_macd(df, combos, close, key):
+    short = _column(combos, "短期 EMA", int)
+    long  = _column(combos, "長期 EMA", int)
+    sig   = _column(combos, "訊號線", int)
+    macd_cols, signal_cols = {}, {}
+    for s_, l_, g_ in zip(short, long, sig):
+        if (s_, l_) not in macd_cols:
+            macd_cols[(s_, l_)] = indicators.ema(close, s_, key) - indicators.ema(close, l_, key)
+        if (s_, l_, g_) not in signal_cols:
+            signal_cols[(s_, l_, g_)] = indicators.ema(macd_cols[(s_, l_)], g_)
+    macd   = np.column_stack([macd_cols[(s_, l_)].to_numpy(dtype=float)
+                              for s_, l_ in zip(short, long)])
+    signal = np.column_stack([signal_cols[k].to_numpy(dtype=float)
+                              for k in zip(short, long, sig)])
+    return _cross_signals(macd, signal)
+
+
+def _batch_bollinger(df, combos, close, key):
+    periods  = _column(combos, "期間", int)
+    std_mult = np.array(_column(combos, "標準差倍數", float))
+    ma  = _indicator_matrix(indicators.sma, close, periods, key)
+    std = _indicator_matrix(indicators.rolling_std, close, periods, key)
+    c = close.to_numpy(dtype=float)[:, None]
+    return c < ma - std_mult * std, c > ma + std_mult * std
+
+
+def _batch_ema_cross(df, combos, close, key):
+    short = _indicator_matrix(indicators.ema, close, _column(combos, "短期 EMA", int), key)
+    long  = _indicator_matrix(indicators.ema, close, _column(combos, "長期 EMA", int), key)
+    return _cross_signals(short, long)
+
+
+def _batch_donchian(df, combos, close, key):
+    periods = _column(combos, "期間", int)
+    high_n  = _indicator_matrix(indicators.rolling_max, df['High'], periods)
+    low_n   = _indicator_matrix(indicators.rolling_min, df['Low'], periods)
+    c = close.to_numpy(dtype=float)[:, None]
+    return c > _prev(high_n), c < _prev(low_n)
+
+
+def supports_batch(strategy_name: str) -> bool:
+    """是否有向量化的批次版本（沒有的策略 batch_positions 仍可用，但逐組計算）"""
+    return strategies.get(strategy_name, {}).get("batch") is not None
+
+
+def batch_positions(df, strategy_name, combos):
+    """
+    combos：參數 dict 的 list（每個 dict 與 apply_strategy 的 params 相同）
+    回傳 (positions, valid)：
+      positions : int 陣列 (bars × len(combos))，第 j 欄 = apply_strategy(df, strategy_name, combos[j])['Position']
+      valid     : bool 陣列 (len(combos),)，apply_strategy 會拋出例外的組合為 False（持倉全 0）
+    有 batch 版本的策略以廣播一次算完；其餘策略逐組呼叫 signals，只取 inputs 欄位、不複製 df。
+    """
+    spec   = get_strategy(strategy_name)
+    combos = list(combos)
+    n, k   = len(df), len(combos)
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.int64), np.zeros(0, dtype=bool)
+
+    data = {col: df[col] for col in spec["inputs"]}
+    if spec["batch"] is None:
+        positions = np.zeros((n, k), dtype=np.int64)
+        valid     = np.zeros(k, dtype=bool)
+        for j, params in enumerate(combos):
+            try:
+                positions[:, j], _ = strategy_positions(data, strategy_name, params)
+            except Exception:
+                continue
+            valid[j] = True
+        return positions, valid
+
+    valid = np.ones(k, dtype=bool)
+    if spec["min_bars"] is not None:
+        valid = np.array([n >= spec["min_bars"](p) for p in combos])
+
+    close = data["Close"]
+    buy, sell = spec["batch"](data, combos, close, indicators.fingerprint(close))
+    positions = build_position_array(buy, sell)
+    positions[:, ~valid] = 0
+    return positions, valid
+
+
+# =====================
+# 註冊內建策略
+# =====================
+register_strategy("簡單均線交叉", _sma_cross_signals, batch=_batch_sma_cross,
+                  warmup=lambda p: max(int(p["短期均線"]), int(p["長期均線"])))
+register_strategy("反轉策略", _reversal_signals, batch=_batch_reversal,
+                  warmup=lambda p: int(p["觀察天數"]))
+register_strategy("突破策略", _breakout_signals, batch=_batch_breakout,
+                  warmup=lambda p: int(p["突破天數"]), min_bars=_breakout_min_bars)
+register_strategy("RSI 策略", _rsi_signals, batch=_batch_rsi,
+                  warmup=lambda p: int(p["RSI 期間"]) + 1)
+register_strategy("MACD 策略", _macd_signals, batch=_batch_macd,
+                  warmup=lambda p: max(int(p["短期 EMA"]), int(p["長期 EMA"])) + int(p["訊號線"]))
+register_strategy("布林通道策略", _bollinger_signals, batch=_batch_bollinger,
+                  warmup=lambda p: int(p["期間"]))
+register_strategy("黃金交叉 EMA 策略", _ema_cross_signals, batch=_batch_ema_cross,
+                  warmup=lambda p: max(int(p["短期 EMA"]), int(p["長期 EMA"])))
+register_strategy("唐奇安通道策略", _donchian_signals, inputs=("High", "Low", "Close"),
+                  batch=_batch_donchian, warmup=lambda p: int(p["期間"]))
+
 if __name__ == "__main__":
     # 範例測試搜尋功能
     print("=== 搜尋關鍵字 '台積' ===")
@@ -0,0 +1,109 @@
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import backtest_cache
+from risk import apply_friction_and_risk
+from strategy import apply_strategy
+
+RISK_CFG = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003,
+            "stop_loss": 0.05, "take_profit": 0.0}
+
+
+def test_cache_hit_matches_direct_run(prices, temp_engine):
+    df     = prices(300, vol=0.015)
+    params = {"短期均線": 5, "長期均線": 20}
+    backtest_cache.clear()
+    first  = backtest_cache.run_backtest_cached(df, "簡單均線交叉", params, RISK_CFG)
+    first["Strategy"] = 0.0                          # 呼叫端修改不影響快取
+    misses = backtest_cache.stats["misses"]
+    second = backtest_cache.run_backtest_cached(df, "簡單均線交叉", params, RISK_CFG)
+    backtest_cache.clear(disk=False)                 # 模擬重開 app：只剩 SQLite 那層
+    third  = backtest_cache.run_backtest_cached(df, "簡單均線交叉", params, RISK_CFG)
+    direct = apply_friction_and_risk(apply_strategy(df, "簡單均線交叉", params), **RISK_CFG)
+    assert backtest_cache.stats["misses"] == misses
+    assert direct["Position_adj"].sum() > 0
+    pd.testing.assert_frame_equal(second, direct)
+    pd.testing.assert_frame_equal(third, direct)
+    print("✅ 快取命中結果與直接回測一致")
+
+
+def test_cache_key_depends_on_prices_params_and_risk(prices):
+    df  = prices(300, vol=0.015)
+    key = backtest_cache.cache_key(df, "RSI 策略", {"RSI 期間": 14}, RISK_CFG)
+    df2 = df.copy()
+    df2.iloc[-1, df2.columns.get_loc("Close")] += 0.01
+    assert key == backtest_cache.cache_key(df.copy(), "RSI 策略", {"RSI 期間": 14}, dict(RISK_CFG))
+    assert key != backtest_cache.cache_key(df2, "RSI 策略", {"RSI 期間": 14}, RISK_CFG)
+    assert key != backtest_cache.cache_key(df, "RSI 策略", {"RSI 期間": 10}, RISK_CFG)
+    assert key != backtest_cache.cache_key(df, "RSI 策略", {"RSI 期間": 14},
+                                           {**RISK_CFG, "stop_loss": 0.1})
+    print("✅ 快取 key 隨股價內容、參數、成本設定改變")
+
+
+def test_lru_eviction_and_disk_size_cap(prices, temp_engine):
+    df = prices(300, vol=0.015)
+    old_entries, old_disk = backtest_cache.MAX_MEMORY_ENTRIES, backtest_cache.MAX_DISK_BYTES
+    backtest_cache.clear()
+    backtest_cache.MAX_MEMORY_ENTRIES = 2
+    try:
+        keys = []
+        for w in [10, 20, 30]:
+            params = {"短期均線": 5, "長期均線": w}
+            backtest_cache.run_backtest_cached(df, "簡單均線交叉", params)
+            keys.append(backtest_cache.cache_key(df, "簡單均線交叉", params))
+        in_memory = list(backtest_cache._memory)
+
+        with temp_engine.connect() as conn:
+            payload_size = conn.exec_driver_sql(
+                "SELECT MAX(size_bytes) FROM backtest_cache").scalar()
+        backtest_cache.MAX_DISK_BYTES = payload_size * 2
+        backtest_cache.run_backtest_cached(df, "簡單均線交叉", {"短期均線": 5, "長期均線": 40})
+        with temp_engine.connect() as conn:
+            on_disk = [r[0] for r in conn.exec_driver_sql(
+                "SELECT cache_key FROM backtest_cache ORDER BY last_used").fetchall()]
+    finally:
+        backtest_cache.MAX_MEMORY_ENTRIES, backtest_cache.MAX_DISK_BYTES = old_entries, old_disk
+        backtest_cache.clear(disk=False)
+    assert in_memory == keys[1:]
+    assert len(on_disk) == 2 and keys[0] not in on_disk and keys[1] not in on_disk
+    print("✅ 記憶體 LRU 與 SQLite 大小上限淘汰正確")
+
+
+def test_concurrent_sessions_share_memory_cache(prices, temp_engine):
+    frames = [prices(50, seed=s, vol=0.015) for s in range(8)]
+    errors = []
+    old_entries, old_interval = backtest_cache.MAX_MEMORY_ENTRIES, sys.getswitchinterval()
+
+    def session(worker):
+        try:
+            for i in range(400):
+                key = f"k{(worker * 7 + i) % 12}"
+                if backtest_cache.get(key) is None:
+                    backtest_cache.put(key, frames[i % len(frames)], persist=False)
+        except Exception as e:       # 淘汰與讀取交錯時不可拋出 KeyError
+            errors.append(e)
+
+    backtest_cache.clear()
+    backtest_cache.MAX_MEMORY_ENTRIES = 3
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=session, args=(w,)) for w in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        total = sum(nbytes for _, nbytes in backtest_cache._memory.values())
+        assert backtest_cache._memory_bytes == total and len(backtest_cache._memory) <= 3
+    finally:
+        sys.setswitchinterval(old_interval)
+        backtest_cache.MAX_MEMORY_ENTRIES = old_entries
+        backtest_cache.clear(disk=False)
+    assert errors == []
+    print("✅ 多個 session 同時讀寫記憶體快取不會出錯，位元組計數一致")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,132 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import crypto_strategy
+import optimizer
+from crypto_strategy import (crypto_backtest_batch, crypto_metrics, finish_strategy, hull_moving_average,
+                             supertrend, supertrend_kernel, wma)
+from optimizer import cross_symbol_search
+from reference_impl import lambda_hull, lambda_wma, supertrend_basic_bands, supertrend_loop
+from strategy import apply_strategy, build_position_array
+
+HOURLY = dict(vol=0.01, base=30000, spread=0.005, freq="h")   # 虛擬幣小時線
+
+
+def test_wma_matches_rolling_apply(prices):
+    close = prices(3000, seed=7, **HOURLY)["Close"].copy()
+    close.iloc[[3, 400, 2500]] = np.nan
+    for n in (1, 2, 3, 10, 70, 140, 1500):
+        fast, ref = wma(close, n), lambda_wma(close, n)
+        pd.testing.assert_index_equal(fast.index, ref.index)
+        assert (fast.isna() == ref.isna()).all(), n
+        np.testing.assert_allclose(fast, ref, rtol=1e-10)
+    np.testing.assert_allclose(wma(close.to_numpy(), 20), lambda_wma(close, 20), rtol=1e-10)
+    assert wma(close.iloc[:5], 10).isna().all()
+    print("✅ 累加和 WMA 與 rolling.apply 結果相同（誤差 < 1e-10，含 NaN 與長視窗）")
+
+
+def test_hull_strategy_matches_lambda(prices):
+    df = prices(3000, seed=7, **HOURLY)
+    for n1, n2 in [(20, 140), (9, 50), (30, 130)]:
+        ref = lambda_hull(df["Close"], n1), lambda_hull(df["Close"], n2)
+        out = apply_strategy(df, "SMA/Hull 趨勢策略", {"type": "hull", "n1": n1, "n2": n2})
+        np.testing.assert_allclose(out["trend1"], ref[0], rtol=1e-10)
+        np.testing.assert_allclose(out["trend2"], ref[1], rtol=1e-10)
+        buy  = (ref[0] > ref[1]) & (ref[0].shift(1) <= ref[1].shift(1))
+        sell = (ref[0] < ref[1]) & (ref[0].shift(1) >= ref[1].shift(1))
+        assert (out["Position"].to_numpy() == build_position_array(buy, sell)).all()
+    # n1 = 1 時半週期為 0，原本的實作會除以 0
+    np.testing.assert_allclose(hull_moving_average(df["Close"], 1), df["Close"], rtol=1e-10)
+    print("✅ Hull 趨勢策略的均線與訊號與原實作一致")
+
+
+def test_bot_helpers_are_self_contained(prices):
+    close = prices(3000, seed=7, **HOURLY)["Close"]
+    namespace = {"np": np, "pd": pd}
+    for fn in (wma, hull_moving_average):
+        exec(inspect.getsource(fn), namespace)
+    pd.testing.assert_series_equal(namespace["hull_moving_average"](close, 20), hull_moving_average(close, 20))
+    exported = open("tradingBtcTest.py", encoding="utf-8").read()
+    assert inspect.getsource(crypto_strategy.wma) in exported
+    assert inspect.getsource(crypto_strategy.hull_moving_average) in exported
+    print("✅ 匯出機器人內嵌的 WMA / Hull 只依賴 numpy / pandas，與回測使用同一份程式")
+
+
+def test_supertrend_kernel_matches_loops(prices):
+    df = prices(1500, seed=7, **HOURLY)
+    kernels = [supertrend_kernel] + ([crypto_strategy._supertrend_kernel_jit]
+                                     if crypto_strategy.NUMBA_AVAILABLE else [])
+    for period, mult in [(1, 3.0), (10, 3.0), (14, 2.0)]:
+        upper, lower = supertrend_basic_bands(df, period, mult)
+        # 原迴圈在 ATR 暖身期拿 NaN 比較，軌道會一路沿用 NaN（週期 > 1 時從不交易）；
+        # 暖身期以 ±inf（永不觸及）代替，等同 kernel「前一根尚無軌道時直接採用新值」
+        warm = upper.isna()
+        ref_u, ref_l, ref_dir = supertrend_loop(df["Close"], upper.mask(warm, np.inf),
+                                                 lower.mask(warm, -np.inf))
+        for kernel in kernels:
+            up, lo, direction, position = supertrend(df["High"], df["Low"], df["Close"], period, mult,
+                                                     kernel=kernel)
+            np.testing.assert_array_equal(up[~warm], ref_u[~warm])
+            np.testing.assert_array_equal(lo[~warm], ref_l[~warm])
+            assert np.isnan(up[warm]).all() and (direction == ref_dir.to_numpy()).all()
+        out = apply_strategy(df, "Supertrend 策略", {"ATR 週期": period, "ATR 倍數": mult})
+        assert (out["Position"].to_numpy() == position).all()
+        assert out["Position"].diff().abs().sum() > 10
+        if period == 1:                                   # 沒有暖身期：與原迴圈逐位元相同
+            for got, ref in zip((up, lo, direction), (ref_u, ref_l, ref_dir)):
+                np.testing.assert_array_equal(got, ref.to_numpy())
+
+    # 中途缺價：該根軌道為 NaN，下一根起重新採用新值，不會一路鎖成 NaN
+    df.iloc[[200, 201, 900], df.columns.get_loc("High")] = np.nan
+    up, lo, direction, position = supertrend(df["High"], df["Low"], df["Close"], 10, 3.0)
+    assert np.isfinite(up[1000:]).all() and np.isfinite(lo[1000:]).all()
+    assert set(np.unique(direction)) == {-1, 1} and set(np.unique(position)) == {0, 1}
+    print("✅ Supertrend 單趟 kernel 與原本 .iloc 迴圈結果相同，持倉與回測一致，暖身期與缺價不再鎖死")
+
+
+def test_bot_supertrend_helpers_are_self_contained(prices):
+    df = prices(800, seed=7, **HOURLY)
+    namespace = {"np": np, "pd": pd}
+    for fn in (supertrend_kernel, supertrend):
+        exec(inspect.getsource(fn), namespace)
+    got = namespace["supertrend"](df["High"], df["Low"], df["Close"], 10, 3.0)
+    for a, b in zip(got, supertrend(df["High"], df["Low"], df["Close"], 10, 3.0)):
+        np.testing.assert_array_equal(a, b)
+    print("✅ 匯出機器人內嵌的 Supertrend kernel 只依賴 numpy / pandas")
+
+
+
+def test_cross_symbol_metrics_match_single_symbol(prices):
+    df = prices(600, seed=9, **HOURLY)
+    df.iloc[130:, df.columns.get_indexer(["Open", "High", "Low", "Close"])] *= 1.8   # 持倉中單根 +80%：虛擬幣不剔除
+    combos = [{"type": "sma", "n1": n1, "n2": n2} for n1 in (5, 10, 20) for n2 in (40, 80)]
+    cost   = {"buy_fee": 0.001, "sell_fee": 0.001, "sell_tax": 0.0, "stop_loss": 0.05}
+
+    for cfg in (None, cost):
+        _, per_symbol = cross_symbol_search({"BTC/USDT": df}, "SMA/Hull 趨勢策略", combos,
+                                            risk_cfg=cfg, workers=1, trading_days=365,
+                                            evaluate=crypto_backtest_batch)
+        # 與單一交易對頁面的逐組回測（apply_strategy → finish_strategy → crypto_metrics）相同
+        single = [crypto_metrics(finish_strategy(apply_strategy(df, "SMA/Hull 趨勢策略", p), cfg), 365)
+                  for p in combos]
+        assert per_symbol["BTC/USDT"] == single
+        assert all(type(v) in (float, int) for m in single for v in m.values())
+    stock = list(optimizer.run_backtest_batch(df, "SMA/Hull 趨勢策略", combos, cost, trading_days=365))
+    assert all(s["累積報酬率(%)"] > t["累積報酬率(%)"] + 50 for s, t in zip(single, stock))
+
+    old_min, optimizer.MIN_PARALLEL_ROWS = optimizer.MIN_PARALLEL_ROWS, 0
+    try:
+        _, parallel = cross_symbol_search({"BTC/USDT": df}, "SMA/Hull 趨勢策略", combos, risk_cfg=cost,
+                                          workers=2, chunk_size=2, trading_days=365,
+                                          evaluate=crypto_backtest_batch)
+    finally:
+        optimizer.MIN_PARALLEL_ROWS = old_min
+    assert parallel["BTC/USDT"] == single
+    print("✅ 跨交易對最佳化與單一交易對回測的虛擬幣績效相同（含單日大漲、平行計算）")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,205 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import database
+import parquet_store
+
+
+def _linear_prices(n=30):
+    dates = pd.bdate_range("2024-01-01", periods=n, name="Date")
+    close = np.linspace(100, 130, n)
+    df = pd.DataFrame({
+        "Open": close - 1, "High": close + 1, "Low": close - 2,
+        "Close": close, "Adj Close": close, "Volume": np.arange(n) * 1000,
+    }, index=dates)
+    df.iloc[3, df.columns.get_loc("Adj Close")] = np.nan
+    return df
+
+
+def test_bulk_save_matches_row_loop(temp_engine):
+    df = _linear_prices()
+    database.save_stock_prices(df, "LOOP.TW", bulk=False)
+    database.save_stock_prices(df, "BULK.TW", bulk=True)
+    loop = database.load_stock_prices("LOOP.TW").drop(columns="stock_code")
+    bulk = database.load_stock_prices("BULK.TW").drop(columns="stock_code")
+    pd.testing.assert_frame_equal(loop, bulk)
+    assert len(bulk) == len(df)
+    assert bulk["Adj Close"].isna().sum() == 1
+    print("✅ 批次寫入與逐列寫入結果一致")
+
+
+def test_bulk_save_upserts_existing_rows(temp_engine):
+    df = _linear_prices()
+    database.save_stock_prices(df, "2330.TW")
+    df2 = df.copy()
+    df2["Close"] = df2["Close"] + 5
+    database.save_stock_prices(df2.iloc[-5:], "2330.TW")
+    out = database.load_stock_prices("2330.TW")
+    assert len(out) == len(df)
+    assert np.allclose(out["Close"].iloc[-5:], df2["Close"].iloc[-5:])
+    assert np.allclose(out["Close"].iloc[:-5], df["Close"].iloc[:-5])
+    print("✅ 批次寫入 INSERT OR REPLACE 正確覆蓋")
+
+
+def test_parquet_backend_matches_sqlite(temp_engine, tmp_path, monkeypatch):
+    if not parquet_store.PYARROW_AVAILABLE:
+        print("⏭️ 未安裝 pyarrow，略過 Parquet 測試")
+        return
+    df = _linear_prices(300)
+    monkeypatch.setattr(parquet_store, "_STORE_DIR", str(tmp_path / "price_store"))
+    monkeypatch.delenv("PRICE_STORE_BACKEND", raising=False)
+    database.save_stock_prices(df, "^TWII")
+    sqlite_df = database.load_stock_prices("^TWII", "2024-02-01", "2024-06-28")
+
+    monkeypatch.setenv("PRICE_STORE_BACKEND", "parquet")
+    database.save_stock_prices(df.iloc[:200], "^TWII")
+    database.save_stock_prices(df.iloc[150:], "^TWII")   # 重疊區間以新資料為準
+    pq_df = database.load_stock_prices("^TWII", "2024-02-01", "2024-06-28")
+    latest = database.get_latest_date("^TWII")
+    database.delete_stock_prices("^TWII")
+    empty = database.load_stock_prices("^TWII")
+
+    pd.testing.assert_frame_equal(sqlite_df, pq_df, check_dtype=False, check_index_type=False)
+    assert latest == df.index.max().strftime("%Y-%m-%d")
+    assert empty.empty
+    print("✅ Parquet 後端與 SQLite 讀出結果一致")
+
+
+def test_load_stock_prices_many_matches_single_loads(temp_engine):
+    df = _linear_prices()
+    database.save_stock_prices(df, "2330.TW")
+    database.save_stock_prices(df.iloc[10:], "0050.TW")
+    singles = {c: database.load_stock_prices(c, "2024-01-05", "2024-02-05")
+               for c in ["0050.TW", "2330.TW", "NONE.TW"]}
+    many  = database.load_stock_prices_many(["0050.TW", "2330.TW", "NONE.TW"],
+                                            "2024-01-05", "2024-02-05")
+    panel = database.load_stock_prices_many(["0050.TW", "2330.TW"], as_panel=True)
+    assert list(many) == ["0050.TW", "2330.TW", "NONE.TW"]
+    for code in ["0050.TW", "2330.TW"]:
+        pd.testing.assert_frame_equal(many[code], singles[code])
+    assert many["NONE.TW"].empty
+    assert panel.index.names == ["Date", "stock_code"]
+    assert len(panel) == len(df) + len(df) - 10
+    print("✅ load_stock_prices_many 與逐支讀取結果一致")
+
+
+def test_tuned_engine_uses_wal_and_inits_schema_once(tmp_path, monkeypatch):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'wal.db'}", "tuned")
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(database, "_schema_ready_for", None)
+    database.init_db()
+    with engine.connect() as conn:
+        mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        sync = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        conn.exec_driver_sql("DROP TABLE price_coverage")
+        conn.commit()
+    database.init_db()                 # 同一個 engine 不再建表
+    with engine.connect() as conn:
+        skipped = conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'price_coverage'"
+        ).scalar() == 0
+    database.init_db(force=True)
+    with engine.connect() as conn:
+        rebuilt = conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'price_coverage'"
+        ).scalar() == 1
+    engine.dispose()
+    assert mode.lower() == "wal"
+    assert sync == 1                       # NORMAL
+    assert skipped and rebuilt
+    print("✅ tuned 連線設定啟用 WAL，建表每個 engine 只執行一次")
+
+
+def test_strategy_result_roundtrip_and_delete(temp_engine):
+    idx = pd.bdate_range("2023-01-02", periods=500, name="Date")
+    result = pd.DataFrame({
+        "Position":    (np.arange(500) // 20 % 2).astype(int),
+        "Strategy":    np.linspace(-0.01, 0.01, 500),
+        "DailyReturn": np.linspace(0.02, -0.02, 500),
+    }, index=idx)
+    params = {"short_window": 5, "long_window": 20}
+    database.save_strategy_result("2330.TW", "均線交叉策略", params, result)
+    database.save_strategy_result("2330.TW", "均線交叉策略", params, result.iloc[:100])  # 覆蓋
+    same_id = database.strategy_run_id("2330.TW", "均線交叉策略",
+                                       {"long_window": 20, "short_window": 5})
+    loaded = database.load_strategy_result("2330.TW", "均線交叉策略", params)
+    runs   = database.list_strategy_runs("2330.TW")
+    database.delete_strategy_result("2330.TW", "均線交叉策略", params)
+    after  = database.load_strategy_result("2330.TW", "均線交叉策略", params)
+    assert same_id == runs["run_id"].iloc[0]
+    assert len(runs) == 1 and runs["n_rows"].iloc[0] == 100
+    pd.testing.assert_frame_equal(loaded[["Position", "Strategy", "DailyReturn"]],
+                                  result.iloc[:100], check_freq=False)
+    assert (loaded["strategy_name"] == "均線交叉策略").all()
+    assert after.empty
+    print("✅ strategy_run 以單列 BLOB 存取回測結果")
+
+
+def test_legacy_text_date_table_is_migrated(temp_engine):
+    with temp_engine.begin() as conn:
+        conn.exec_driver_sql("""
+            CREATE TABLE stock_price (
+                Date TEXT NOT NULL, Open REAL, High REAL, Low REAL, Close REAL,
+                Volume INTEGER, "Adj Close" REAL, stock_code TEXT NOT NULL,
+                PRIMARY KEY (Date, stock_code))
+        """)
+        conn.exec_driver_sql("""
+            INSERT INTO stock_price VALUES
+            ('2024-01-02', 1, 2, 0.5, 1.5, 100, 1.5, '2330.TW'),
+            ('2024-01-03 00:00:00', 2, 3, 1.5, 2.5, 200, 2.5, '2330.TW'),
+            ('2024-01-03', 9, 9, 9, 9, 900, 9, '0050.TW')
+        """)
+        conn.exec_driver_sql("""
+            WITH RECURSIVE d(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM d WHERE i < 1999)
+            INSERT INTO stock_price
+            SELECT date('2010-01-01', '+' || i || ' days'), i, i, i, i, i, i, '9999.TW' FROM d
+        """)                                           # 舊表夠大，刪除後的空頁不會被新建的表用完
+    database.init_db(force=True)
+    with temp_engine.connect() as conn:
+        ddl = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'stock_price'").scalar()
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    df     = database.load_stock_prices("2330.TW", "2024-01-03", "2024-01-03")
+    latest = database.get_latest_date("2330.TW")
+    dates  = database.get_stored_dates("2330.TW")
+    assert "WITHOUT ROWID" in ddl and "Date INTEGER" in ddl
+    assert free == 0                                   # 轉換後已 VACUUM，舊表的空頁不留在檔案內
+    assert list(df.columns) == ["Open", "High", "Low", "Close", "Volume", "Adj Close", "stock_code"]
+    assert df.index.tolist() == [pd.Timestamp("2024-01-03")] and df["Close"].iloc[0] == 2.5
+    assert latest == "2024-01-03"
+    assert list(dates) == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+    print("✅ 舊版 Date TEXT 資料表自動轉成 epoch day + WITHOUT ROWID，並 VACUUM 回收空間")
+
+
+
+def test_legacy_strategy_result_is_migrated(temp_engine):
+    idx = pd.bdate_range("2023-01-02", periods=60, name="Date")
+    result = pd.DataFrame({
+        "Position":    (np.arange(60) // 10 % 2).astype(int),
+        "Strategy":    np.linspace(-0.01, 0.01, 60),
+        "DailyReturn": np.linspace(0.02, -0.02, 60),
+    }, index=idx)
+    # 舊版 save_strategy_result 的寫法：每個交易日一列，params 未排序鍵
+    for code, params in [("2330.TW", {"short_window": 5, "long_window": 20}),
+                         ("0050.TW", {"short_window": 10, "long_window": 60})]:
+        legacy = result.reset_index().assign(stock_code=code, strategy_name="均線交叉策略",
+                                             params=json.dumps(params, ensure_ascii=False))
+        legacy[["Date", "stock_code", "strategy_name", "params", "Position", "Strategy",
+                "DailyReturn"]].to_sql("strategy_result", temp_engine, if_exists="append", index=False)
+
+    database.init_db(force=True)
+    loaded = database.load_strategy_result("2330.TW", "均線交叉策略", {"long_window": 20, "short_window": 5})
+    runs   = database.list_strategy_runs()
+    with temp_engine.connect() as conn:
+        tables = {r[0] for r in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    pd.testing.assert_frame_equal(loaded[["Position", "Strategy", "DailyReturn"]], result, check_freq=False)
+    assert sorted(runs["stock_code"]) == ["0050.TW", "2330.TW"] and set(runs["n_rows"]) == {60}
+    assert "strategy_result" not in tables
+    print("✅ 舊版 strategy_result 搬進 strategy_run 後刪除")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
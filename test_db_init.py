@@ -1,4 +1,17 @@
-from database import init_db
+import pytest
+from sqlalchemy import inspect
 
-init_db()
-print("✅ 資料庫初始化完成")
\ No newline at end of file
+import database
+
+
+def test_init_db_creates_schema(temp_engine):
+    # 在暫存 DB 上建表，不動到版本控制中的 stock_data.db
+    database.init_db()
+    tables = set(inspect(temp_engine).get_table_names())
+    assert {"stock_price", "price_coverage", "strategy_run", "backtest_cache",
+            "opt_sweep", "opt_result"} <= tables
+    print("✅ 資料庫初始化完成")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
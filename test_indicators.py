@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+import indicators
+from strategy import apply_strategy, strategy_positions
+
+
+def test_indicators_match_pandas(prices):
+    close = prices(500, seed=3, vol=0.015)["Close"]
+    indicators.clear()
+    pd.testing.assert_series_equal(indicators.sma(close, 20), close.rolling(20).mean())
+    pd.testing.assert_series_equal(indicators.rolling_std(close, 20), close.rolling(20).std())
+    pd.testing.assert_series_equal(indicators.rolling_max(close, 10), close.rolling(10).max())
+    pd.testing.assert_series_equal(indicators.rolling_min(close, 10), close.rolling(10).min())
+    pd.testing.assert_series_equal(indicators.ema(close, 12), close.ewm(span=12, adjust=False).mean())
+    pd.testing.assert_series_equal(indicators.pct_change(close, 3), close.pct_change(periods=3))
+    delta = close.diff()
+    rs    = delta.clip(lower=0).rolling(14).mean() / (-delta.clip(upper=0)).rolling(14).mean()
+    pd.testing.assert_series_equal(indicators.rsi(close, 14), 100 - (100 / (1 + rs)))
+    print("✅ 指標快取結果與 pandas 直接計算一致")
+
+
+def test_sma_sweep_computes_each_window_once(prices):
+    df = prices(500, seed=3, vol=0.015)
+    indicators.clear()
+    shorts, longs = [5, 10, 20], [20, 60, 120]
+    for s in shorts:
+        for l in longs:
+            apply_strategy(df, "簡單均線交叉", {"短期均線": s, "長期均線": l})
+    assert indicators.stats["misses"] == len(set(shorts) | set(longs))
+    assert indicators.stats["hits"] == 2 * len(shorts) * len(longs) - indicators.stats["misses"]
+
+    # 內容不同（多一根 K 棒）就重新計算
+    before = indicators.stats["misses"]
+    apply_strategy(df.iloc[:-1], "簡單均線交叉", {"短期均線": 5, "長期均線": 20})
+    assert indicators.stats["misses"] == before + 2
+    print("✅ 均線交叉網格搜尋每個視窗只計算一次 SMA")
+
+
+def test_cache_is_bounded(prices):
+    close = prices(500, seed=3, vol=0.015)["Close"]
+    old, old_bytes = indicators.MAX_ENTRIES, indicators.MAX_MEMORY_BYTES
+    indicators.clear()
+    indicators.MAX_ENTRIES = 5
+    try:
+        for w in range(2, 12):
+            indicators.sma(close, w)
+        assert len(indicators._cache) == 5
+        indicators.MAX_ENTRIES, indicators.MAX_MEMORY_BYTES = old, 3 * close.to_numpy().nbytes
+        for w in range(2, 12):
+            indicators.sma(close, w)
+        assert len(indicators._cache) == 3
+        assert indicators._cache_bytes == sum(n for _, n in indicators._cache.values())
+    finally:
+        indicators.MAX_ENTRIES, indicators.MAX_MEMORY_BYTES = old, old_bytes
+        indicators.clear()
+    print("✅ 指標快取數量受 MAX_ENTRIES 限制，總大小受 MAX_MEMORY_BYTES 限制")
+
+
+def test_cached_values_are_read_only(prices):
+    df = prices(500, seed=3, vol=0.015)
+    indicators.clear()
+    sma = indicators.sma(df["Close"], 20)
+    try:
+        sma.iloc[-1] = 0.0
+        raise AssertionError("快取中的指標不應可就地修改")
+    except ValueError:
+        pass
+    _, cols = strategy_positions(df, "布林通道策略", {"期間": 20, "標準差倍數": 2.0}, with_indicators=True)
+    assert not cols["MA"].flags.writeable
+    out = apply_strategy(df, "簡單均線交叉", {"短期均線": 5, "長期均線": 20})
+    out.loc[out.index[-1], "SMA_short"] = 0.0            # 指定成 df 欄位後可自由修改
+    pd.testing.assert_series_equal(indicators.sma(df["Close"], 20), df["Close"].rolling(20).mean())
+    assert indicators.sma(df["Close"], 5).iloc[-1] != 0.0
+    print("✅ 快取中的指標為唯讀，呼叫端無法污染快取")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import opt_store
+from optimizer import grid_values, run_backtest_batch, search_parameters
+
+
+def test_sweep_resume_skips_evaluated_combos(prices, temp_engine):
+    df     = prices(400, seed=3)
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 15, 3) for l in (20, 30, 60)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003}
+    sweep = opt_store.open_sweep("2330.TW", "簡單均線交叉", "2020-01-01", "2021-12-31", cost, prices=df)
+    # 第一次只跑了一半就中斷
+    half = combos[:len(combos) // 2]
+    opt_store.record(sweep, half, list(run_backtest_batch(df, "簡單均線交叉", half, cost)))
+
+    # 鍵順序不同、numpy 型別的同一組參數視為已評估
+    reordered = [{"長期均線": np.int64(c["長期均線"]), "短期均線": c["短期均線"]} for c in combos]
+    results, missing = opt_store.lookup(sweep, reordered)
+    assert missing == list(range(len(half), len(combos)))
+    rest = [combos[i] for i in missing]
+    opt_store.record(sweep, rest, list(run_backtest_batch(df, "簡單均線交叉", rest, cost)))
+    opt_store.record(sweep, [{"短期均線": 0, "長期均線": 0}], [None])
+    results, missing = opt_store.lookup(sweep, combos)
+    invalid = opt_store.lookup(sweep, [{"短期均線": 0, "長期均線": 0}])
+
+    same   = opt_store.open_sweep("2330.TW", "簡單均線交叉", "2020-01-01", "2021-12-31", cost, prices=df)
+    other  = opt_store.open_sweep("2330.TW", "簡單均線交叉", "2020-01-01", "2021-12-31", None, prices=df)
+    edited = df.copy()
+    edited.iloc[-1, edited.columns.get_loc("Close")] *= 1.01
+    moved  = opt_store.sweep_id("2330.TW", "簡單均線交叉", "2020-01-01", "2021-12-31", cost, prices=edited)
+    sweeps = opt_store.list_sweeps("2330.TW", "簡單均線交叉")
+    loaded = opt_store.load_sweep(sweep)
+    opt_store.delete_sweep(other)
+    remaining = opt_store.list_sweeps("2330.TW")
+
+    assert missing == []
+    assert results == list(run_backtest_batch(df, "簡單均線交叉", combos, cost))
+    assert invalid == ([None], [])                             # 無效組合也記錄，之後同樣略過
+    assert same == sweep and other != sweep and moved != sweep
+    assert set(sweeps["sweep_id"]) == {sweep, other}
+    assert sweeps.set_index("sweep_id").loc[sweep, "n_results"] == len(combos) + 1
+    assert len(loaded) == len(combos)
+    assert {"短期均線", "長期均線", "夏普比率"} <= set(loaded.columns)
+    assert remaining["sweep_id"].tolist() == [sweep]
+    print("✅ 最佳化紀錄：續跑只回測未評估的組合，設定或股價變動時開新的掃描")
+
+
+def test_cached_evaluate_dedups_and_skips_subsets(prices, temp_engine):
+    df    = prices(600, seed=3)
+    space = grid_values({"短期均線": ("int", 3, 30, 1), "長期均線": ("int", 20, 80, 2)})
+    calls = []
+
+    def evaluate(combos, data):
+        calls.append((len(combos), len(data)))
+        return list(run_backtest_batch(data, "簡單均線交叉", combos))
+
+    sweep  = opt_store.open_sweep("BTC/USDT", "簡單均線交叉", "2020-01-01", "2022-12-31",
+                                  prices=df, interval="1d")
+    cached = opt_store.cached_evaluate(sweep, evaluate, df)
+    repeat = cached([{"短期均線": 5, "長期均線": 20}] * 3, df)
+    assert calls == [(1, len(df))] and repeat[0] == repeat[2]
+    assert cached([{"短期均線": 5, "長期均線": 20}], df[-100:]) and calls[-1] == (1, 100)
+
+    first  = search_parameters("halving", space, cached, df, "夏普比率", budget=200, seed=0)
+    stored = len(opt_store.load_sweep(sweep))
+    calls.clear()
+    again  = opt_store.cached_evaluate(sweep, evaluate, df)
+    second = search_parameters("halving", space, again, df, "夏普比率", budget=200, seed=0)
+
+    assert first["results"] == second["results"]
+    assert all(n_rows < len(df) for _, n_rows in calls)       # 全期間結果全部取自紀錄
+    assert again.stats["evaluated"] == 0 and again.stats["reused"] == len(second["results"])
+    assert stored == len({tuple(sorted(c.items())) for c, _ in first["results"]} | {(("短期均線", 5), ("長期均線", 20))})
+    print("✅ cached_evaluate 同批重複組合只回測一次，資料子集不記錄，重跑時全期間結果直接取回")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import crypto_strategy  # noqa: F401
+import optimizer
+from optimizer import (SharedPrices, attach_prices, parallel_grid_search, run_backtest_batch,
+                       SEARCH_MODES, grid_values, rank_results, search_parameters,
+                       strategy_returns, walk_forward, walk_forward_windows, window_metrics,
+                       CROSS_AGGREGATES, cross_symbol_search, pruned_grid_search)
+
+
+def _collect(df, name, combos, **kwargs):
+    n_exits = max(len(kwargs.get("exit_grid") or []), 1)
+    out = [None] * (len(combos) * n_exits)
+    for start, chunk in parallel_grid_search(df, name, combos, **kwargs):
+        out[start:start + len(chunk)] = chunk
+    return out
+
+
+def test_shared_prices_roundtrip(prices):
+    df = prices(800, seed=5, stock_code="TEST")
+    with SharedPrices(df) as shared:
+        restored, shm = attach_prices(shared.spec)
+        pd.testing.assert_frame_equal(restored, df.drop(columns="stock_code"))
+        del restored
+        shm.close()
+    print("✅ 共享記憶體重建的股價與原始 df 相同")
+
+
+def test_parallel_grid_search_matches_serial(prices):
+    df     = prices(800, seed=5, stock_code="TEST")
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 15, 2) for l in range(20, 50, 5)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003}
+    exits  = [{"trailing_stop": 0.0}, {"trailing_stop": 0.05}]
+    crypto = [{"ATR 週期": p, "ATR 倍數": m} for p in (7, 10, 14) for m in (2.0, 3.0)]
+
+    old_min, optimizer.MIN_PARALLEL_ROWS = optimizer.MIN_PARALLEL_ROWS, 0
+    try:
+        plain    = _collect(df, "簡單均線交叉", combos, workers=2, chunk_size=7)
+        with_exit = _collect(df, "簡單均線交叉", combos, risk_cfg=cost, exit_grid=exits,
+                             workers=2, chunk_size=5)
+        super_tr = _collect(df, "Supertrend 策略", crypto, workers=2, chunk_size=2)
+    finally:
+        optimizer.MIN_PARALLEL_ROWS = old_min
+
+    assert plain == list(run_backtest_batch(df, "簡單均線交叉", combos))
+    assert with_exit == list(run_backtest_batch(df, "簡單均線交叉", combos, cost, exits))
+    assert super_tr == list(run_backtest_batch(df, "Supertrend 策略", crypto))
+    assert len(with_exit) == len(combos) * 2 and all(m is not None for m in super_tr)
+    print("✅ 多行程平行掃描結果與單行程相同（含出場條件展開、虛擬幣策略）")
+
+
+def test_search_modes_respect_budget():
+    space = grid_values({"a": ("int", 0, 39, 1), "b": ("int", 0, 39, 1), "c": ("float", 0.5, 3.0, 0.25)})
+    data  = pd.DataFrame({"Close": np.arange(200.0)})
+    calls = []
+
+    def evaluate(combos, data):
+        calls.append(len(data))
+        return [{"夏普比率": -((c["a"] - 27) / 10) ** 2 - ((c["b"] - 8) / 10) ** 2 - (c["c"] - 1.75) ** 2,
+                 "累積報酬率(%)": 0.0, "最大回撤(%)": 0.0} for c in combos]
+
+    assert len(space["c"]) == 11
+    for mode in SEARCH_MODES:
+        calls.clear()
+        found = search_parameters(mode, space, evaluate, data, "夏普比率", budget=880)
+        best  = max(m["夏普比率"] for _, m in found["results"])
+        assert found["total"] == 40 * 40 * 11
+        assert found["evaluations"] == found["total"] if mode == "grid" else found["evaluations"] <= 880
+        assert best > -0.1, (mode, best)
+        if mode == "halving":
+            assert min(calls) == 50                       # 最近 25% 的資料
+    full = search_parameters("tpe", space, evaluate, data, "夏普比率", budget=10 ** 6)
+    assert full["evaluations"] == found["total"]          # 預算大於組合數時等同網格搜尋
+    print("✅ 粗網格細化 / 逐步減半 / TPE 在 1/20 預算內找到接近最佳的組合")
+
+
+def test_rank_results_drawdown_direction():
+    df_opt = pd.DataFrame({"夏普比率": [1.0, 2.0, 0.5], "累積報酬率(%)": [10.0, 5.0, 20.0],
+                           "最大回撤(%)": [-30.0, -5.0, -12.0]})
+    assert rank_results(df_opt, "最大回撤(%)（最小化）")["最大回撤(%)"].tolist() == [-5.0, -12.0, -30.0]
+    assert rank_results(df_opt, "夏普比率")["夏普比率"].iloc[0] == 2.0
+    assert rank_results(df_opt, "累積報酬率(%)")["累積報酬率(%)"].iloc[0] == 20.0
+    print("✅ 最小化回撤時以最接近 0 的回撤排第一")
+
+
+def test_walk_forward_windows():
+    rolling  = walk_forward_windows(1000, n_folds=4, train_ratio=0.75)
+    anchored = walk_forward_windows(1000, n_folds=4, train_ratio=0.75, anchored=True)
+    assert rolling == [(0, 432, 432, 574), (142, 574, 574, 716), (284, 716, 716, 858), (426, 858, 858, 1000)]
+    assert [w[0] for w in anchored] == [0] * 4 and [w[1:] for w in anchored] == [w[1:] for w in rolling]
+    try:
+        walk_forward_windows(100, n_folds=10)
+        assert False, "資料太短應拋出例外"
+    except ValueError:
+        pass
+    for n_folds in (0, -3):
+        try:
+            walk_forward_windows(1000, n_folds, 0.75)
+            assert False, "折數小於 1 應拋出 ValueError"
+        except ValueError:
+            pass
+    print("✅ Walk-forward 視窗切分（滾動 / 錨定）正確")
+
+
+def test_walk_forward_out_of_sample(prices):
+    df     = prices(1200, seed=5, stock_code="TEST")
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 15, 3) for l in range(20, 60, 10)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003, "stop_loss": 0.08}
+
+    # 全期間切片的績效與逐組回測相同（含成本與停損）
+    for cfg in (None, cost):
+        returns, positions, costs, keep, _ = strategy_returns(df, "簡單均線交叉", combos, cfg)
+        stats = window_metrics(returns, positions, costs, keep, [(0, len(df))])[0]
+        ref   = list(run_backtest_batch(df, "簡單均線交叉", combos, cfg))
+        assert all(optimizer.format_performance(stats, j) == ref[j] for j in range(len(combos)))
+
+    # 收盤價缺值：與 run_backtest_batch 相同，先剔除再計算成本與停損
+    gappy = df.copy()
+    gappy.iloc[[100, 101, 700], gappy.columns.get_loc("Close")] = np.nan
+    for cfg in (None, cost):
+        returns, positions, costs, keep, _ = strategy_returns(gappy, "簡單均線交叉", combos, cfg)
+        assert returns.shape == (len(gappy), len(combos)) and not keep[[100, 101, 700]].any()
+        stats = window_metrics(returns, positions, costs, keep, [(0, len(gappy))])[0]
+        ref   = list(run_backtest_batch(gappy, "簡單均線交叉", combos, cfg))
+        assert all(optimizer.format_performance(stats, j) == ref[j] for j in range(len(combos)))
+    assert len(walk_forward(gappy, "簡單均線交叉", combos, risk_cfg=cost, n_folds=4, workers=1)["folds"]) == 4
+
+    wf = walk_forward(df, "簡單均線交叉", combos, risk_cfg=cost, n_folds=4, workers=1)
+    assert [f["折"] for f in wf["folds"]] == [1, 2, 3, 4]
+    assert wf["oos"].index.is_monotonic_increasing and wf["oos"].index[0] == wf["folds"][0]["測試期間"][0]
+    for f in wf["folds"]:
+        train = df.loc[:f["訓練期間"][1]]
+        best  = max(zip(combos, run_backtest_batch(train, "簡單均線交叉", combos, cost)),
+                    key=lambda x: optimizer.target_score(x[1], "夏普比率"))
+        if f["訓練期間"][0] == df.index[0]:
+            assert f["參數"] == best[0]                   # 第一折訓練視窗從頭開始，等同只給訓練資料回測
+
+    # 不偷看未來：改動第一個測試視窗之後的股價，第一折選出的參數不變
+    shocked = df.copy()
+    cut = df.index.get_loc(wf["folds"][0]["測試期間"][0])
+    shocked.iloc[cut:, :4] *= np.linspace(1, 3, len(df) - cut)[:, None]
+    assert walk_forward(shocked, "簡單均線交叉", combos, risk_cfg=cost, n_folds=4,
+                        workers=1)["folds"][0]["參數"] == wf["folds"][0]["參數"]
+
+    old_min, optimizer.MIN_PARALLEL_ROWS = optimizer.MIN_PARALLEL_ROWS, 0
+    try:
+        parallel = walk_forward(df, "簡單均線交叉", combos, risk_cfg=cost, n_folds=4, workers=2,
+                                chunk_size=5)
+    finally:
+        optimizer.MIN_PARALLEL_ROWS = old_min
+    assert parallel["folds"] == wf["folds"] and parallel["oos_metrics"] == wf["oos_metrics"]
+    pd.testing.assert_frame_equal(parallel["oos"], wf["oos"])
+    print("✅ Walk-forward 各折只用訓練資料選參數，樣本外串接結果與平行計算一致")
+
+
+def test_cross_symbol_search(prices):
+    frames = {name: prices(n, seed=seed, stock_code="TEST")
+              for name, n, seed in [("AAA", 600, 1), ("BBB", 500, 2), ("CCC", 700, 3)]}
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 15, 3) for l in (20, 30, 60, 120)]
+    cost   = {"buy_fee": 0.001, "sell_fee": 0.001, "sell_tax": 0.0}
+
+    table, per_symbol = cross_symbol_search(frames, "簡單均線交叉", combos, "中位數夏普比率",
+                                            risk_cfg=cost, workers=1)
+    for symbol, df in frames.items():
+        assert per_symbol[symbol] == list(run_backtest_batch(df, "簡單均線交叉", combos, cost))
+    assert len(table) == len(combos) and set(table["有效交易對數"]) == {3}
+    j = 7
+    sharpes = [per_symbol[s][j]["夏普比率"] for s in frames]
+    assert table.loc[j, "中位數夏普比率"] == round(float(np.median(sharpes)), 2)
+    assert table.loc[j, "最差最大回撤(%)"] == min(per_symbol[s][j]["最大回撤(%)"] for s in frames)
+    assert table["中位數夏普比率"].is_monotonic_decreasing
+
+    worst, _ = cross_symbol_search(frames, "簡單均線交叉", combos, "最差最大回撤(%)", risk_cfg=cost, workers=1)
+    assert worst["最差最大回撤(%)"].iloc[0] == worst["最差最大回撤(%)"].max()
+
+    old_min, optimizer.MIN_PARALLEL_ROWS = optimizer.MIN_PARALLEL_ROWS, 0
+    try:
+        parallel, par_symbol = cross_symbol_search(frames, "簡單均線交叉", combos, "中位數夏普比率",
+                                                   risk_cfg=cost, workers=2, chunk_size=3)
+    finally:
+        optimizer.MIN_PARALLEL_ROWS = old_min
+    assert par_symbol == per_symbol
+    pd.testing.assert_frame_equal(parallel, table)
+    assert set(CROSS_AGGREGATES) <= set(table.columns)
+    print("✅ 跨交易對最佳化：各交易對結果與單獨回測相同，聚合分數與排序正確，平行結果一致")
+
+
+def test_pruned_grid_search(prices):
+    df     = prices(1000, seed=5, stock_code="TEST")
+    combos = [{"短期均線": s, "長期均線": l} for s in range(3, 30, 3) for l in range(20, 100, 10)]
+    cost   = {"buy_fee": 0.001425, "sell_fee": 0.001425, "sell_tax": 0.003, "stop_loss": 0.08}
+    exits  = [{"trailing_stop": 0.0}, {"trailing_stop": 0.05, "atr_stop": 2.0},
+              {"max_hold_bars": 30, "take_profit": 0.2}]
+
+    # 沒有可淘汰的條件時，分段回測（含停損跨段接續）與一次回測結果相同
+    for cfg, grid in [(None, None), (cost, None), (cost, exits)]:
+        ref = list(run_backtest_batch(df, "簡單均線交叉", combos, cfg, grid))
+        for chunks in (1, 3, 7):
+            found = pruned_grid_search(df, "簡單均線交叉", combos, cfg, grid, time_chunks=chunks,
+                                       block_size=17)
+            assert found["results"] == ref and found["pruned"] == []
+            assert found["bar_evaluations"] >= found["full_bar_evaluations"] == len(df) * len(ref)
+            assert all(type(v) in (float, int) for m in found["results"] if m for v in m.values())
+
+    # 收盤價有缺值：有成本設定時與 strategy_returns 相同先剔除缺值列，結果仍與一次回測相同
+    gappy = df.copy()
+    gappy.loc[gappy.index[[100, 101, 700]], "Close"] = np.nan
+    for cfg, grid in [(None, None), (cost, None), (cost, exits)]:
+        ref = list(run_backtest_batch(gappy, "簡單均線交叉", combos, cfg, grid))
+        for chunks in (1, 4):
+            found = pruned_grid_search(gappy, "簡單均線交叉", combos, cfg, grid, time_chunks=chunks,
+                                       block_size=17)
+            assert found["results"] == ref and found["pruned"] == []
+            bars = len(gappy) - (3 if cfg else 0)
+            assert found["full_bar_evaluations"] == bars * len(ref)
+
+    ref  = list(run_backtest_batch(df, "簡單均線交叉", combos, cost, exits))
+    full = pd.DataFrame([m for m in ref if m])
+    found = pruned_grid_search(df, "簡單均線交叉", combos, cost, exits, opt_target="最大回撤(%)（最小化）",
+                               top_k=10, time_chunks=8, block_size=32)
+    kept = pd.DataFrame([m for m in found["results"] if m])
+    assert found["pruned"] and found["bar_evaluations"] < found["full_bar_evaluations"]
+    assert all(found["results"][i] is None for i in found["pruned"])
+    assert all(found["results"][i] == ref[i] for i in range(len(ref)) if i not in found["pruned"])
+    top = lambda t: rank_results(t, "最大回撤(%)（最小化）")["最大回撤(%)"].head(10).tolist()
+    assert top(kept) == top(full)                             # 前 10 名不受淘汰影響
+
+    limited = pruned_grid_search(df, "簡單均線交叉", combos, cost, exits, max_drawdown=0.25)
+    survive = [i for i, m in enumerate(ref) if m and m["最大回撤(%)"] >= -25]
+    assert [i for i, m in enumerate(limited["results"]) if m] == survive
+    print("✅ 提前淘汰：分段回測結果與一次回測相同，淘汰後前幾名不變並省下 K 棒回測")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import database
+import price_sync
+
+
+class FakeFetcher:
+    """模擬 yfinance：回傳 [start, end) 內的交易日，並記錄每次請求的區間"""
+
+    def __init__(self):
+        dates = pd.bdate_range("2023-01-02", "2024-12-31", name="Date")
+        close = np.linspace(50, 80, len(dates))
+        self.universe = pd.DataFrame({
+            "Open": close, "High": close, "Low": close, "Close": close,
+            "Adj Close": close, "Volume": 1000,
+        }, index=dates)
+        self.calls = []
+
+    def __call__(self, stock_code, start, end):
+        self.calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        u = self.universe
+        return u[(u.index >= pd.Timestamp(start)) & (u.index < pd.Timestamp(end))]
+
+
+def test_sync_downloads_only_missing_tail(temp_engine):
+    fetcher = FakeFetcher()
+    df = price_sync.load_synced_prices("2330.TW", "2024-01-01", "2024-06-30", fetcher=fetcher)
+    assert len(fetcher.calls) == 1
+    assert df.index.min() == pd.Timestamp("2024-01-01")
+
+    # 同一區間再讀一次：完全不需下載
+    price_sync.load_synced_prices("2330.TW", "2024-01-01", "2024-06-30", fetcher=fetcher)
+    assert len(fetcher.calls) == 1
+
+    # 延長結束日：只下載尾端缺口
+    df = price_sync.load_synced_prices("2330.TW", "2024-01-01", "2024-09-30", fetcher=fetcher)
+    assert fetcher.calls[-1][0] == pd.Timestamp("2024-07-01")
+    assert df.index.max() == pd.Timestamp("2024-09-30")
+    print("✅ 增量同步只下載尾端缺口")
+
+
+def test_sync_fills_head_and_interior_gaps(temp_engine):
+    fetcher = FakeFetcher()
+    u = fetcher.universe
+    # 舊資料（沒有同步紀錄）：2024-03 整個月缺漏
+    legacy = u[(u.index >= "2024-02-01") & (u.index <= "2024-06-28")]
+    legacy = legacy[(legacy.index < "2024-03-01") | (legacy.index > "2024-03-31")]
+    database.save_stock_prices(legacy, "0050.TW")
+
+    gaps = price_sync.find_missing_ranges("0050.TW", "2024-01-01", "2024-06-28")
+    assert gaps[0][0] == pd.Timestamp("2024-01-01")
+    assert len(gaps) == 2
+
+    df = price_sync.load_synced_prices("0050.TW", "2024-01-01", "2024-06-28", fetcher=fetcher)
+    expected = u[(u.index >= "2024-01-01") & (u.index <= "2024-06-28")]
+    assert len(df) == len(expected)
+    assert price_sync.find_missing_ranges("0050.TW", "2024-01-01", "2024-06-28") == []
+    print("✅ 增量同步補齊開頭與中間斷層")
+
+
+def test_failed_download_is_not_marked_covered(temp_engine):
+    def empty(stock_code, start, end):       # yf.download 網路錯誤時回傳空表
+        return pd.DataFrame()
+
+    def broken(stock_code, start, end):
+        raise ConnectionError("DNS 解析失敗")
+
+    for fetcher in (empty, broken):
+        assert price_sync.sync_stock_prices("2330.TW", "2020-01-01", "2020-12-31", fetcher=fetcher) == 0
+        assert database.load_price_coverage("2330.TW") == []
+        assert price_sync.find_missing_ranges("2330.TW", "2020-01-01", "2020-12-31") == \
+            [(pd.Timestamp("2020-01-01"), pd.Timestamp("2020-12-31"))]
+
+    # 網路恢復後照常補齊
+    fetcher = FakeFetcher()
+    fetcher.universe.index = fetcher.universe.index - pd.DateOffset(years=3)
+    df = price_sync.load_synced_prices("2330.TW", "2020-01-01", "2020-12-31", fetcher=fetcher)
+    assert len(fetcher.calls) == 1 and not df.empty
+    assert price_sync.find_missing_ranges("2330.TW", "2020-01-01", "2020-12-31") == []
+    print("✅ 下載失敗或回傳空表的區間不記錄為已同步，下次會再補")
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q", "-s"]))
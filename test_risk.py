@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+import risk
+from risk import apply_friction_and_risk, batch_performance, calc_performance, stop_positions
+
+
+def _sample_signals(n=600, seed=11, hold=15):
+    """隨機漫步股價 + 隨機長度的持倉區段（含開頭即持倉、NaN 訊號、收盤價 0 與缺值）"""
+    rng   = np.random.default_rng(seed)
+    dates = pd.bdate_range("2020-01-02", periods=n, name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    flips = rng.random(n) < 1 / hold
+    position = (np.cumsum(flips) % 2).astype(float)
+    position[0] = 1
+    position[rng.choice(n, 20, replace=False)] = np.nan
+    close[rng.choice(n, 3, replace=False)] = 0.0
+    close[rng.choice(n, 5, replace=False)] = np.nan
+    return pd.DataFrame({"Close": close, "Position": position}, index=dates)
+
+
+_COSTS = [
+    dict(buy_fee=0.001425, sell_fee=0.001425, sell_tax=0.003),
+    dict(buy_fee=0.001, sell_fee=0.001, sell_tax=0.0),
+    dict(buy_fee=0.0, sell_fee=0.0, sell_tax=0.0),
+]
+
+
+def test_no_stop_fast_path_matches_loop():
+    for seed in range(5):
+        df = _sample_signals(seed=seed)
+        for cost in _COSTS:
+            fast = apply_friction_and_risk(df, **cost)
+            loop = apply_friction_and_risk(df, **cost, fast=False)
+            pd.testing.assert_frame_equal(fast, loop, check_exact=True)
+            assert not fast["StopTriggered"].any()
+    print("✅ 無停損停利時向量化結果與逐根迴圈完全相同")
+
+
+def test_stop_path_keeps_loop_semantics():
+    df = pd.DataFrame({
+        "Close":    [100, 100, 94, 96, 97, 112, 110, 108],
+        "Position": [0,   1,   1,  1,  1,  1,   1,   0],
+    }, index=pd.bdate_range("2024-01-01", periods=8, name="Date"))
+    out = apply_friction_and_risk(df, buy_fee=0.001, sell_fee=0.001, sell_tax=0.0,
+                                  stop_loss=0.05, take_profit=0.10)
+    # 第 2 根跌 6% 停損出場；訊號仍為 1，下一根以 96 重新進場，漲到 112 停利出場
+    assert out["Position_adj"].tolist() == [0, 1, 0, 1, 1, 0, 1, 0]
+    assert out["StopTriggered"].tolist() == [False, False, True, False, False, True, False, False]
+    assert np.isclose(out["Strategy"].iloc[1], -0.001)
+    assert np.isclose(out["Strategy"].iloc[2], -0.06 - 0.001)
+    assert np.isclose(out["Strategy"].iloc[3], -0.001)
+    assert np.isclose(out["Strategy"].iloc[5], 112 / 97 - 1 - 0.001)
+    for seed in range(3):
+        df = _sample_signals(seed=seed)
+        fast = apply_friction_and_risk(df, stop_loss=0.05, take_profit=0.08)
+        loop = apply_friction_and_risk(df, stop_loss=0.05, take_profit=0.08, fast=False)
+        pd.testing.assert_frame_equal(fast, loop, check_exact=True)
+        assert fast["StopTriggered"].any()
+    print("✅ 啟用停損停利時維持逐根迴圈語意")
+
+
+def test_stop_kernels_agree():
+    kernels = ["python", "numpy"] + (["numba"] if risk.NUMBA_AVAILABLE else [])
+    configs = [
+        dict(), dict(stop_loss=0.02), dict(take_profit=0.03),
+        dict(stop_loss=0.05, take_profit=0.08), dict(stop_loss=0.5, take_profit=0.5),
+        dict(trailing_stop=0.04), dict(atr_stop=2.0), dict(max_hold_bars=7),
+        dict(stop_loss=0.06, trailing_stop=0.03, atr_stop=1.5, max_hold_bars=30),
+    ]
+    for seed in range(6):
+        df     = _sample_signals(n=3000, seed=seed, hold=40).dropna(subset=["Close"])
+        closes = df["Close"].to_numpy()
+        signal = risk.signal_array(df["Position"].to_numpy())
+        atr    = risk.average_true_range(df, 14)
+        for cfg in configs:
+            ref_pos, ref_stop = stop_positions(closes, signal, atr=atr, **cfg, kernel="python")
+            for kernel in kernels[1:]:
+                pos, stop = stop_positions(closes, signal, atr=atr, **cfg, kernel=kernel)
+                np.testing.assert_array_equal(pos, ref_pos)
+                np.testing.assert_array_equal(stop, ref_stop)
+    print(f"✅ 出場 kernel（{' / '.join(kernels)}）結果一致")
+
+
+def test_trailing_atr_and_time_exits():
+    idx = pd.bdate_range("2024-01-01", periods=8, name="Date")
+    df  = pd.DataFrame({
+        "Close":    [100, 100, 110, 120, 115, 113, 125, 126],
+        "Position": [0,   1,   1,   1,   1,   1,   1,   1],
+    }, index=idx)
+    # 移動停損 5%：最高 120，回落到 113（-5.8%）出場，下一根重新進場
+    out = apply_friction_and_risk(df, trailing_stop=0.05)
+    assert out["Position_adj"].tolist() == [0, 1, 1, 1, 1, 0, 1, 1]
+    assert out["StopTriggered"].tolist() == [False] * 5 + [True, False, False]
+    # 時間停損 2 根：進場後第 2 根出場
+    out = apply_friction_and_risk(df, max_hold_bars=2)
+    assert out["Position_adj"].tolist() == [0, 1, 1, 0, 1, 1, 0, 1]
+    # ATR 停損：無 High / Low 時以收盤價變動計算 ATR
+    df2 = pd.DataFrame({"Close": [100, 102, 100, 102, 100, 97, 96, 95],
+                        "Position": [0, 0, 0, 1, 1, 1, 1, 1]}, index=idx)
+    atr = risk.average_true_range(df2, 3)
+    assert np.isclose(atr[3], 2.0)
+    out = apply_friction_and_risk(df2, atr_stop=1.5, atr_period=3)   # 102 - 1.5 × 2 = 99
+    assert out["Position_adj"].tolist() == [0, 0, 0, 1, 1, 0, 1, 1]
+    assert out["StopTriggered"].iloc[5]
+    print("✅ 移動停損、ATR 停損、時間停損出場位置正確")
+
+
+def test_performance_kernel_matches_pandas():
+    df = apply_friction_and_risk(_sample_signals(seed=4), stop_loss=0.05)
+    s  = df["Strategy"]
+    m  = calc_performance(df, 240)
+    cum = (1 + s).cumprod()
+    assert m["累積報酬率(%)"] == round((cum.iloc[-1] - 1) * 100, 2)
+    assert m["夏普比率"] == round(s.mean() / s.std() * 240 ** 0.5, 2)
+    assert m["最大回撤(%)"] == round(((cum - cum.cummax()) / cum.cummax()).min() * 100, 2)
+    assert m["年化波動(%)"] == round(s.std() * 240 ** 0.5 * 100, 2)
+    assert m["交易次數"] == int((df["Position_adj"].diff().abs() > 0).sum())
+    assert m["總手續費成本(%)"] == round(df["TradeCost"].sum() * 100, 4)
+
+    r = np.array([0.1, -0.05, 0.02, -0.1, 0.05])
+    stats = batch_performance(r, trading_days=5)
+    down  = np.sqrt(np.mean(np.minimum(r, 0) ** 2))
+    assert np.isclose(stats["sortino"], r.mean() / down * 5 ** 0.5)
+    equity = np.cumprod(1 + r)
+    mdd    = (equity / np.maximum.accumulate(equity) - 1).min()
+    assert np.isclose(stats["mdd"], mdd)
+    assert np.isclose(stats["calmar"], (equity[-1] - 1) / abs(mdd))   # n = trading_days → 年化即累積
+    print("✅ 績效 kernel 與 pandas 算法一致，含索提諾、卡瑪比率")
+
+
+def test_batch_performance_matches_columns():
+    rng       = np.random.default_rng(8)
+    returns   = rng.normal(0.0005, 0.02, (1500, 12))
+    positions = (rng.random((1500, 12)) < 0.5).astype(int)
+    costs     = rng.random((1500, 12)) * 0.001
+    returns[:, 3] = 0.0                               # 無波動、無回撤的組合
+    stats = batch_performance(returns, positions, costs)
+    for j in range(12):
+        single = batch_performance(returns[:, j], positions[:, j], costs[:, j])
+        for key, value in single.items():
+            assert stats[key][j] == value, (key, j)
+    assert stats["sharpe"][3] == 0 and stats["calmar"][3] == 0
+    print("✅ 矩陣版績效與逐欄計算逐位元相同")
+
+
+if __name__ == "__main__":
+    test_no_stop_fast_path_matches_loop()
+    test_stop_path_keeps_loop_semantics()
+    test_stop_kernels_agree()
+    test_trailing_atr_and_time_exits()
+    test_performance_kernel_matches_pandas()
+    test_batch_performance_matches_columns()
@@ -1,6 +1,14 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
-from strategy import apply_strategy
+from itertools import product
+from strategy import (
+    apply_strategy, build_position_array, batch_positions, _build_position, _build_position_loop,
+    register_strategy, strategies, strategy_inputs, strategy_positions, strategy_warmup,
+    supports_batch,
+)
+import tracemalloc
+import indicators
 
 def test_cross_strategy():
     df = yf.download('2330.TW', start='2022-01-01', end='2022-12-31')
@@ -26,6 +34,132 @@ def test_rsi_macd():
     assert 'Position' in df_macd.columns
     print("✅ RSI & MACD 策略測試通過")
 
+def test_vectorized_position_matches_loop():
+    rng = np.random.default_rng(42)
+    for trial in range(300):
+        n     = int(rng.integers(0, 400))
+        p_buy, p_sell = rng.uniform(0, 0.5, 2)
+        idx   = pd.bdate_range("2020-01-01", periods=n)
+        buy   = pd.Series(rng.random(n) < p_buy, index=idx)
+        sell  = pd.Series(rng.random(n) < p_sell, index=idx)
+        pd.testing.assert_series_equal(_build_position(buy, sell), _build_position_loop(buy, sell))
+
+    # 2-D：每一欄與逐欄計算相同
+    buy  = rng.random((250, 16)) < 0.1
+    sell = rng.random((250, 16)) < 0.1
+    matrix = build_position_array(buy, sell)
+    for j in range(buy.shape[1]):
+        expected = _build_position_loop(pd.Series(buy[:, j]), pd.Series(sell[:, j])).to_numpy()
+        assert np.array_equal(matrix[:, j], expected)
+    print("✅ 向量化持倉與逐根迴圈結果一致")
+
+def test_batch_positions_match_apply_strategy():
+    rng   = np.random.default_rng(7)
+    n     = 800
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    close[200:240] = close[200]          # 停牌 / 鎖漲跌停的平盤區段
+    df = pd.DataFrame({"Open": close, "High": close * 1.02, "Low": close * 0.98, "Close": close},
+                      index=pd.bdate_range("2019-01-01", periods=n, name="Date"))
+    grids = {
+        "簡單均線交叉":      {"短期均線": [5, 10, 20], "長期均線": [20, 60]},
+        "反轉策略":          {"觀察天數": [2, 5], "跌幅閾值（％）": [2.0, 5.0]},
+        "突破策略":          {"突破天數": [10, 20, n]},              # n 天：資料不足，無效組合
+        "RSI 策略":          {"RSI 期間": [7, 14], "買入閾值": [20, 30], "賣出閾值": [70]},
+        "MACD 策略":         {"短期 EMA": [8, 12], "長期 EMA": [26], "訊號線": [5, 9]},
+        "布林通道策略":      {"期間": [10, 20], "標準差倍數": [1.5, 2.0]},
+        "黃金交叉 EMA 策略": {"短期 EMA": [5, 12], "長期 EMA": [26, 50]},
+        "唐奇安通道策略":    {"期間": [10, 55]},
+    }
+    for name, grid in grids.items():
+        combos = [dict(zip(grid, values)) for values in product(*grid.values())]
+        positions, valid = batch_positions(df, name, combos)
+        assert positions.shape == (n, len(combos))
+        for j, params in enumerate(combos):
+            try:
+                expected = apply_strategy(df, name, params)["Position"].to_numpy()
+            except ValueError:
+                assert not valid[j]
+                continue
+            assert valid[j] and np.array_equal(positions[:, j], expected), (name, params)
+    print("✅ 批次持倉矩陣與逐組 apply_strategy 一致")
+
+def test_strategy_registry():
+    import crypto_strategy  # noqa: F401  註冊虛擬幣策略
+
+    def gap_signals(data, params):
+        ret = data['Close'].pct_change()
+        return ret > params["門檻"], ret < -params["門檻"], {"Gap": ret}
+
+    register_strategy("測試跳空策略", gap_signals, warmup=lambda p: 1,
+                      description="測試用", parameters={"門檻": 0.01})
+    try:
+        rng   = np.random.default_rng(11)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 300)))
+        df = pd.DataFrame({"Open": close, "High": close * 1.02, "Low": close * 0.98,
+                           "Close": close, "Volume": rng.uniform(1, 10, 300)},
+                          index=pd.date_range("2023-01-01", periods=300, name="Date"))
+
+        out = apply_strategy(df, "測試跳空策略", {"門檻": 0.01})
+        assert list(out.columns[-2:]) == ["Gap", "Position"]
+        assert strategy_warmup("測試跳空策略", {"門檻": 0.01}) == 1
+        assert not supports_batch("測試跳空策略") and supports_batch("RSI 策略")
+        assert strategy_inputs("唐奇安通道策略") == ("High", "Low", "Close")
+
+        # 沒有批次版本的策略（含虛擬幣策略）由 batch_positions 逐組計算
+        for name, combos in [("測試跳空策略", [{"門檻": 0.01}, {"門檻": 0.03}]),
+                             ("Supertrend 策略", [{"ATR 週期": 10, "ATR 倍數": 3.0},
+                                                  {"ATR 週期": 7, "ATR 倍數": 1.5}]),
+                             ("VWAP 均值回歸策略", [{"VWAP 週期": 5}, {"VWAP 週期": 20}])]:
+            positions, valid = batch_positions(df, name, combos)
+            for j, params in enumerate(combos):
+                expected = apply_strategy(df, name, params)["Position"].to_numpy()
+                assert valid[j] and np.array_equal(positions[:, j], expected)
+    finally:
+        strategies.pop("測試跳空策略", None)
+
+    try:
+        apply_strategy(df, "不存在的策略", {})
+        raise AssertionError("未知策略應拋出 ValueError")
+    except ValueError:
+        pass
+    print("✅ 策略註冊表：自訂 / 虛擬幣策略可套用並批次計算")
+
+def test_lean_mode_matches_and_allocates_less():
+    n     = 50_000
+    rng   = np.random.default_rng(3)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    df = pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                       "Adj Close": close, "Volume": rng.uniform(1, 10, n), "stock_code": "TEST"},
+                      index=pd.bdate_range("1900-01-01", periods=n, name="Date"))
+    params = {"期間": 20, "標準差倍數": 2.0}
+
+    def measure(fn):
+        indicators.clear()
+        tracemalloc.start()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, peak
+
+    full, full_peak = measure(lambda: apply_strategy(df, "布林通道策略", params))
+    (pos, ind), lean_peak = measure(
+        lambda: strategy_positions(df, "布林通道策略", params, with_indicators=True))
+    (pos_np, _), np_peak = measure(
+        lambda: strategy_positions({"Close": close}, "布林通道策略", params))
+    indicators.clear()
+
+    assert np.array_equal(pos, full["Position"].to_numpy())
+    assert np.array_equal(pos_np, pos)
+    for col in ["MA", "STD", "Upper", "Lower"]:
+        assert np.allclose(ind[col], full[col].to_numpy(), equal_nan=True)
+    assert lean_peak < 0.75 * full_peak, (lean_peak, full_peak)
+    assert np_peak < 0.75 * full_peak, (np_peak, full_peak)
+    print(f"✅ 精簡模式持倉一致，峰值記憶體 {full_peak // 1024} KB → {lean_peak // 1024} KB")
+
 if __name__ == "__main__":
     test_cross_strategy()
     test_breakout_strategy()
+    test_vectorized_position_matches_loop()
+    test_batch_positions_match_apply_strategy()
+    test_strategy_registry()
+    test_lean_mode_matches_and_allocates_less()
@@ -91,6 +91,38 @@ def get_ohlcv(exchange, symbol, freq, lookback):
     df.set_index("Date", inplace=True)
     return df
 
+def wma(series, n, block=1024):
+    """
+    線性加權移動平均（權重 1..n，最新一根最大），O(bars)：
+      Σ_{k<n} (n-k)·x[t-k] = n·C[t] − Σ_{j=t-n}^{t-1} C[j]，C 為累加和，第二項再以累加和相減取得
+    與 series.rolling(n).apply(lambda x: (x * w).sum() / w.sum(), raw=True) 在浮點誤差內相同：
+    前 n-1 根與視窗內含 NaN 時為 NaN。累加和每 block 根重新起算並先減去區段平均，長序列的誤差不會累積。
+    """
+    n      = max(int(n), 1)
+    values = np.asarray(series, dtype=np.float64)
+    out    = np.full(values.shape, np.nan)
+    nan    = np.isnan(values)
+    filled = np.where(nan, 0.0, values)
+    bad    = np.concatenate(([0], np.cumsum(nan)))
+    for start in range(n - 1, len(values), block):
+        stop = min(start + block, len(values))
+        seg  = filled[start - n + 1:stop]                     # 多取前 n-1 根作為第一個視窗
+        ref  = seg.mean()                                     # 權重和為 1，先減去再加回以縮小累加和
+        c    = np.concatenate(([0.0], np.cumsum(seg - ref)))  # c[i] = seg[:i] 的和
+        d    = np.concatenate(([0.0], np.cumsum(c)))          # d[i] = c[:i] 的和
+        end  = np.arange(n, len(seg) + 1)                     # 視窗 seg[end-n:end]
+        out[start:stop] = (n * c[end] - (d[end] - d[end - n])) / (n * (n + 1) / 2) + ref
+    idx = np.arange(n - 1, len(values))
+    out[idx[bad[idx + 1] - bad[idx + 1 - n] > 0]] = np.nan
+    if isinstance(series, pd.Series):
+        return pd.Series(out, index=series.index)
+    return out
+
+def hull_moving_average(series, n):
+    """Hull 移動平均：WMA(2·WMA(n/2) − WMA(n), √n)，n < 2 時半週期、√n 週期至少 1"""
+    half = max(int(n / 2), 1)
+    return wma(2 * wma(series, half) - wma(series, n), max(int(n ** 0.5), 1))
+
 def get_signal(df, p):
     """回傳 is_bullish: True=看多, False=看空"""
     close  = df["Close"]
@@ -99,13 +131,10 @@ def get_signal(df, p):
     volume = df["Volume"]
     is_bullish = False
     n1, n2 = int(p.get("n1", 30)), int(p.get("n2", 130))
-    def wma(s, n):
-        w = pd.Series(range(1, n+1))
-        return s.rolling(n).apply(lambda x: (x*w).sum()/w.sum(), raw=True)
-    def hma(s, n):
-        h = int(n/2)
-        return wma(2*wma(s, h) - wma(s, n), int(n**0.5))
-    t1, t2 = hma(close, n1), hma(close, n2)
+    if p.get("type", "sma") == "hull":
+        t1, t2 = hull_moving_average(close, n1), hull_moving_average(close, n2)
+    else:
+        t1, t2 = close.rolling(n1).mean(), close.rolling(n2).mean()
     is_bullish = bool(t1.iloc[-1] > t2.iloc[-1])
     return is_bullish
 